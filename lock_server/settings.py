@@ -51,13 +51,76 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.getenv('DB_FILE', os.path.join(BASE_DIR, 'test_database.db')),
+# Профиль хранилища: sqlite (по умолчанию) или postgresql
+DB_ENGINE = os.getenv('DB_ENGINE', 'sqlite')
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'lock_server'),
+            'USER': os.getenv('DB_USER', 'lock_server'),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': os.getenv('DB_HOST', '127.0.0.1'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            # Постоянные соединения потоков и воркеров вместо подключения на запрос
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DB_FILE', os.path.join(BASE_DIR, 'test_database.db')),
+            'OPTIONS': {
+                'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', 5)),
+            },
+        }
+    }
+
+# PRAGMA при каждом подключении к SQLite (locks.db.configure_sqlite)
+LOCK_SQLITE_PRAGMAS = {
+    'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(float(os.getenv('SQLITE_BUSY_TIMEOUT', 5)) * 1000),  # мс
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
 }
 
+# TCP сервер замков
+LOCK_COMMAND_TIMEOUT = float(os.getenv('COMMAND_TIMEOUT', 5))  # ожидание ответа платы, сек
+LOCK_COMMAND_RETRIES = int(os.getenv('COMMAND_RETRIES', 1))  # повторные отправки при таймауте
+LOCK_COMMAND_SOCKET = os.getenv('COMMAND_SOCKET', os.path.join(BASE_DIR, 'lock_server.sock'))
+LOCK_COMMAND_POOL_SIZE = int(os.getenv('COMMAND_POOL_SIZE', 4))  # соединений шины на веб-процесс
+LOCK_HEARTBEAT_FLUSH_INTERVAL = float(os.getenv('HEARTBEAT_FLUSH_INTERVAL', 10))  # запись heartbeat в БД, сек
+LOCK_STATUS_FLUSH_INTERVAL = float(os.getenv('STATUS_FLUSH_INTERVAL', 0.5))  # окно объединения статусов, сек
+LOCK_STATUS_BATCH_SIZE = int(os.getenv('STATUS_BATCH_SIZE', 1000))  # досрочная запись при таком числе замков
+LOCK_OUTBOUND_MAX_BYTES = int(os.getenv('OUTBOUND_MAX_BYTES', 16384))  # очередь отправки на плату
+LOCK_OUTBOUND_MAX_FRAMES = int(os.getenv('OUTBOUND_MAX_FRAMES', 256))
+LOCK_OUTBOUND_POLICY = os.getenv('OUTBOUND_POLICY', 'drop_oldest_ack')  # reject | drop_oldest_ack
+LOCK_HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', 300))  # закрытие молчащих соединений, сек
+LOCK_WATCHDOG_TICK = float(os.getenv('WATCHDOG_TICK', 1))
+LOCK_BULK_CONCURRENCY = int(os.getenv('BULK_CONCURRENCY', 20))  # одновременных команд в пакетном запросе
+LOCK_BULK_MAX_CONCURRENCY = int(os.getenv('BULK_MAX_CONCURRENCY', 200))
+LOCK_BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', 5000))
+LOCK_STATISTICS_CACHE_TTL = float(os.getenv('STATISTICS_CACHE_TTL', 2))  # кэш /api/statistics/, сек
+LOCK_STATUS_READ_TTL = float(os.getenv('STATUS_READ_TTL', 1))  # повторное использование read-all-status, сек
+LOCK_DB_WORKERS = int(os.getenv('DB_WORKERS', 4 if DB_ENGINE == 'postgresql' else 1))  # потоков БД TCP сервера
+LOCK_DB_QUEUE_LIMIT = int(os.getenv('DB_QUEUE_LIMIT', 500))  # запросов в очереди одной полосы
+LOCK_DB_SHED_DEPTH = int(os.getenv('DB_SHED_DEPTH', 50))  # очередь регистраций, при которой откладывается запись статусов
+LOCK_REGISTRATION_RATE = float(os.getenv('REGISTRATION_RATE', 200))  # допуск новых плат в секунду
+LOCK_REGISTRATION_BURST = int(os.getenv('REGISTRATION_BURST', 500))
+LOCK_REGISTRATION_BATCH_SIZE = int(os.getenv('REGISTRATION_BATCH_SIZE', 200))  # досрочная запись пачки регистраций
+LOCK_REGISTRATION_FLUSH_INTERVAL = float(os.getenv('REGISTRATION_FLUSH_INTERVAL', 0.05))  # окно пачки, сек
+LOCK_AUDIT_SPOOL_DIR = os.getenv('AUDIT_SPOOL_DIR', os.path.join(BASE_DIR, 'audit_spool'))  # журнал до записи в БД
+LOCK_AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 200))  # досрочная запись журнала операций
+LOCK_AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 0.5))  # сек
+LOCK_OPERATION_RETENTION_DAYS = int(os.getenv('OPERATION_RETENTION_DAYS', 90))  # журнал старше - в архив
+LOCK_OPERATION_ARCHIVE_DIR = os.getenv('OPERATION_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+LOCK_EVENT_HISTORY = int(os.getenv('EVENT_HISTORY', 10000))  # событий для продолжения после переподключения
+LOCK_EVENT_SUBSCRIBER_BUFFER = int(os.getenv('EVENT_SUBSCRIBER_BUFFER', 1000))  # отключение медленного подписчика
+LOCK_EVENT_KEEPALIVE = float(os.getenv('EVENT_KEEPALIVE', 15))  # комментарий-пинг в потоке событий, сек
+LOCK_EVENT_STREAM_TIMEOUT = float(os.getenv('EVENT_STREAM_TIMEOUT', 300))  # клиент переподключается с Last-Event-ID
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import LockBoard, Lock, LockOperation
+from .models import LockBoard, Lock, LockOperation, OperationCounter, DailyOperationSummary
 
 @admin.register(LockBoard)
 class LockBoardAdmin(admin.ModelAdmin):
@@ -18,4 +18,17 @@ class LockAdmin(admin.ModelAdmin):
 class LockOperationAdmin(admin.ModelAdmin):
     list_display = ['board', 'operation_type', 'channels', 'success', 'created_at']
     list_filter = ['operation_type', 'success', 'created_at']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+
+@admin.register(OperationCounter)
+class OperationCounterAdmin(admin.ModelAdmin):
+    list_display = ['name', 'value']
+    readonly_fields = ['name', 'value']
+
+
+@admin.register(DailyOperationSummary)
+class DailyOperationSummaryAdmin(admin.ModelAdmin):
+    list_display = ['board', 'date', 'operation_type', 'total', 'success']
+    list_filter = ['operation_type', 'date']
+    readonly_fields = ['board', 'date', 'operation_type', 'total', 'success']
@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_delete
 
 class LocksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'locks'
\ No newline at end of file
+    name = 'locks'
+
+    def ready(self):
+        from .counters import discount_board_operations
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite, dispatch_uid='locks.configure_sqlite')
+        pre_delete.connect(discount_board_operations, sender='locks.LockBoard',
+                           dispatch_uid='locks.discount_board_operations')
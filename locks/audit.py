@@ -0,0 +1,231 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+from .counters import count_operations
+from .models import LockBoard, LockOperation
+
+logger = logging.getLogger(__name__)
+
+
+class AuditWriter:
+    """Фоновая запись журнала операций пачками
+
+    Запись операции - это добавление строки в локальный spool-файл и в
+    очередь в памяти, без транзакции БД на пути запроса. Фоновый поток
+    пишет очередь одним bulk_create по размеру или по времени и
+    увеличивает счётчики один раз на пачку.
+
+    Spool-файл процесса заблокирован flock, пока процесс жив. При запуске
+    записи из spool-файлов завершившихся процессов дописываются в БД,
+    поэтому при падении операции не теряются (возможен повтор пачки,
+    записанной непосредственно перед падением). Сегмент сбрасывается на
+    диск (fsync) при ротации и при завершении процесса, а до этого строки
+    лежат в кэше ОС: падение процесса они переживают, отключение питания -
+    нет, так что теряются операции не старше flush_interval.
+
+    Работает в отдельном потоке, а не в цикле событий: под WSGI
+    асинхронные представления выполняются в короткоживущих циклах.
+    """
+
+    def __init__(self, spool_dir: str = None, batch_size: int = None, flush_interval: float = None):
+        self.spool_dir = spool_dir or settings.LOCK_AUDIT_SPOOL_DIR
+        self.batch_size = batch_size or settings.LOCK_AUDIT_BATCH_SIZE
+        self.flush_interval = flush_interval or settings.LOCK_AUDIT_FLUSH_INTERVAL
+        self.pending = []  # записи текущего сегмента spool
+        self.segments = []  # (файл, путь, записи) сегментов, ожидающих записи в БД
+        self.spool = None
+        self.spool_path = None
+        self.segment_number = 0
+        self.pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+        # Статистика
+        self.received = 0
+        self.written = 0
+        self.replayed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    @staticmethod
+    def to_record(operation: LockOperation) -> dict:
+        return {
+            'board_id': operation.board_id,
+            'operation_type': operation.operation_type,
+            'channels': operation.channels,
+            'order_number': operation.order_number,
+            'success': operation.success,
+            'error_message': operation.error_message,
+            'created_at': operation.created_at.isoformat(),
+        }
+
+    @staticmethod
+    def from_record(record: dict) -> LockOperation:
+        return LockOperation(**{**record, 'created_at': parse_datetime(record['created_at'])})
+
+    def _open_segment(self):
+        """Новый spool-файл процесса, заблокированный до записи его операций в БД"""
+        self.segment_number += 1
+        self.spool_path = os.path.join(self.spool_dir, f"audit-{self.pid}-{self.segment_number}.jsonl")
+        self.spool = open(self.spool_path, 'a', encoding='utf-8')
+        fcntl.flock(self.spool, fcntl.LOCK_EX)
+
+    def _ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        # Первый вызов в процессе (или после fork) - свой spool и свой поток
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.pid = os.getpid()
+        self.pending = []
+        self.segments = []
+        self._open_segment()
+        self._thread = threading.Thread(target=self.run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, operations: list):
+        """Постановка операций в журнал (без обращения к БД)"""
+        records = [self.to_record(operation) for operation in operations]
+        with self._lock:
+            self._ensure_started()
+            self.spool.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records))
+            self.spool.flush()
+            self.pending.extend(records)
+            self.received += len(records)
+            if len(self.pending) >= self.batch_size:
+                self._wakeup.set()
+
+    def _rotate(self):
+        """Текущий сегмент уходит на запись, новые операции пишутся в следующий"""
+        with self._lock:
+            if self.pending:
+                # Сегмент уходит в БД не сразу - до этого он должен пережить и отключение питания
+                os.fsync(self.spool.fileno())
+                self.segments.append((self.spool, self.spool_path, self.pending))
+                self.pending = []
+                self._open_segment()
+
+    @staticmethod
+    def write(records: list):
+        operations = [AuditWriter.from_record(record) for record in records]
+        # Операции удалённых плат не запишутся по внешнему ключу и заблокируют очередь
+        boards = set(LockBoard.objects.filter(
+            pk__in={operation.board_id for operation in operations}
+        ).values_list('pk', flat=True))
+        if len(boards) < len({operation.board_id for operation in operations}):
+            dropped = [operation for operation in operations if operation.board_id not in boards]
+            logger.warning(f"Пропущено {len(dropped)} операций удалённых плат")
+            operations = [operation for operation in operations if operation.board_id in boards]
+        success = sum(operation.success for operation in operations)
+        with transaction.atomic():
+            LockOperation.objects.bulk_create(operations, batch_size=500)
+            count_operations(success, len(operations) - success)
+
+    def flush(self):
+        with self._flush_lock:
+            self._rotate()
+            while self.segments:
+                spool, path, records = self.segments[0]
+                try:
+                    self.write(records)
+                except Exception as e:
+                    self.failed_flushes += 1
+                    logger.error(f"Ошибка при записи {len(records)} операций в журнал: {e}")
+                    return
+                self.segments.pop(0)
+                os.unlink(path)
+                spool.close()
+                self.written += len(records)
+                self.flushes += 1
+
+    @staticmethod
+    def owner_alive(path: str) -> bool:
+        try:
+            pid = int(os.path.basename(path).split('-')[1])
+            os.kill(pid, 0)
+        except (IndexError, ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def replay(self):
+        """Запись операций из spool-файлов завершившихся процессов"""
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, 'audit-*.jsonl'))):
+            # Проверка pid закрывает окно между созданием файла владельцем и его flock
+            if self.owner_alive(path):
+                continue
+            try:
+                spool = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            with spool:
+                try:
+                    fcntl.flock(spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # процесс-владелец ещё работает
+                # Последняя строка могла быть записана не полностью
+                records = []
+                for line in spool:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        logger.warning(f"Пропущена повреждённая строка журнала в {path}")
+                if records:
+                    self.write(records)
+                    self.replayed += len(records)
+                    logger.info(f"Восстановлено {len(records)} операций из {path}")
+                os.unlink(path)
+
+    def run(self):
+        close_old_connections()
+        try:
+            self.replay()
+        except Exception as e:
+            logger.error(f"Ошибка при восстановлении журнала операций: {e}")
+
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def close(self):
+        """Запись оставшихся операций при завершении процесса"""
+        if self.pid != os.getpid():
+            return
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Ошибка при записи журнала операций при завершении: {e}")
+        with self._flush_lock, self._lock:
+            if self.pending or self.segments:
+                # Не записанные операции остаются в spool до replay(), сегменты очереди уже на диске
+                os.fsync(self.spool.fileno())
+                return
+            # Пустой текущий сегмент не нужен; операции после close() откроют новый
+            os.unlink(self.spool_path)
+            self.spool.close()
+            self.pid = None
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self.pending) + sum(len(segment[2]) for segment in self.segments),
+            'received': self.received,
+            'written': self.written,
+            'replayed': self.replayed,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+        }
+
+
+audit_log = AuditWriter()
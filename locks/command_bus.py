@@ -0,0 +1,362 @@
+import asyncio
+import errno
+import itertools
+import json
+import logging
+import os
+import struct
+import threading
+import weakref
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Операции шины
+OP_COMMAND = 0x01
+OP_INVALIDATE_BOARD = 0x02
+OP_CLAIM_BOARD = 0x03  # рабочий процесс -> супервизор: плата подключена ко мне
+OP_RELEASE_BOARD = 0x04  # рабочий процесс -> супервизор: плата отключилась
+OP_STATS = 0x05  # счётчики плат и замков из реестра (схема /api/statistics/)
+OP_SUBSCRIBE = 0x06  # поток событий на отдельном соединении, ответы с одним request_id
+OP_CONNECTIONS = 0x07  # открытые соединения плат, запрос и ответ в JSON
+OP_DIAGNOSTICS = 0x08  # внутренние метрики TCP сервера (очереди, БД), ответ в JSON
+OP_BOARD_STATES = 0x09  # замки и открытые замки каждой платы реестра рабочего процесса, ответ в JSON
+
+# request_id, op, device_id, cmd, timeout_ms, data_len
+REQUEST_HEADER = struct.Struct('!IB8sBHH')
+# request_id, success, has_status, status, attempts, latency, data_len, error_len
+# data_len 32-битный: список соединений (OP_CONNECTIONS) бывает больше 64 КБ
+RESPONSE_HEADER = struct.Struct('!IBBBBfIH')
+
+
+def encode_request(request_id: int, op: int, device_id: str, cmd: int = 0, data: bytes = b'',
+                   timeout: float = None) -> bytes:
+    timeout_ms = min(int(timeout * 1000), 0xFFFF) if timeout else 0
+    return REQUEST_HEADER.pack(
+        request_id, op, device_id.encode('ascii', errors='ignore'), cmd, timeout_ms, len(data)
+    ) + data
+
+
+def encode_response(request_id: int, result: dict) -> bytes:
+    data = bytes(result.get('data') or b'')
+    error = (result.get('error') or '').encode('utf-8')[:0xFFFF]
+    status = result.get('status')
+    latency = result.get('latency')
+    return RESPONSE_HEADER.pack(
+        request_id,
+        1 if result.get('success') else 0,
+        0 if status is None else 1,
+        status or 0,
+        min(result.get('attempts') or 0, 0xFF),
+        -1.0 if latency is None else latency,
+        len(data),
+        len(error)
+    ) + data + error
+
+
+def error_result(error: str) -> dict:
+    return {'success': False, 'status': None, 'data': b'', 'latency': None, 'attempts': 0, 'error': error}
+
+
+def ok_result(**fields) -> dict:
+    """Успешный результат операции шины, fields заменяют поля по умолчанию"""
+    return {'success': True, 'status': None, 'data': b'', 'latency': None, 'attempts': 0, 'error': '', **fields}
+
+
+class CommandBusServer:
+    """Сервер шины команд на Unix сокете в процессе TCP сервера
+
+    Запросы одного соединения обрабатываются конкурентно, ответы
+    отправляются по мере готовности с исходным request_id.
+    """
+
+    def __init__(self, handler, path: str = None):
+        self.handler = handler  # объект с async handle_bus_request(op, device_id, cmd, data, timeout)
+        self.path = path or settings.LOCK_COMMAND_SOCKET
+        self.server = None
+        self.connections = set()  # writer открытых соединений, закрываются при остановке
+
+    async def start(self):
+        if os.path.exists(self.path):
+            if await self.is_listening():
+                raise OSError(errno.EADDRINUSE, f'Шина команд {self.path} уже используется другим процессом')
+            # Сокет остался от аварийно завершившегося процесса
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self.handle_connection, self.path)
+        logger.info(f"Шина команд слушает {self.path}")
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            # wait_closed() ждёт отключения всех клиентов, в том числе подписчиков событий
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    async def is_listening(self) -> bool:
+        """Есть ли процесс, принимающий соединения на сокете"""
+        try:
+            _, writer = await asyncio.open_unix_connection(self.path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            return False
+        writer.close()
+        return True
+
+    async def handle_connection(self, reader, writer):
+        tasks = set()
+        self.connections.add(writer)
+        try:
+            while True:
+                header = await reader.readexactly(REQUEST_HEADER.size)
+                request_id, op, device_id, cmd, timeout_ms, data_len = REQUEST_HEADER.unpack(header)
+                data = await reader.readexactly(data_len) if data_len else b''
+
+                task = asyncio.create_task(self.process_request(
+                    writer, request_id, op,
+                    device_id.rstrip(b'\x00').decode('ascii', errors='ignore'),
+                    cmd, data, timeout_ms / 1000 if timeout_ms else None
+                ))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.connections.discard(writer)
+            writer.close()
+
+    async def process_request(self, writer, request_id, op, device_id, cmd, data, timeout):
+        if op == OP_SUBSCRIBE:
+            await self.stream_events(writer, request_id, data)
+            return
+
+        try:
+            result = await self.handler.handle_bus_request(op, device_id, cmd, data, timeout)
+        except Exception as e:
+            logger.error(f"Ошибка обработки запроса шины 0x{op:02X} для {device_id}: {e}")
+            result = error_result(str(e))
+
+        if not writer.is_closing():
+            writer.write(encode_response(request_id, result))
+
+    async def stream_events(self, writer, request_id, data):
+        """Отправка событий подписчику, пока он читает поток
+
+        Если клиент не успевает читать, drain() блокируется, буфер подписки
+        переполняется и подписка закрывается событием dropped.
+        """
+        filters = json.loads(data) if data else {}
+        subscription = self.handler.events.subscribe(
+            filters.get('boards'), filters.get('channels'), filters.get('since'), filters.get('epoch')
+        )
+        try:
+            async for event in subscription:
+                payload = json.dumps(event, ensure_ascii=False).encode()
+                writer.write(encode_response(request_id, ok_result(data=payload)))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            subscription.close()
+        if not writer.is_closing():
+            writer.write(encode_response(request_id, error_result('Подписка закрыта')))
+
+
+class BusConnection:
+    """Одно соединение клиента шины с конвейерной отправкой запросов"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}  # request_id -> future
+        self.reader_task = asyncio.create_task(self.read_responses())
+
+    @property
+    def closed(self) -> bool:
+        return self.reader_task.done() or self.writer.is_closing()
+
+    async def read_responses(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(RESPONSE_HEADER.size)
+                (request_id, success, has_status, status, attempts,
+                 latency, data_len, error_len) = RESPONSE_HEADER.unpack(header)
+                payload = await self.reader.readexactly(data_len + error_len)
+
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                future.set_result({
+                    'success': bool(success),
+                    'status': status if has_status else None,
+                    'data': payload[:data_len],
+                    'latency': latency if latency >= 0 else None,
+                    'attempts': attempts,
+                    'error': payload[data_len:].decode('utf-8', errors='replace'),
+                })
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self.fail(ConnectionResetError(f'Шина команд закрыла соединение: {e}'))
+        except asyncio.CancelledError:
+            self.fail(ConnectionResetError('Соединение шины закрыто'))
+        finally:
+            self.writer.close()
+
+    def fail(self, exc: Exception):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+
+    def send(self, request_id: int, frame: bytes) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.writer.write(frame)
+        return future
+
+    def close(self):
+        self.reader_task.cancel()
+
+
+class BusPool:
+    """Соединения клиента шины в одном цикле событий"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.connections = []
+        self.connecting = None  # future открытия нового соединения
+
+    def close(self):
+        connections, self.connections = self.connections, []
+        for connection in connections:
+            if self.loop.is_closed():
+                # Задачи закрытого цикла отменены при его остановке, сокеты уже закрыты
+                continue
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is self.loop:
+                connection.close()
+            else:
+                self.loop.call_soon_threadsafe(connection.close)
+
+
+class CommandBusClient:
+    """Клиент шины команд с пулом соединений для веб-процессов
+
+    Соединения привязаны к циклу событий, в котором созданы, а веб-запросы
+    выполняются в разных потоках и циклах (async_to_sync), поэтому у каждого
+    цикла свой пул. Пулы закрытых циклов удаляются при обращении из нового
+    цикла, остальные живут, пока жив их цикл.
+    """
+
+    def __init__(self, path: str = None, pool_size: int = None):
+        self.path = path
+        self.pool_size = pool_size
+        self.pools = weakref.WeakKeyDictionary()  # цикл событий -> BusPool
+        self.lock = threading.Lock()  # пулы создаются и удаляются из разных потоков
+        self.request_ids = itertools.count(1)
+
+    def get_pool(self, loop) -> BusPool:
+        with self.lock:
+            pool = self.pools.get(loop)
+            if pool is not None:
+                return pool
+            stale = [other for other in list(self.pools.values()) if other.loop.is_closed()]
+            for other in stale:
+                del self.pools[other.loop]
+            pool = self.pools[loop] = BusPool(loop)
+        for other in stale:
+            other.close()
+        return pool
+
+    async def _open_connection(self) -> BusConnection:
+        reader, writer = await asyncio.open_unix_connection(self.path or settings.LOCK_COMMAND_SOCKET)
+        return BusConnection(reader, writer)
+
+    async def get_connection(self) -> BusConnection:
+        pool = self.get_pool(asyncio.get_running_loop())
+        pool.connections = [conn for conn in pool.connections if not conn.closed]
+        pool_size = self.pool_size or settings.LOCK_COMMAND_POOL_SIZE
+
+        if pool.connections:
+            connection = min(pool.connections, key=lambda conn: len(conn.pending))
+            if not connection.pending or len(pool.connections) >= pool_size:
+                return connection
+
+        # Открываем не более одного нового соединения одновременно
+        if pool.connecting is None:
+            pool.connecting = asyncio.ensure_future(self._open_connection())
+        connecting = pool.connecting
+        try:
+            connection = await asyncio.shield(connecting)
+        finally:
+            if pool.connecting is connecting:
+                pool.connecting = None
+        if connection not in pool.connections:
+            pool.connections.append(connection)
+        return connection
+
+    async def request(self, op: int, device_id: str, cmd: int = 0, data: bytes = b'',
+                      timeout: float = None) -> dict:
+        command_timeout = timeout or settings.LOCK_COMMAND_TIMEOUT
+        wait_timeout = command_timeout * (settings.LOCK_COMMAND_RETRIES + 1) + 1
+
+        try:
+            connection = await self.get_connection()
+        except OSError as e:
+            logger.error(f"Шина команд недоступна: {e}")
+            return error_result('TCP сервер недоступен')
+
+        request_id = next(self.request_ids) & 0xFFFFFFFF
+        future = connection.send(request_id, encode_request(request_id, op, device_id, cmd, data, timeout))
+        try:
+            return await asyncio.wait_for(future, wait_timeout)
+        except asyncio.TimeoutError:
+            return error_result('TCP сервер не ответил')
+        except ConnectionResetError as e:
+            return error_result(str(e))
+        finally:
+            connection.pending.pop(request_id, None)
+
+    async def send_command(self, device_id: str, cmd: int, data: bytes = b'', timeout: float = None) -> dict:
+        return await self.request(OP_COMMAND, device_id, cmd, data, timeout)
+
+    async def subscribe(self, boards=None, channels=None, since: int = None, epoch: str = None):
+        """Поток событий TCP сервера на отдельном соединении шины
+
+        Асинхронный генератор словарей событий. OSError, если шина
+        недоступна, ConnectionResetError, если сервер закрыл поток.
+        """
+        reader, writer = await asyncio.open_unix_connection(self.path or settings.LOCK_COMMAND_SOCKET)
+        try:
+            filters = json.dumps({'boards': boards, 'channels': channels, 'since': since, 'epoch': epoch}).encode()
+            writer.write(encode_request(0, OP_SUBSCRIBE, '', data=filters))
+            while True:
+                header = await reader.readexactly(RESPONSE_HEADER.size)
+                _, success, _, _, _, _, data_len, error_len = RESPONSE_HEADER.unpack(header)
+                payload = await reader.readexactly(data_len + error_len)
+                if not success:
+                    raise ConnectionResetError(payload[data_len:].decode('utf-8', errors='replace'))
+                yield json.loads(payload[:data_len])
+        except asyncio.IncompleteReadError:
+            raise ConnectionResetError('Шина команд закрыла соединение')
+        finally:
+            writer.close()
+
+    def close(self):
+        with self.lock:
+            pools = list(self.pools.values())
+            self.pools.clear()
+        for pool in pools:
+            pool.close()
+
+
+command_bus = CommandBusClient()
@@ -0,0 +1,63 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from .models import DailyOperationSummary, LockOperation, OperationCounter
+
+# Общее количество операций - сумма успешных и неудачных
+OPERATIONS_SUCCESS = 'operations_success'
+OPERATIONS_FAILED = 'operations_failed'
+
+
+def count_operations(success: int = 0, failed: int = 0):
+    """Увеличение счётчиков операций одним UPDATE"""
+    if not success and not failed:
+        return
+    with transaction.atomic():
+        updated = OperationCounter.objects.filter(name__in=[OPERATIONS_SUCCESS, OPERATIONS_FAILED]).update(
+            value=F('value') + Case(
+                When(name=OPERATIONS_SUCCESS, then=Value(success)),
+                default=Value(failed)
+            )
+        )
+        if updated == 2:
+            return
+        # Недостающие счётчики создаются сразу с нужным значением
+        existing = set(OperationCounter.objects.filter(
+            name__in=[OPERATIONS_SUCCESS, OPERATIONS_FAILED]
+        ).values_list('name', flat=True))
+        for name, value in ((OPERATIONS_SUCCESS, success), (OPERATIONS_FAILED, failed)):
+            if name in existing:
+                continue
+            counter, created = OperationCounter.objects.get_or_create(name=name, defaults={'value': value})
+            if not created:
+                # Счётчик создан параллельной операцией уже после нашего UPDATE
+                OperationCounter.objects.filter(pk=counter.pk).update(value=F('value') + value)
+
+
+def operation_totals() -> dict:
+    values = dict(OperationCounter.objects.filter(
+        name__in=[OPERATIONS_SUCCESS, OPERATIONS_FAILED]
+    ).values_list('name', 'value'))
+    success = values.get(OPERATIONS_SUCCESS, 0)
+    failed = values.get(OPERATIONS_FAILED, 0)
+    return {
+        'total': success + failed,
+        'success': success,
+        'failed': failed
+    }
+
+
+def discount_board_operations(sender, instance, **kwargs):
+    """Вычитание из счётчиков операций удаляемой платы (pre_delete LockBoard)
+
+    Журнал и суточные сводки платы удаляются каскадно, без сигналов на
+    каждую строку. Выполняется в транзакции удаления, до самого удаления.
+    """
+    operations = LockOperation.objects.filter(board=instance).aggregate(
+        total=Count('id'), success=Count('id', filter=Q(success=True))
+    )
+    summaries = DailyOperationSummary.objects.filter(board=instance).aggregate(
+        total=Sum('total'), success=Sum('success')
+    )
+    success = operations['success'] + (summaries['success'] or 0)
+    total = operations['total'] + (summaries['total'] or 0)
+    count_operations(-success, -(total - success))
@@ -0,0 +1,177 @@
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """PRAGMA из LOCK_SQLITE_PRAGMAS для каждого нового подключения к SQLite
+
+    WAL позволяет читать во время записи, synchronous=NORMAL в WAL не
+    теряет целостность при падении процесса, busy_timeout ждёт освобождения
+    блокировки вместо немедленного "database is locked".
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.LOCK_SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+class DBOverloaded(Exception):
+    """Запрос к БД не принят: очередь полосы переполнена"""
+
+
+class LaneStats:
+    """Счётчики одной полосы приоритета"""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.depth = 0  # в очереди и выполняется
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.last_wait = 0.0
+        self.max_wait = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'depth': self.depth,
+            'limit': self.limit,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'last_wait_ms': round(self.last_wait * 1000, 2),
+            'max_wait_ms': round(self.max_wait * 1000, 2),
+        }
+
+
+class DBExecutor:
+    """Доступ TCP сервера к БД через ограниченный пул потоков с приоритетами
+
+    Фиксированное число потоков держит свои соединения с БД открытыми
+    между запросами (закрываются только после ошибки БД). На SQLite поток
+    один - единственный писатель для всех записей TCP сервера, а запуск
+    нескольких рабочих процессов (--workers) на SQLite запрещён. Веб-процессы
+    (API и AuditWriter) пишут в ту же БД своими соединениями и при занятой
+    блокировке ждут её до busy_timeout, так что писатель один только среди
+    записей TCP сервера, а не во всей системе. Запросы ждут
+    в общей очереди по полосам: сначала COMMAND (регистрация плат и
+    реестр - на них ждут ответа плата или API), затем STATUS (статусы
+    замков и отключения плат), затем PRESENCE (heartbeat).
+
+    Допуск: запрос отклоняется с DBOverloaded при переполнении очереди
+    своей полосы (на регистрацию плата получит NACK и повторит её), а
+    PRESENCE - ещё и когда очередь COMMAND глубже shed_depth: пачка
+    heartbeat остаётся в памяти и уходит следующим циклом. STATUS при
+    нагрузке ждёт за COMMAND, но не отбрасывается. Так шторм регистраций
+    откладывает фоновую запись, а не ответы в цикле событий.
+    """
+
+    COMMAND = 0
+    STATUS = 1
+    PRESENCE = 2
+    LANE_NAMES = {COMMAND: 'command', STATUS: 'status', PRESENCE: 'presence'}
+
+    def __init__(self, workers: int = None, queue_limit: int = None, shed_depth: int = None):
+        self.workers = workers or settings.LOCK_DB_WORKERS
+        if self.workers > 1 and connection.vendor == 'sqlite':
+            # SQLite допускает одного писателя: параллельные потоки только ждут блокировку
+            logger.warning(f"SQLite: вместо {self.workers} потоков БД используется один")
+            self.workers = 1
+        self.shed_depth = shed_depth or settings.LOCK_DB_SHED_DEPTH
+        queue_limit = queue_limit or settings.LOCK_DB_QUEUE_LIMIT
+        self.lanes = {priority: LaneStats(name, queue_limit) for priority, name in self.LANE_NAMES.items()}
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()  # порядок поступления внутри полосы
+        self._threads = []
+
+    def start(self):
+        if self._threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.run, name=f'db-executor-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def admit(self, priority: int) -> bool:
+        lane = self.lanes[priority]
+        if lane.depth >= lane.limit:
+            return False
+        return priority != self.PRESENCE or self.lanes[self.COMMAND].depth < self.shed_depth
+
+    async def run_sync(self, priority: int, func, *args, **kwargs):
+        """Выполнение func(*args, **kwargs) в потоке пула, DBOverloaded при отказе в допуске"""
+        lane = self.lanes[priority]
+        if not self.admit(priority):
+            lane.rejected += 1
+            raise DBOverloaded(f"Очередь БД {lane.name} переполнена ({lane.depth})")
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        lane.depth += 1
+        lane.submitted += 1
+        self._queue.put((priority, next(self._sequence), time.monotonic(), func, args, kwargs, future, loop))
+        try:
+            return await future
+        finally:
+            lane.depth -= 1
+
+    @staticmethod
+    def _resolve(lane: LaneStats, future, result, error):
+        # В потоке цикла событий, поэтому счётчики полосы меняются без блокировок
+        if error is not None:
+            lane.failed += 1
+        else:
+            lane.completed += 1
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def run(self):
+        while True:
+            priority, _, enqueued, func, args, kwargs, future, loop = self._queue.get()
+            if func is None:
+                break
+            lane = self.lanes[priority]
+            lane.last_wait = time.monotonic() - enqueued
+            lane.max_wait = max(lane.max_wait, lane.last_wait)
+
+            result, error = None, None
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                error = e
+            finally:
+                # Соединение потока живёт между запросами, кроме случая ошибки БД
+                if connection.errors_occurred:
+                    connection.close_if_unusable_or_obsolete()
+            try:
+                loop.call_soon_threadsafe(self._resolve, lane, future, result, error)
+            except RuntimeError:
+                pass  # цикл событий уже закрыт при остановке сервера
+
+    def close(self):
+        """Остановка потоков после выполнения уже принятых запросов"""
+        for _ in self._threads:
+            self._queue.put((len(self.LANE_NAMES), next(self._sequence), 0, None, None, None, None, None))
+        self._threads = []
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'lanes': {lane.name: lane.as_dict() for lane in self.lanes.values()},
+        }
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import secrets
+from collections import deque
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def event_id(event: dict) -> str:
+    """Идентификатор события для Last-Event-ID: эпоха:seq"""
+    return f"{event['epoch']}:{event['seq']}"
+
+
+def parse_event_id(value: str) -> tuple:
+    """(эпоха, seq) из идентификатора события, ValueError при неверном формате
+
+    seq без эпохи (формат до её появления) возвращается с эпохой None и
+    приведёт к reset.
+    """
+    epoch, _, seq = value.rpartition(':')
+    return epoch or None, int(seq)
+
+
+class Subscription:
+    """Подписка на события с ограниченным буфером
+
+    Если подписчик не успевает забирать события и буфер переполняется,
+    подписка закрывается: после уже накопленных событий он получит
+    событие dropped и может переподключиться с seq последнего события.
+    """
+
+    def __init__(self, hub, boards=None, channels=None, buffer_size: int = None):
+        self.hub = hub
+        self.boards = set(boards) if boards else None
+        self.channels = set(channels) if channels else None
+        self.queue = deque()
+        self.buffer_size = buffer_size or settings.LOCK_EVENT_SUBSCRIBER_BUFFER
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def matches(self, event: dict) -> bool:
+        if self.boards is not None and event.get('board_id') not in self.boards:
+            return False
+        if self.channels is not None and event.get('channel') is not None and event['channel'] not in self.channels:
+            return False
+        return True
+
+    def offer(self, event: dict):
+        if self.closed or not self.matches(event):
+            return
+        if len(self.queue) >= self.buffer_size:
+            self.hub.dropped_total += 1
+            logger.warning(f"Подписчик событий отключён: буфер переполнен ({self.buffer_size})")
+            self.close()
+            self.queue.append({'type': 'dropped', 'reason': 'Подписчик не успевает получать события'})
+            return
+        self.queue.append(event)
+        self._wakeup.set()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.hub.subscribers.discard(self)
+        self._wakeup.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        while not self.queue:
+            if self.closed:
+                raise StopAsyncIteration
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return self.queue.popleft()
+
+
+class EventHub:
+    """Рассылка событий TCP сервера подписчикам
+
+    Каждое событие получает возрастающий seq и хранится в ограниченной
+    истории, из которой подписчик может дочитать пропущенное после
+    переподключения. seq начинается с нуля при каждом запуске процесса,
+    поэтому события несут и эпоху - случайный идентификатор запуска:
+    seq другой эпохи ничего не говорит о пропущенном и приводит к reset.
+    """
+
+    def __init__(self, history_size: int = None):
+        self.epoch = secrets.token_hex(4)
+        self.sequence = 0
+        self.history = deque(maxlen=history_size or settings.LOCK_EVENT_HISTORY)
+        self.subscribers = set()
+        self.dropped_total = 0
+
+    def publish(self, event_type: str, **fields) -> dict:
+        event = {'type': event_type, 'time': timezone.now().isoformat(), **fields}
+        return self.dispatch(event)
+
+    def dispatch(self, event: dict) -> dict:
+        """Рассылка готового события (например, полученного от рабочего процесса)"""
+        self.sequence += 1
+        event = {**event, 'epoch': self.epoch, 'seq': self.sequence}
+        self.history.append(event)
+        for subscription in list(self.subscribers):
+            subscription.offer(event)
+        return event
+
+    def subscribe(self, boards=None, channels=None, since: int = None, epoch: str = None) -> Subscription:
+        subscription = Subscription(self, boards, channels)
+
+        if since is not None and (epoch != self.epoch or since != self.sequence):
+            oldest = self.history[0]['seq'] if self.history else self.sequence + 1
+            restarted = epoch != self.epoch or since > self.sequence
+            if restarted or since + 1 < oldest:
+                # Пропущенное не восстановить (вытеснено из истории или сервер
+                # перезапущен) - клиенту нужно перечитать состояние целиком
+                subscription.queue.append({'type': 'reset'})
+                if restarted:
+                    since = 0
+            for event in self.history:
+                if event['seq'] > since:
+                    subscription.offer(event)
+
+        self.subscribers.add(subscription)
+        return subscription
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...protocol import VoungProtocol, FrameDecoder
+import json
+import time
+
+# Фреймов в одном блоке для FrameDecoder.feed, как в одном чтении из сокета
+FRAMES_PER_READ = 32
+
+
+class Command(BaseCommand):
+    help = 'Замер скорости кодека протокола Voung (фреймов в секунду)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='0,2,8,32,128,247', help='Размеры данных фрейма через запятую, байт')
+        parser.add_argument('--duration', type=float, default=0.2, help='Длительность одного замера, сек')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов замера, берётся лучший')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+        parser.add_argument('--baseline', help='JSON файл предыдущего запуска для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое замедление относительно --baseline (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes должен быть списком чисел через запятую')
+        if any(size < 0 or size > VoungProtocol.MAX_DATA_LENGTH for size in sizes):
+            raise CommandError(f"Размер данных фрейма - от 0 до {VoungProtocol.MAX_DATA_LENGTH} байт")
+
+        results = {}
+        for size in sizes:
+            data = bytes(range(size % 256)) + bytes(size - size % 256)
+            frame = VoungProtocol.create_frame(0x01, VoungProtocol.CMD_READ_ALL_STATUS, data)
+            stream = frame * FRAMES_PER_READ
+            decoder = FrameDecoder()
+            cases = {
+                'build': (lambda: VoungProtocol.create_frame(0x01, VoungProtocol.CMD_READ_ALL_STATUS, data), 1),
+                'parse': (lambda: VoungProtocol.parse_frame(frame), 1),
+                'decode': (lambda: decoder.feed(stream), FRAMES_PER_READ),
+                'xor': (lambda: VoungProtocol.compute_xor(frame), 1),
+            }
+            for name, (func, frames) in cases.items():
+                results[f"{name}/{size}"] = self.measure(func, frames, options['duration'], options['repeat'])
+
+        ack = lambda: VoungProtocol.create_response(0x01, VoungProtocol.CMD_HEARTBEAT, VoungProtocol.STATUS_OK)
+        results['heartbeat_ack/1'] = self.measure(ack, 1, options['duration'], options['repeat'])
+
+        baseline = self.load_baseline(options['baseline']) if options['baseline'] else {}
+        regressions = []
+        self.stdout.write(f"{'операция':<16}{'данные':>8}{'фреймов/с':>14}{'к базе':>10}")
+        for key, rate in results.items():
+            name, size = key.split('/')
+            line = f"{name:<16}{size:>8}{rate:>14,.0f}"
+            if key in baseline:
+                ratio = rate / baseline[key]
+                line += f"{ratio:>9.2f}x"
+                if ratio < 1 - options['tolerance']:
+                    regressions.append(key)
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+
+        if regressions:
+            raise CommandError(f"Замедление больше {options['tolerance']:.0%}: {', '.join(regressions)}")
+
+    @staticmethod
+    def measure(func, frames: int, duration: float, repeat: int) -> float:
+        """Фреймов в секунду - лучший из repeat замеров длительностью duration
+
+        Лучший, а не средний: медленные замеры - это шум планировщика и GC.
+        """
+        best = 0.0
+        for _ in range(max(1, repeat)):
+            calls = 0
+            started = time.perf_counter()
+            deadline = started + duration
+            while True:
+                for _ in range(100):
+                    func()
+                calls += 100
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+            best = max(best, calls * frames / (now - started))
+        return best
+
+    @staticmethod
+    def load_baseline(path: str) -> dict:
+        try:
+            with open(path) as baseline:
+                return json.load(baseline)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не удалось прочитать {path}: {e}")
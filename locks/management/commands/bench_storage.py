@@ -0,0 +1,206 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.utils import timezone
+from ...models import Lock, LockBoard, LockOperation
+from ...registration import RegistrationQueue
+from ...tcp_server import LockControlServer
+from ...writers import StatusWriteQueue
+from .simulate_boards import percentile
+import json
+import os
+import random
+import threading
+import time
+
+BENCH_PREFIX = 'BENCH'
+
+
+class Command(BaseCommand):
+    help = 'Замер записи и чтения на текущем профиле БД (DB_ENGINE) для сравнения SQLite и PostgreSQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--boards', type=int, default=500, help='Временных плат для замера')
+        parser.add_argument('--duration', type=float, default=3, help='Длительность одного замера, сек')
+        parser.add_argument('--readers', type=int, default=4, help='Потоков чтения в смешанной нагрузке')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+        parser.add_argument('--compare', help='JSON файл замера другого профиля для сравнения')
+
+    def handle(self, *args, **options):
+        if not 1 <= options['boards'] <= 10 ** (8 - len(BENCH_PREFIX)):
+            raise CommandError(f"--boards - от 1 до {10 ** (8 - len(BENCH_PREFIX))}")
+
+        # Замер идёт во временной БД того же профиля, рабочие данные и счётчики не затрагиваются
+        profile = connection.vendor
+        live_name = connection.settings_dict['NAME']
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        if profile == 'sqlite':
+            # Файл рядом с рабочей БД (та же ФС и PRAGMA), а не БД в памяти
+            test_settings['NAME'] = f"{os.path.splitext(live_name)[0]}_bench.db"
+        else:
+            test_settings['NAME'] = f"bench_{live_name}"
+        try:
+            bench_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        except Exception as e:
+            raise CommandError(f"Не удалось создать временную БД для замера (нужно право CREATEDB): {e}")
+
+        self.stdout.write(f"Профиль: {profile} (временная БД {bench_name})")
+        results = {}
+        try:
+            results['register'] = self.bench_register(options['boards'])
+            boards = LockBoard.objects.filter(device_id__startswith=BENCH_PREFIX)
+            lock_ids = list(Lock.objects.filter(board__in=boards).values_list('pk', flat=True))
+            device_ids = list(boards.values_list('device_id', flat=True))
+            results['status'] = self.bench_status(lock_ids, options['duration'])
+            results['presence'] = self.bench_presence(device_ids, options['duration'])
+            results['audit'] = self.bench_audit(options['duration'])
+            results.update(self.bench_mixed(lock_ids, options['duration'], options['readers']))
+        finally:
+            connection.creation.destroy_test_db(live_name, verbosity=0)
+
+        other = self.load(options['compare']) if options['compare'] else None
+        header = f"{'замер':<14}{'скорость':>14}{'':<10}{'p50, мс':>10}{'p99, мс':>10}"
+        if other:
+            header += f"{other['profile']:>14}{'к нему':>9}"
+        self.stdout.write(header)
+        for name, result in results.items():
+            line = (f"{name:<14}{result['rate']:>14,.0f} {result['unit']:<9}"
+                    f"{result['p50_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+            if result.get('errors'):
+                line += f"  ошибок: {result['errors']}"
+            if other and name in other['results']:
+                line += f"{other['results'][name]['rate']:>14,.0f}{result['rate'] / other['results'][name]['rate']:>8.2f}x"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'profile': profile, 'results': results}, output, indent=2)
+
+    @staticmethod
+    def result(count: int, elapsed: float, latencies: list, unit: str, **extra) -> dict:
+        return {
+            'rate': count / elapsed if elapsed else 0.0,
+            'unit': unit,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            **extra,
+        }
+
+    @staticmethod
+    def run_for(duration: float, step) -> tuple:
+        """Повтор step() в течение duration: (обработано, сек, задержки шагов)"""
+        count = 0
+        latencies = []
+        started = time.perf_counter()
+        while time.perf_counter() - started < duration:
+            step_started = time.perf_counter()
+            count += step()
+            latencies.append(time.perf_counter() - step_started)
+        return count, time.perf_counter() - started, latencies
+
+    def bench_register(self, boards: int) -> dict:
+        """Регистрация новых плат пачками, как RegistrationQueue"""
+        digits = 8 - len(BENCH_PREFIX)
+        fields = {'device_type': '0025', 'ccid': '', 'board_address': 1, 'is_online': True, 'ip_address': '127.0.0.1'}
+        latencies = []
+        started = time.perf_counter()
+        for offset in range(0, boards, 100):
+            batch = {f"{BENCH_PREFIX}{index:0{digits}d}": {**fields, 'last_heartbeat': timezone.now()}
+                     for index in range(offset, min(offset + 100, boards))}
+            batch_started = time.perf_counter()
+            RegistrationQueue.write(batch, {})
+            latencies.append(time.perf_counter() - batch_started)
+        return self.result(boards, time.perf_counter() - started, latencies, 'плат/с')
+
+    @staticmethod
+    def status_batch(lock_ids: list) -> dict:
+        now = timezone.now()
+        return {lock_id: (random.randint(0, 1), now) for lock_id in random.sample(lock_ids, min(500, len(lock_ids)))}
+
+    def bench_status(self, lock_ids: list, duration: float) -> dict:
+        """Пачки статусов замков, как StatusWriteQueue"""
+        def step():
+            StatusWriteQueue.write(self.status_batch(lock_ids))
+            return min(500, len(lock_ids))
+        return self.result(*self.run_for(duration, step), 'замков/с')
+
+    def bench_presence(self, device_ids: list, duration: float) -> dict:
+        """Пачки heartbeat, как flush_presence"""
+        def step():
+            now = timezone.now()
+            LockControlServer.write_presence({device_id: now for device_id in device_ids})
+            return len(device_ids)
+        return self.result(*self.run_for(duration, step), 'плат/с')
+
+    def bench_audit(self, duration: float) -> dict:
+        """Пачки журнала операций, как AuditWriter"""
+        board_ids = list(LockBoard.objects.filter(device_id__startswith=BENCH_PREFIX).values_list('pk', flat=True))
+
+        def step():
+            LockOperation.objects.bulk_create([
+                LockOperation(board_id=random.choice(board_ids), operation_type='open_single', channels=[1], success=True)
+                for _ in range(200)
+            ])
+            return 200
+        return self.result(*self.run_for(duration, step), 'операций/с')
+
+    def bench_mixed(self, lock_ids: list, duration: float, readers: int) -> dict:
+        """Запись статусов при одновременном чтении списков из потоков (как веб-процессы)"""
+        stop = threading.Event()
+        reads = []
+        errors = []
+
+        def reader():
+            count, latencies, failed = 0, [], 0
+            try:
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    try:
+                        boards = LockBoard.objects.filter(device_id__startswith=BENCH_PREFIX)
+                        list(boards.values('device_id', 'is_online')[:200])
+                        list(Lock.objects.filter(pk__in=random.sample(lock_ids, min(50, len(lock_ids)))).values('pk', 'status'))
+                    except OperationalError:
+                        failed += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    count += 1
+            finally:
+                connection.close()
+            reads.append((count, latencies))
+            errors.append(failed)
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+
+        write_errors = 0
+
+        def step():
+            nonlocal write_errors
+            try:
+                StatusWriteQueue.write(self.status_batch(lock_ids))
+            except OperationalError:
+                write_errors += 1
+                return 0
+            return min(500, len(lock_ids))
+
+        try:
+            written = self.run_for(duration, step)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+        read_latencies = [latency for _, latencies in reads for latency in latencies]
+        return {
+            'mixed_write': self.result(*written, 'замков/с', errors=write_errors),
+            'mixed_read': self.result(sum(count for count, _ in reads), written[1], read_latencies, 'чтений/с',
+                                      errors=sum(errors)),
+        }
+
+    @staticmethod
+    def load(path: str) -> dict:
+        try:
+            with open(path) as other:
+                return json.load(other)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не удалось прочитать {path}: {e}")
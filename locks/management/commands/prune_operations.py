@@ -0,0 +1,110 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from ...models import LockOperation, DailyOperationSummary
+from datetime import datetime, time as dt_time, timedelta
+import gzip
+import json
+import os
+import time
+
+ARCHIVE_FIELDS = ('id', 'board_id', 'operation_type', 'channels', 'order_number', 'success', 'error_message', 'created_at')
+
+
+class Command(BaseCommand):
+    help = 'Перенос старых операций журнала в помесячные архивы с суточными сводками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.LOCK_OPERATION_RETENTION_DAYS,
+                            help='Хранить в таблице операции за последние N суток')
+        parser.add_argument('--archive-dir', default=settings.LOCK_OPERATION_ARCHIVE_DIR,
+                            help='Каталог архивов operations-ГГГГ-ММ.jsonl.gz')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Операций в одной транзакции удаления')
+        parser.add_argument('--pause', type=float, default=0.05,
+                            help='Пауза между пачками, сек (даёт дорогу записи журнала)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать операции к переносу')
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--days и --chunk-size должны быть положительными')
+
+        # Граница по началу суток, чтобы сутки архивировались целиком
+        today = timezone.localdate() if settings.USE_TZ else timezone.now().date()
+        cutoff = datetime.combine(today - timedelta(days=options['days']), dt_time.min)
+        if settings.USE_TZ:
+            cutoff = timezone.make_aware(cutoff)
+        queryset = LockOperation.objects.filter(created_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f"Операций старше {cutoff:%Y-%m-%d}: {queryset.count()}")
+            return
+
+        os.makedirs(options['archive_dir'], exist_ok=True)
+        started = time.monotonic()
+        archived = 0
+        while True:
+            rows = list(queryset.order_by('created_at', 'id').values(*ARCHIVE_FIELDS)[:options['chunk_size']])
+            if not rows:
+                break
+            self.archive(rows, options['archive_dir'])
+            self.summarize_and_delete(rows)
+            archived += len(rows)
+            self.stdout.write(f"Перенесено в архив: {archived}", ending='\r')
+            self.stdout.flush()
+            time.sleep(options['pause'])
+
+        self.stdout.write(
+            f"Перенесено в архив {archived} операций старше {cutoff:%Y-%m-%d} "
+            f"за {time.monotonic() - started:.1f} сек"
+        )
+
+    @staticmethod
+    def archive(rows: list, archive_dir: str):
+        """Дописывание пачки в помесячные архивы до удаления из таблицы"""
+        months = {}
+        for row in rows:
+            line = json.dumps({**row, 'created_at': row['created_at'].isoformat()}, ensure_ascii=False) + '\n'
+            months.setdefault(row['created_at'].strftime('%Y-%m'), []).append(line)
+
+        for month, lines in months.items():
+            path = os.path.join(archive_dir, f"operations-{month}.jsonl.gz")
+            # Каждая пачка - отдельный член gzip, файл читается целиком через gzip.open
+            with open(path, 'ab') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='ab') as archive:
+                    archive.write(''.join(lines).encode('utf-8'))
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    @staticmethod
+    def summarize_and_delete(rows: list):
+        """Обновление суточных сводок и удаление пачки одной короткой транзакцией"""
+        totals = {}
+        for row in rows:
+            created_at = timezone.localtime(row['created_at']) if settings.USE_TZ else row['created_at']
+            key = (row['board_id'], created_at.date(), row['operation_type'])
+            total, success = totals.get(key, (0, 0))
+            totals[key] = (total + 1, success + row['success'])
+
+        with transaction.atomic():
+            existing = {
+                (summary.board_id, summary.date, summary.operation_type): summary
+                for summary in DailyOperationSummary.objects.filter(
+                    board_id__in={key[0] for key in totals},
+                    date__in={key[1] for key in totals}
+                )
+            }
+            created, updated = [], []
+            for key, (total, success) in totals.items():
+                summary = existing.get(key)
+                if summary is None:
+                    created.append(DailyOperationSummary(
+                        board_id=key[0], date=key[1], operation_type=key[2], total=total, success=success
+                    ))
+                else:
+                    summary.total += total
+                    summary.success += success
+                    updated.append(summary)
+            DailyOperationSummary.objects.bulk_create(created)
+            DailyOperationSummary.objects.bulk_update(updated, ['total', 'success'])
+            LockOperation.objects.filter(id__in=[row['id'] for row in rows]).delete()
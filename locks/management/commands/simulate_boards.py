@@ -0,0 +1,226 @@
+from django.core.management.base import BaseCommand, CommandError
+from ...protocol import VoungProtocol, Frame, FrameDecoder
+from collections import deque
+import asyncio
+import random
+import time
+
+
+def percentile(values: list, percent: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))
+    return values[index]
+
+
+class SimulationStats:
+    """Общая статистика симуляции"""
+
+    def __init__(self):
+        self.connected = 0
+        self.registered = 0
+        self.frames_sent = 0
+        self.frames_received = 0
+        self.status_changes = 0
+        self.register_nacks = 0
+        self.commands_answered = 0
+        self.errors = 0
+        self.latencies = {VoungProtocol.CMD_HEARTBEAT: [], VoungProtocol.CMD_REGISTER: []}
+
+
+class SimulatedBoard:
+    """Плата, работающая по протоколу Voung как реальная прошивка"""
+
+    def __init__(self, device_id: str, board_addr: int, channels: int, stats: SimulationStats, options: dict):
+        self.device_id = device_id
+        self.board_addr = board_addr
+        self.channels = bytearray(b'\x01' * channels)  # 0 - открыт, 1 - закрыт
+        self.stats = stats
+        self.options = options
+        self.sent_at = {cmd: deque() for cmd in stats.latencies}
+        self.writer = None
+
+    def send(self, cmd: int, data: bytes = b''):
+        self.writer.write(VoungProtocol.create_frame(self.board_addr, cmd, data))
+        self.stats.frames_sent += 1
+        if cmd in self.sent_at:
+            self.sent_at[cmd].append(time.perf_counter())
+
+    def respond(self, cmd: int, data: bytes = b''):
+        self.writer.write(VoungProtocol.create_response(self.board_addr, cmd, VoungProtocol.STATUS_OK, data))
+        self.stats.frames_sent += 1
+        self.stats.commands_answered += 1
+
+    def set_channel(self, channel: int, status: int):
+        if 1 <= channel <= len(self.channels) and self.channels[channel - 1] != status:
+            self.channels[channel - 1] = status
+            self.stats.status_changes += 1
+            self.send(VoungProtocol.CMD_STATUS_CHANGE, bytes([channel, status]))
+
+    def handle_frame(self, frame: Frame):
+        cmd = frame.cmd
+        data = frame.data
+
+        if cmd in self.sent_at:
+            if self.sent_at[cmd]:
+                self.stats.latencies[cmd].append(time.perf_counter() - self.sent_at[cmd].popleft())
+            if data and data[0] != VoungProtocol.STATUS_OK:
+                if cmd == VoungProtocol.CMD_REGISTER:
+                    # Как прошивка: повтор регистрации после отказа сервера
+                    self.stats.register_nacks += 1
+                    delay = self.options['register_retry'] * random.uniform(0.5, 1.5)
+                    asyncio.get_running_loop().call_later(delay, self.register)
+                else:
+                    self.stats.errors += 1
+            elif cmd == VoungProtocol.CMD_REGISTER:
+                self.stats.registered += 1
+            return
+
+        if cmd in (VoungProtocol.CMD_OPEN_SINGLE, VoungProtocol.CMD_KEEP_OPEN) and data:
+            self.respond(cmd, data[:1])
+            self.set_channel(data[0], 0)
+        elif cmd == VoungProtocol.CMD_CLOSE_CHANNEL and data:
+            self.respond(cmd, data[:1])
+            self.set_channel(data[0], 1)
+        elif cmd == VoungProtocol.CMD_OPEN_MULTIPLE and data:
+            channels = data[1:1 + data[0]]
+            self.respond(cmd)
+            for channel in channels:
+                self.set_channel(channel, 0)
+        elif cmd == VoungProtocol.CMD_OPEN_ALL:
+            self.respond(cmd)
+            for channel in range(1, len(self.channels) + 1):
+                self.set_channel(channel, 0)
+        elif cmd == VoungProtocol.CMD_READ_STATUS and data:
+            channel = data[0]
+            status = self.channels[channel - 1] if 1 <= channel <= len(self.channels) else 0xFF
+            self.respond(cmd, bytes([channel, status]))
+        elif cmd == VoungProtocol.CMD_READ_ALL_STATUS:
+            self.respond(cmd, bytes(self.channels))
+        else:
+            self.stats.errors += 1
+
+    def register(self):
+        if self.writer.is_closing():
+            return
+        # Тип устройства - количество каналов в BCD, например 0x0025
+        device_type = bytes.fromhex(f"{len(self.channels):04d}")
+        self.send(VoungProtocol.CMD_REGISTER, self.device_id.encode('ascii') + device_type)
+
+    async def heartbeat_loop(self):
+        interval = self.options['heartbeat_interval']
+        await asyncio.sleep(random.uniform(0, interval))
+        while True:
+            self.send(VoungProtocol.CMD_HEARTBEAT, self.device_id.encode('ascii'))
+            await asyncio.sleep(interval)
+
+    async def status_loop(self):
+        rate = self.options['status_rate']
+        if rate <= 0:
+            return
+        while True:
+            await asyncio.sleep(random.expovariate(rate))
+            channel = random.randint(1, len(self.channels))
+            self.set_channel(channel, self.channels[channel - 1] ^ 1)
+
+    async def run(self):
+        try:
+            reader, self.writer = await asyncio.open_connection(self.options['host'], self.options['port'])
+        except OSError:
+            self.stats.errors += 1
+            return
+        self.stats.connected += 1
+
+        self.register()
+        tasks = [asyncio.create_task(self.heartbeat_loop()), asyncio.create_task(self.status_loop())]
+        decoder = FrameDecoder()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                for frame in decoder.feed(data):
+                    self.stats.frames_received += 1
+                    self.handle_frame(frame)
+        except (ConnectionError, OSError):
+            self.stats.errors += 1
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.writer.close()
+            self.stats.connected -= 1
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочная симуляция парка плат, подключающихся к TCP серверу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Адрес TCP сервера')
+        parser.add_argument('--port', type=int, default=8585, help='Порт TCP сервера')
+        parser.add_argument('--boards', type=int, default=100, help='Количество плат')
+        parser.add_argument('--channels', type=int, default=25, help='Каналов на плату')
+        parser.add_argument('--prefix', default='SIM', help='Префикс device_id (до 8 символов вместе с номером)')
+        parser.add_argument('--connect-rate', type=float, default=500, help='Подключений в секунду')
+        parser.add_argument('--heartbeat-interval', type=float, default=30, help='Интервал heartbeat, сек')
+        parser.add_argument('--status-rate', type=float, default=0.01,
+                            help='Изменений статуса в секунду на плату (0 - отключить)')
+        parser.add_argument('--register-retry', type=float, default=1, help='Повтор регистрации после NACK, сек')
+        parser.add_argument('--duration', type=float, default=60, help='Длительность симуляции, сек')
+        parser.add_argument('--report-interval', type=float, default=5, help='Интервал промежуточного отчёта, сек')
+
+    def handle(self, *args, **options):
+        digits = 8 - len(options['prefix'])
+        if digits < 1 or options['boards'] > 10 ** digits:
+            raise CommandError('Префикс слишком длинный для такого количества плат')
+
+        try:
+            asyncio.run(self.simulate(options, digits))
+        except KeyboardInterrupt:
+            self.stdout.write("Симуляция прервана")
+
+    async def simulate(self, options: dict, digits: int):
+        stats = SimulationStats()
+        boards = [
+            SimulatedBoard(f"{options['prefix']}{index:0{digits}d}", index % 256, options['channels'], stats, options)
+            for index in range(options['boards'])
+        ]
+
+        started = time.perf_counter()
+        reporter = asyncio.create_task(self.report_loop(stats, started, options['report_interval']))
+        tasks = []
+        for board in boards:
+            tasks.append(asyncio.create_task(board.run()))
+            await asyncio.sleep(1 / options['connect_rate'])
+
+        await asyncio.sleep(max(0.0, options['duration'] - (time.perf_counter() - started)))
+        reporter.cancel()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.report(stats, time.perf_counter() - started, final=True)
+
+    async def report_loop(self, stats: SimulationStats, started: float, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.report(stats, time.perf_counter() - started)
+
+    def report(self, stats: SimulationStats, elapsed: float, final: bool = False):
+        self.stdout.write(
+            f"[{elapsed:7.1f} сек] подключено: {stats.connected}, зарегистрировано: {stats.registered}, "
+            f"отправлено: {stats.frames_sent} ({stats.frames_sent / elapsed:.0f}/сек), "
+            f"получено: {stats.frames_received} ({stats.frames_received / elapsed:.0f}/сек), "
+            f"изменений статуса: {stats.status_changes}, ответов на команды: {stats.commands_answered}, "
+            f"отказов в регистрации: {stats.register_nacks}, ошибок: {stats.errors}"
+        )
+        if not final:
+            return
+
+        for cmd, name in ((VoungProtocol.CMD_REGISTER, 'register'), (VoungProtocol.CMD_HEARTBEAT, 'heartbeat')):
+            latencies = stats.latencies[cmd]
+            self.stdout.write(
+                f"ACK {name}: {len(latencies)} шт, p50={percentile(latencies, 50) * 1000:.2f} мс, "
+                f"p90={percentile(latencies, 90) * 1000:.2f} мс, p99={percentile(latencies, 99) * 1000:.2f} мс, "
+                f"max={max(latencies, default=0) * 1000:.2f} мс"
+            )
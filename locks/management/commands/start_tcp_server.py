@@ -1,5 +1,8 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from ...tcp_server import lock_server
+from ...supervisor import WorkerSupervisor, worker_socket_path
+import argparse
 import asyncio
 
 
@@ -9,11 +12,35 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--host', default='0.0.0.0', help='IP адрес для привязки')
         parser.add_argument('--port', type=int, default=8585, help='Порт для прослушивания')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество рабочих процессов на одном порту (SO_REUSEPORT)')
+        # Используется супервизором при запуске рабочих процессов
+        parser.add_argument('--worker-index', type=int, default=None, help=argparse.SUPPRESS)
 
     def handle(self, *args, **options):
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            # У каждого рабочего процесса свой DBExecutor - это N писателей в одну SQLite
+            raise CommandError('--workers больше 1 требует PostgreSQL (DB_ENGINE=postgresql): '
+                               'SQLite допускает одного писателя')
+        if options['workers'] > 1 and options['worker_index'] is None:
+            self.stdout.write(
+                f"Запуск {options['workers']} рабочих процессов TCP сервера на {options['host']}:{options['port']}"
+            )
+            supervisor = WorkerSupervisor(options['workers'], options['host'], options['port'])
+            try:
+                asyncio.run(supervisor.run())
+            except KeyboardInterrupt:
+                self.stdout.write("Сервер остановлен")
+            return
+
         lock_server.host = options['host']
         lock_server.port = options['port']
 
+        if options['worker_index'] is not None:
+            lock_server.worker_index = options['worker_index']
+            lock_server.reuse_port = True
+            lock_server.command_socket = worker_socket_path(options['worker_index'])
+
         self.stdout.write(f"Запуск TCP сервера на {options['host']}:{options['port']}")
 
         try:
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:44
+
+from django.db import migrations, models
+
+
+def seed_counters(apps, schema_editor):
+    LockOperation = apps.get_model('locks', 'LockOperation')
+    OperationCounter = apps.get_model('locks', 'OperationCounter')
+    success = LockOperation.objects.filter(success=True).count()
+    OperationCounter.objects.bulk_create([
+        OperationCounter(name='operations_success', value=success),
+        OperationCounter(name='operations_failed', value=LockOperation.objects.count() - success),
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OperationCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=32, unique=True, verbose_name='Счётчик')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Значение')),
+            ],
+            options={
+                'verbose_name': 'Счётчик операций',
+                'verbose_name_plural': 'Счётчики операций',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:53
+
+from django.db import migrations, models
+
+
+def seed_channel_state(apps, schema_editor):
+    LockBoard = apps.get_model('locks', 'LockBoard')
+    Lock = apps.get_model('locks', 'Lock')
+    masks = {}
+    for board_id, channel in Lock.objects.filter(status=0, channel__gte=1, channel__lte=63).values_list('board_id', 'channel'):
+        masks[board_id] = masks.get(board_id, 0) | 1 << (channel - 1)
+    LockBoard.objects.bulk_update(
+        [LockBoard(pk=board_id, open_channels=mask) for board_id, mask in masks.items()],
+        ['open_channels'],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0002_operationcounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lockboard',
+            name='channel_state_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время состояния каналов'),
+        ),
+        migrations.AddField(
+            model_name='lockboard',
+            name='open_channels',
+            field=models.BigIntegerField(default=0, verbose_name='Открытые каналы (битовая маска)'),
+        ),
+        migrations.RunPython(seed_channel_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0003_board_channel_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lockoperation',
+            index=models.Index(fields=['created_at', 'id'], name='lockop_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lockoperation',
+            index=models.Index(fields=['board', 'created_at'], name='lockop_board_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lockoperation',
+            index=models.Index(fields=['operation_type', 'created_at'], name='lockop_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lockoperation',
+            index=models.Index(fields=['success', 'created_at'], name='lockop_success_created_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:56
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0004_operation_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lockoperation',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.11 on 2026-10-17 21:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('locks', '0005_operation_created_at_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOperationSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Дата')),
+                ('operation_type', models.CharField(choices=[('open_single', 'Открытие одного замка'), ('open_all', 'Открытие всех замков'), ('open_multiple', 'Открытие нескольких замков'), ('read_status', 'Чтение статуса'), ('read_all_status', 'Чтение всех статусов'), ('keep_open', 'Постоянное открытие'), ('close_channel', 'Закрытие канала')], max_length=20, verbose_name='Тип операции')),
+                ('total', models.IntegerField(default=0, verbose_name='Всего')),
+                ('success', models.IntegerField(default=0, verbose_name='Успешно')),
+                ('board', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to='locks.lockboard')),
+            ],
+            options={
+                'verbose_name': 'Суточная сводка операций',
+                'verbose_name_plural': 'Суточные сводки операций',
+                'indexes': [models.Index(fields=['date'], name='lockop_summary_date_idx')],
+                'unique_together': {('board', 'date', 'operation_type')},
+            },
+        ),
+    ]
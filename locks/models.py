@@ -13,9 +13,14 @@ class LockBoard(models.Model):
     is_online = models.BooleanField(default=False, verbose_name="Онлайн")
     last_heartbeat = models.DateTimeField(null=True, blank=True, verbose_name="Последний heartbeat")
     ip_address = models.GenericIPAddressField(null=True, blank=True, verbose_name="IP адрес")
+    open_channels = models.BigIntegerField(default=0, verbose_name="Открытые каналы (битовая маска)")
+    channel_state_at = models.DateTimeField(null=True, blank=True, verbose_name="Время состояния каналов")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Бит канала N - (N - 1), в BigIntegerField помещается 63 канала
+    MAX_MASK_CHANNELS = 63
+
     class Meta:
         verbose_name = "Плата управления замками"
         verbose_name_plural = "Платы управления замками"
@@ -23,6 +28,23 @@ class LockBoard(models.Model):
     def __str__(self):
         return f"Board {self.device_id} ({self.total_channels} channels)"
 
+    @staticmethod
+    def pack_open_channels(statuses) -> int:
+        """Битовая маска открытых каналов по статусам каналов 1..N"""
+        mask = 0
+        for index, status in enumerate(statuses[:LockBoard.MAX_MASK_CHANNELS]):
+            if status == 0:
+                mask |= 1 << index
+        return mask
+
+    @property
+    def has_channel_mask(self) -> bool:
+        return self.total_channels <= self.MAX_MASK_CHANNELS
+
+    def channel_statuses(self) -> list:
+        """Статусы каналов 1..N из битовой маски (0 - открыт, 1 - закрыт)"""
+        return [0 if self.open_channels >> index & 1 else 1 for index in range(self.total_channels)]
+
 
 class Lock(models.Model):
     """Модель отдельного замка"""
@@ -64,9 +86,48 @@ class LockOperation(models.Model):
     order_number = models.CharField(max_length=24, blank=True, verbose_name="Номер заказа")
     success = models.BooleanField(default=False, verbose_name="Успешно")
     error_message = models.TextField(blank=True, verbose_name="Сообщение об ошибке")
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Время операции, а не записи в БД - журнал пишется пачками (AuditWriter)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         verbose_name = "Операция с замком"
         verbose_name_plural = "Операции с замками"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Курсорная пагинация журнала по (created_at, id) с фильтрами
+            models.Index(fields=['created_at', 'id'], name='lockop_created_idx'),
+            models.Index(fields=['board', 'created_at'], name='lockop_board_created_idx'),
+            models.Index(fields=['operation_type', 'created_at'], name='lockop_type_created_idx'),
+            models.Index(fields=['success', 'created_at'], name='lockop_success_created_idx'),
+        ]
+
+
+class DailyOperationSummary(models.Model):
+    """Суточная сводка операций платы по журналу, перенесённому в архив"""
+    board = models.ForeignKey(LockBoard, on_delete=models.CASCADE, related_name='daily_summaries')
+    date = models.DateField(verbose_name="Дата")
+    operation_type = models.CharField(max_length=20, choices=LockOperation.OPERATION_TYPES, verbose_name="Тип операции")
+    total = models.IntegerField(default=0, verbose_name="Всего")
+    success = models.IntegerField(default=0, verbose_name="Успешно")
+
+    class Meta:
+        unique_together = ['board', 'date', 'operation_type']
+        indexes = [models.Index(fields=['date'], name='lockop_summary_date_idx')]
+        verbose_name = "Суточная сводка операций"
+        verbose_name_plural = "Суточные сводки операций"
+
+    def __str__(self):
+        return f"{self.board_id} {self.date} {self.operation_type}: {self.success}/{self.total}"
+
+
+class OperationCounter(models.Model):
+    """Накопительные счётчики журнала операций"""
+    name = models.CharField(max_length=32, unique=True, verbose_name="Счётчик")
+    value = models.BigIntegerField(default=0, verbose_name="Значение")
+
+    class Meta:
+        verbose_name = "Счётчик операций"
+        verbose_name_plural = "Счётчики операций"
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
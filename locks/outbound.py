@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundQueueFull(Exception):
+    """Очередь отправки платы переполнена"""
+
+
+class OutboundQueue:
+    """Ограниченная очередь исходящих фреймов одного соединения
+
+    Фреймы отправляет отдельная задача: всё, что накопилось к её
+    пробуждению, уходит одним writelines. Вызывающий код не ждёт drain,
+    поэтому медленная плата не блокирует остальных.
+
+    Политики переполнения:
+    - reject: новый фрейм отклоняется (OutboundQueueFull);
+    - drop_oldest_ack: сначала вытесняются самые старые ACK heartbeat,
+      затем новый фрейм отклоняется.
+    """
+
+    POLICY_REJECT = 'reject'
+    POLICY_DROP_OLDEST_ACK = 'drop_oldest_ack'
+
+    def __init__(self, writer, max_bytes: int = None, max_frames: int = None, policy: str = None):
+        self.writer = writer
+        self.max_bytes = max_bytes or settings.LOCK_OUTBOUND_MAX_BYTES
+        self.max_frames = max_frames or settings.LOCK_OUTBOUND_MAX_FRAMES
+        self.policy = policy or settings.LOCK_OUTBOUND_POLICY
+        self.frames = deque()  # (frame, enqueued_at, droppable)
+        self.queued_bytes = 0
+        self.task = None
+        self._wakeup = asyncio.Event()
+
+        # Статистика
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.writes = 0
+        self.dropped_frames = 0
+        self.rejected_frames = 0
+        self.max_queued_bytes = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+        return self
+
+    def _is_full(self, size: int) -> bool:
+        return len(self.frames) >= self.max_frames or self.queued_bytes + size > self.max_bytes
+
+    def _drop_oldest_ack(self) -> bool:
+        for index, (frame, _, droppable) in enumerate(self.frames):
+            if droppable:
+                del self.frames[index]
+                self.queued_bytes -= len(frame)
+                self.dropped_frames += 1
+                return True
+        return False
+
+    def put(self, frame: bytes, droppable: bool = False):
+        """Постановка фрейма в очередь; droppable - фрейм можно вытеснить при переполнении"""
+        if self.task is None or self.task.done():
+            raise ConnectionResetError('Соединение с платой закрыто')
+
+        size = len(frame)
+        while self._is_full(size):
+            if self.policy != self.POLICY_DROP_OLDEST_ACK or not self._drop_oldest_ack():
+                if droppable:
+                    self.dropped_frames += 1
+                    return
+                self.rejected_frames += 1
+                raise OutboundQueueFull('Очередь отправки платы переполнена')
+
+        self.frames.append((frame, time.monotonic(), droppable))
+        self.queued_bytes += size
+        self.max_queued_bytes = max(self.max_queued_bytes, self.queued_bytes)
+        self._wakeup.set()
+
+    async def run(self):
+        try:
+            while True:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                if not self.frames:
+                    continue
+
+                now = time.monotonic()
+                batch = []
+                while self.frames:
+                    frame, enqueued_at, _ = self.frames.popleft()
+                    batch.append(frame)
+                    waited = now - enqueued_at
+                    self.total_queue_time += waited
+                    self.max_queue_time = max(self.max_queue_time, waited)
+                    self.sent_bytes += len(frame)
+                self.queued_bytes = 0
+                self.sent_frames += len(batch)
+                self.writes += 1
+
+                self.writer.writelines(batch)
+                await self.writer.drain()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка отправки в {self.writer.get_extra_info('peername')}: {e}")
+        finally:
+            self.frames.clear()
+            self.queued_bytes = 0
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            'queued_frames': len(self.frames),
+            'queued_bytes': self.queued_bytes,
+            'max_queued_bytes': self.max_queued_bytes,
+            'sent_frames': self.sent_frames,
+            'sent_bytes': self.sent_bytes,
+            'writes': self.writes,
+            'dropped_frames': self.dropped_frames,
+            'rejected_frames': self.rejected_frames,
+            'avg_queue_time_ms': round(self.total_queue_time / self.sent_frames * 1000, 2) if self.sent_frames else 0.0,
+            'max_queue_time_ms': round(self.max_queue_time * 1000, 2),
+        }
@@ -0,0 +1,121 @@
+from base64 import b64decode, b64encode
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по (created_at, id) от новых к старым
+
+    Курсор хранит позицию последней (или первой) записи страницы, поэтому
+    следующая страница выбирается условием по индексу, а не OFFSET, и
+    стоит O(размер страницы) на любой глубине журнала.
+    """
+
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        """(reverse, created_at, id) или None для первой страницы"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, pk, created_at = b64decode(encoded.encode('ascii')).decode('ascii').split('|', 2)
+            created_at = parse_datetime(created_at)
+            if direction not in ('n', 'p') or created_at is None:
+                raise ValueError
+            return direction == 'p', created_at, int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, reverse: bool, item) -> str:
+        position = f"{'p' if reverse else 'n'}|{item.pk}|{item.created_at.isoformat()}"
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, b64encode(position.encode('ascii')).decode('ascii')
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        if cursor is None:
+            reverse = False
+            queryset = queryset.order_by('-created_at', '-id')
+        else:
+            reverse, created_at, pk = cursor
+            # Граница по created_at использует индекс, совпадающие по времени записи делятся по id
+            if reverse:
+                queryset = queryset.filter(created_at__gte=created_at).exclude(created_at=created_at, id__lte=pk)
+                queryset = queryset.order_by('created_at', 'id')
+            else:
+                queryset = queryset.filter(created_at__lte=created_at).exclude(created_at=created_at, id__gte=pk)
+                queryset = queryset.order_by('-created_at', '-id')
+
+        items = list(queryset[:page_size + 1])
+        has_more = len(items) > page_size
+        items = items[:page_size]
+        if reverse:
+            items.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_link = None
+        self.previous_link = None
+        if items:
+            if has_next:
+                self.next_link = self.encode_cursor(False, items[-1])
+            if has_previous:
+                self.previous_link = self.encode_cursor(True, items[0])
+        elif cursor is not None:
+            # Пустая страница - возвращаемся к началу журнала
+            self.previous_link = remove_query_param(self.base_url, self.cursor_query_param)
+        return items
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.next_link,
+            'previous': self.previous_link,
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class OptionalPageNumberPagination(PageNumberPagination):
+    """Постраничный вывод только по запросу (?page= или ?page_size=)
+
+    Без параметров список возвращается целиком, как раньше.
+    """
+
+    page_size = 100
+    max_page_size = 1000
+    page_size_query_param = 'page_size'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.page_query_param not in request.query_params and self.page_size_query_param not in request.query_params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
@@ -1,5 +1,20 @@
 import struct
-from typing import List, Tuple, Optional
+from functools import lru_cache
+from typing import List, Optional
+
+
+class Frame:
+    """Принятый фрейм; data - memoryview на принятые байты без копирования"""
+
+    __slots__ = ('board_addr', 'cmd', 'data')
+
+    def __init__(self, board_addr: int, cmd: int, data: memoryview):
+        self.board_addr = board_addr
+        self.cmd = cmd
+        self.data = data
+
+    def __repr__(self):
+        return f"Frame(board_addr={self.board_addr}, cmd=0x{self.cmd:02X}, data={bytes(self.data).hex()})"
 
 
 class VoungProtocol:
@@ -7,6 +22,19 @@ class VoungProtocol:
 
     START_CHARS = b'WKLY'
 
+    # 4 (start) + 1 (len) + 1 (addr) + 1 (cmd) + data + 1 (xor)
+    FRAME_OVERHEAD = 8
+    MAX_DATA_LENGTH = 0xFF - FRAME_OVERHEAD
+
+    # Фрейм целиком по длине данных - один pack() без склеивания байтов
+    FRAME_STRUCTS = [struct.Struct(f'>4sBBB{size}sB') for size in range(MAX_DATA_LENGTH + 1)]
+
+    # XOR маркера, чтобы не считать его для каждого фрейма
+    START_XOR = START_CHARS[0] ^ START_CHARS[1] ^ START_CHARS[2] ^ START_CHARS[3]
+
+    # С этой длины XOR свёрткой целого быстрее цикла по байтам
+    XOR_FOLD_MIN_LENGTH = 64
+
     # Команды
     CMD_HEARTBEAT = 0x80
     CMD_REGISTER = 0x81
@@ -20,62 +48,192 @@ class VoungProtocol:
     CMD_CLOSE_CHANNEL = 0x89
     CMD_SIGNAL_QUALITY = 0xD0
 
+    # Команды, на которые плата отвечает фреймом с тем же кодом
+    RESPONSE_COMMANDS = frozenset(range(CMD_OPEN_SINGLE, CMD_CLOSE_CHANNEL + 1)) - {CMD_STATUS_CHANGE}
+
+    # Статусы ответа
+    STATUS_OK = 0x00
+    STATUS_ERROR = 0xFF
+
     @staticmethod
     def compute_xor(data: bytes) -> int:
-        """Вычисление XOR контрольной суммы"""
-        result = 0
-        for byte in data:
-            result ^= byte
-        return result
+        """Вычисление XOR контрольной суммы
+
+        Длинные данные читаются одним целым числом и складываются сдвигом
+        (log2(N) операций над целыми вместо N итераций). Для коротких
+        фреймов цикл по байтам быстрее.
+        """
+        size = len(data)
+        if size < VoungProtocol.XOR_FOLD_MIN_LENGTH:
+            result = 0
+            for byte in data:
+                result ^= byte
+            return result
+
+        value = int.from_bytes(data, 'little')
+        shift = 8
+        while shift < size << 3:
+            shift <<= 1
+        while shift > 8:
+            shift >>= 1
+            value ^= value >> shift
+        return value & 0xFF
 
     @staticmethod
     def create_frame(board_addr: int, cmd: int, data: bytes = b'') -> bytes:
         """Создание фрейма команды"""
-        frame_length = 8 + len(data)  # 4 (start) + 1 (len) + 1 (addr) + 1 (cmd) + data + 1 (xor)
-
-        frame = VoungProtocol.START_CHARS
-        frame += struct.pack('B', frame_length)
-        frame += struct.pack('B', board_addr)
-        frame += struct.pack('B', cmd)
-        frame += data
-
-        xor_byte = VoungProtocol.compute_xor(frame)
-        frame += struct.pack('B', xor_byte)
-
-        return frame
+        if type(data) is not bytes:
+            data = bytes(data)
+        size = len(data)
+        frame_length = size + VoungProtocol.FRAME_OVERHEAD
+        xor_byte = VoungProtocol.START_XOR ^ frame_length ^ board_addr ^ cmd ^ VoungProtocol.compute_xor(data)
+        return VoungProtocol.FRAME_STRUCTS[size].pack(
+            VoungProtocol.START_CHARS, frame_length, board_addr, cmd, data, xor_byte
+        )
 
     @staticmethod
-    def parse_frame(data: bytes) -> Optional[dict]:
-        """Парсинг фрейма"""
-        if len(data) < 8:
+    def parse_frame(data: bytes) -> Optional[Frame]:
+        """Парсинг фрейма
+
+        Данные фрейма - срез memoryview над data без копирования, поэтому
+        data не должна изменяться, пока фрейм используется.
+        """
+        if len(data) < VoungProtocol.FRAME_OVERHEAD:
             return None
 
         if data[:4] != VoungProtocol.START_CHARS:
             return None
 
         frame_length = data[4]
-        if len(data) < frame_length:
+        if len(data) < frame_length or frame_length < VoungProtocol.FRAME_OVERHEAD:
             return None
 
         board_addr = data[5]
         cmd = data[6]
-        data_field = data[7:frame_length - 1]
-        xor_received = data[frame_length - 1]
+        payload = memoryview(data)[7:frame_length - 1]
 
-        # Проверка контрольной суммы
-        xor_calculated = VoungProtocol.compute_xor(data[:frame_length - 1])
-        if xor_received != xor_calculated:
+        # Проверка контрольной суммы (XOR маркера уже известен)
+        xor_calculated = VoungProtocol.START_XOR ^ frame_length ^ board_addr ^ cmd ^ VoungProtocol.compute_xor(payload)
+        if data[frame_length - 1] != xor_calculated:
             return None
 
-        return {
-            'board_addr': board_addr,
-            'cmd': cmd,
-            'data': data_field,
-            'valid': True
-        }
+        return Frame(board_addr, cmd, payload)
 
     @staticmethod
     def create_response(board_addr: int, cmd: int, status: int = 0x00, data: bytes = b'') -> bytes:
         """Создание ответа"""
-        response_data = struct.pack('B', status) + data
-        return VoungProtocol.create_frame(board_addr, cmd, response_data)
\ No newline at end of file
+        if not data:
+            return VoungProtocol.cached_response(board_addr, cmd, status)
+        return VoungProtocol.create_frame(board_addr, cmd, bytes((status,)) + data)
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def cached_response(board_addr: int, cmd: int, status: int = 0x00) -> bytes:
+        """Ответ из одного байта статуса (ACK heartbeat и регистрации), один на адрес платы"""
+        return VoungProtocol.create_frame(board_addr, cmd, bytes((status,)))
+
+    @staticmethod
+    def parse_lock_status(data: bytes, channel: int) -> Optional[int]:
+        """Статус замка из ответа на CMD_READ_STATUS (канал, статус): 0 - открыт, 1 - закрыт
+
+        None, если ответ короче или относится к другому каналу.
+        """
+        if len(data) < 2 or data[0] != channel:
+            return None
+        return 0 if data[1] == 0 else 1
+
+    @staticmethod
+    def parse_channel_states(data: bytes, channels: int) -> Optional[bytes]:
+        """Статусы каналов из ответа на CMD_READ_ALL_STATUS (0 - открыт, 1 - закрыт)
+
+        Плата отвечает байтом на канал либо битовой упаковкой (младший бит
+        первого байта - канал 1, установленный бит - закрыт). None, если
+        длина данных не подходит ни под один формат.
+        """
+        if len(data) == channels:
+            return bytes(0 if status == 0 else 1 for status in data)
+        if len(data) == (channels + 7) // 8:
+            return bytes(data[index >> 3] >> (index & 7) & 1 for index in range(channels))
+        return None
+
+
+class FrameDecoder:
+    """Потоковый декодер фреймов Voung для одного TCP соединения
+
+    Накапливает данные в переиспользуемом буфере и за каждый вызов feed()
+    возвращает все полностью принятые фреймы. Неполный хвост остаётся в
+    буфере до следующего чтения, мусор перед маркером WKLY отбрасывается.
+    """
+
+    MAX_BUFFER_SIZE = 4096
+    MIN_FRAME_LENGTH = 8
+
+    def __init__(self, max_buffer_size: int = MAX_BUFFER_SIZE):
+        self.max_buffer_size = max_buffer_size
+        self._buffer = bytearray()
+        self.discarded_bytes = 0  # отброшено байт мусора за всё время
+        self.invalid_frames = 0  # фреймов с неверной длиной или XOR
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """Добавление принятых данных и извлечение всех полных фреймов
+
+        Фреймы ссылаются на неизменяемые байты: на принятый блок, если
+        буфер был пуст (обычный случай, без копирования), иначе на одну
+        копию буфера на вызов. Хвост сохраняется в буфере.
+        """
+        buffer = self._buffer
+        if buffer or not isinstance(data, bytes):
+            buffer += data
+            data = bytes(buffer)
+        frames = []
+        size = len(data)
+        pos = 0
+
+        view = memoryview(data)
+        while True:
+            start = data.find(VoungProtocol.START_CHARS, pos)
+            if start < 0:
+                # Оставляем хвост, который может оказаться началом маркера
+                tail = max(pos, size - len(VoungProtocol.START_CHARS) + 1)
+                self.discarded_bytes += tail - pos
+                pos = tail
+                break
+
+            self.discarded_bytes += start - pos
+            pos = start
+            if size - pos < self.MIN_FRAME_LENGTH:
+                break
+
+            frame_length = data[pos + 4]
+            if frame_length < self.MIN_FRAME_LENGTH:
+                self.invalid_frames += 1
+                pos += 1
+                continue
+            if size - pos < frame_length:
+                break
+
+            frame = VoungProtocol.parse_frame(view[pos:pos + frame_length])
+            if frame is None:
+                # Ложный маркер или битый фрейм - ищем следующий WKLY
+                self.invalid_frames += 1
+                pos += 1
+                continue
+
+            frames.append(frame)
+            pos += frame_length
+
+        buffer[:] = view[pos:]
+
+        if len(buffer) > self.max_buffer_size:
+            self.discarded_bytes += len(buffer)
+            buffer.clear()
+
+        return frames
+
+    @property
+    def buffered(self) -> int:
+        """Количество байт, ожидающих окончания фрейма"""
+        return len(self._buffer)
+
+    def reset(self):
+        self._buffer.clear()
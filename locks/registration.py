@@ -0,0 +1,229 @@
+import asyncio
+import logging
+import math
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .db import DBExecutor
+from .models import Lock, LockBoard
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_FIELDS = ['device_type', 'ccid', 'board_address', 'is_online', 'last_heartbeat', 'ip_address']
+# Поля известной платы из повторной регистрации: онлайн и heartbeat пишут flush_presence и отключение
+UPDATE_FIELDS = ['device_type', 'ccid', 'board_address', 'ip_address']
+
+
+class TokenBucket:
+    """Ограничение частоты: rate в секунду со всплеском до burst"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class RegistrationQueue:
+    """Пакетная запись регистраций плат
+
+    Известные реестру платы подтверждаются сразу, в БД уходят только
+    изменившиеся поля (update) одной пачкой. Новые платы ждут записи:
+    все регистрации окна пишутся одной транзакцией (платы и их замки
+    двумя bulk_create), а частота допуска новых плат ограничена
+    TokenBucket - сверх неё плата получает NACK и повторяет регистрацию.
+
+    Попутно измеряет, за сколько секунд после запуска сервера
+    зарегистрировались 50/90/100% плат, работавших до перезапуска.
+    """
+
+    MILESTONES = (50, 90, 100)
+
+    def __init__(self, db: DBExecutor, flush_interval: float = None, batch_size: int = None,
+                 rate: float = None, burst: int = None):
+        self.db = db
+        self.flush_interval = flush_interval or settings.LOCK_REGISTRATION_FLUSH_INTERVAL
+        self.batch_size = batch_size or settings.LOCK_REGISTRATION_BATCH_SIZE
+        self.bucket = TokenBucket(rate or settings.LOCK_REGISTRATION_RATE, burst or settings.LOCK_REGISTRATION_BURST)
+        self.pending = {}  # device_id -> (поля, [future])
+        self.updates = {}  # pk -> изменившиеся поля известной платы
+        self._wakeup = asyncio.Event()
+
+        # Статистика
+        self.started = time.monotonic()
+        self.expected = 0  # плат с heartbeat незадолго до запуска
+        self.registered = set()  # device_id, зарегистрированные после запуска
+        self.fleet_times = {}  # процент плат -> сек от запуска
+        self.known = 0  # подтверждено по реестру без ожидания БД
+        self.written = 0  # записано новых для реестра плат
+        self.rejected = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.max_batch = 0
+        self.last_flush_latency = 0.0
+
+    def start(self, expected: int):
+        self.started = time.monotonic()
+        self.expected = expected
+        self.registered.clear()
+        self.fleet_times.clear()
+
+    @staticmethod
+    def recent_boards(timeout: float) -> int:
+        """Платы, работавшие перед запуском: онлайн в БД или с недавним heartbeat"""
+        return LockBoard.objects.filter(
+            Q(is_online=True) | Q(last_heartbeat__gte=timezone.now() - timedelta(seconds=timeout))
+        ).count()
+
+    def admit(self) -> bool:
+        """Допуск новой платы по TokenBucket"""
+        if self.bucket.take():
+            return True
+        self.rejected += 1
+        return False
+
+    async def register(self, device_id: str, fields: dict):
+        """Запись новой платы в ближайшей пачке, возвращает (плата, замки)"""
+        future = asyncio.get_running_loop().create_future()
+        entry = self.pending.get(device_id)
+        if entry:
+            # Повторная регистрация до записи - ждём ту же пачку с новыми полями
+            self.pending[device_id] = (fields, entry[1] + [future])
+        else:
+            self.pending[device_id] = (fields, [future])
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+        return await future
+
+    def update(self, pk: int, fields: dict):
+        """Изменившиеся поля известной платы, без ожидания записи
+
+        В пачку попадают только UPDATE_FIELDS: запись онлайн из регистрации
+        могла бы выполниться после отключения платы и вернуть её в онлайн.
+        """
+        self.updates[pk] = {name: fields[name] for name in UPDATE_FIELDS}
+
+    def mark_registered(self, device_id: str, known: bool):
+        self.known += known
+        self.registered.add(device_id)
+        if not self.expected:
+            return
+        for percent in self.MILESTONES:
+            if percent not in self.fleet_times and len(self.registered) >= math.ceil(self.expected * percent / 100):
+                self.fleet_times[percent] = time.monotonic() - self.started
+                logger.info(
+                    f"Зарегистрировано {percent}% плат ({len(self.registered)} из {self.expected}) "
+                    f"через {self.fleet_times[percent]:.1f} сек после запуска"
+                )
+
+    @staticmethod
+    def new_locks(board: LockBoard) -> list:
+        return [
+            Lock(board=board, channel=channel, name=f"Lock {channel}", status=1)  # Закрыт по умолчанию
+            for channel in range(1, board.total_channels + 1)
+        ]
+
+    @staticmethod
+    def write(registrations: dict, updates: dict) -> dict:
+        """Запись пачки одной транзакцией, возвращает device_id -> (плата, замки)"""
+        with transaction.atomic():
+            boards = {board.device_id: board for board in LockBoard.objects.filter(device_id__in=registrations)}
+            for device_id, board in boards.items():
+                for name, value in registrations[device_id].items():
+                    setattr(board, name, value)
+            LockBoard.objects.bulk_update(boards.values(), REGISTRATION_FIELDS, batch_size=500)
+
+            created = [LockBoard(device_id=device_id, **fields)
+                       for device_id, fields in registrations.items() if device_id not in boards]
+            LockBoard.objects.bulk_create(created, batch_size=500)
+            if any(board.pk is None for board in created):
+                created = list(LockBoard.objects.filter(device_id__in=[board.device_id for board in created]))
+            Lock.objects.bulk_create([lock for board in created for lock in RegistrationQueue.new_locks(board)],
+                                     batch_size=500)
+            boards.update((board.device_id, board) for board in created)
+
+            if updates:
+                LockBoard.objects.bulk_update(
+                    [LockBoard(pk=pk, **fields) for pk, fields in updates.items()], UPDATE_FIELDS, batch_size=500
+                )
+
+            # Замки всех плат пачки одним запросом, в том числе созданных в обход реестра
+            locks = {board.pk: [] for board in boards.values()}
+            for lock in Lock.objects.filter(board_id__in=locks).only('pk', 'board', 'channel', 'status'):
+                locks[lock.board_id].append(lock)
+        return {device_id: (board, locks[board.pk]) for device_id, board in boards.items()}
+
+    async def flush(self):
+        if not self.pending and not self.updates:
+            return
+
+        if len(self.pending) > self.batch_size:
+            # Пачка не больше batch_size, остаток - сразу следующей
+            items = list(self.pending.items())
+            batch, self.pending = dict(items[:self.batch_size]), dict(items[self.batch_size:])
+            self._wakeup.set()
+        else:
+            batch, self.pending = self.pending, {}
+        updates, self.updates = self.updates, {}
+        started = time.monotonic()
+        try:
+            results = await self.db.run_sync(
+                DBExecutor.COMMAND, self.write, {device_id: entry[0] for device_id, entry in batch.items()}, updates
+            )
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Ошибка при записи {len(batch)} регистраций и {len(updates)} изменений плат: {e}")
+            for _, futures in batch.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            # Изменения известных плат повторяются следующей пачкой
+            for pk, fields in updates.items():
+                self.updates.setdefault(pk, fields)
+            return
+
+        self.flushes += 1
+        self.written += len(batch)
+        self.max_batch = max(self.max_batch, len(batch) + len(updates))
+        self.last_flush_latency = time.monotonic() - started
+        for device_id, (_, futures) in batch.items():
+            for future in futures:
+                if not future.done():
+                    future.set_result(results[device_id])
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'expected': self.expected,
+            'registered': len(self.registered),
+            **{f"fleet_{percent}_sec": round(self.fleet_times[percent], 2) if percent in self.fleet_times else None
+               for percent in self.MILESTONES},
+            'known': self.known,
+            'written': self.written,
+            'rejected': self.rejected,
+            'pending': len(self.pending),
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'max_batch': self.max_batch,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 2),
+        }
@@ -17,6 +17,7 @@ class LockBoardSerializer(serializers.ModelSerializer):
     class Meta:
         model = LockBoard
         fields = '__all__'
+        read_only_fields = ['open_channels', 'channel_state_at']
         ref_name = "test1"
 
 
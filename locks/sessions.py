@@ -0,0 +1,168 @@
+import bisect
+import time
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+# Верхние границы корзин гистограммы RTT, сек (последняя корзина - всё, что дольше)
+RTT_BOUNDS = (
+    0.001, 0.002, 0.003, 0.005, 0.0075, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1,
+    0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0,
+)
+
+
+class RttHistogram:
+    """Гистограмма времени ответа с фиксированными корзинами
+
+    Запись - поиск корзины и инкремент, память не растёт с числом команд.
+    Перцентиль - верхняя граница корзины, в которую он попал (не больше
+    наблюдавшегося максимума).
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(RTT_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(RTT_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, percent: float):
+        if not self.count:
+            return None
+        rank = max(1, percent / 100 * self.count)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(RTT_BOUNDS[index], self.max) if index < len(RTT_BOUNDS) else self.max
+        return self.max
+
+
+def milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def isoformat(seconds):
+    """Время time.time() в TIME_ZONE и формате остальных дат API (DjangoJSONEncoder)"""
+    if seconds is None:
+        return None
+    moment = timezone.localtime(datetime.fromtimestamp(seconds, tz=dt_timezone.utc))
+    if not settings.USE_TZ:
+        moment = moment.replace(tzinfo=None)
+    return DjangoJSONEncoder().default(moment)
+
+
+class ClientSession:
+    """Состояние и счётчики одного TCP соединения платы
+
+    Счётчики обновляются в цикле событий простыми инкрементами, а словарь
+    для отладочного API собирается только по запросу (as_dict).
+    Отправленные фреймы и байты берутся из OutboundQueue соединения.
+    """
+
+    __slots__ = ('peer', 'connected_at', 'device_id', 'outbound', 'frames_in', 'bytes_in', 'parse_errors',
+                 'discarded_bytes', 'last_heartbeat', 'commands', 'command_failures', 'command_timeouts', 'rtt')
+
+    def __init__(self, peer, outbound=None):
+        self.peer = peer  # (ip, port)
+        self.connected_at = time.time()
+        self.device_id = None  # после регистрации
+        self.outbound = outbound
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.parse_errors = 0  # блоков мусора между фреймами
+        self.discarded_bytes = 0
+        self.last_heartbeat = None  # time.time()
+        self.commands = 0
+        self.command_failures = 0  # ошибка платы, таймаут или обрыв
+        self.command_timeouts = 0  # попыток без ответа
+        self.rtt = RttHistogram()
+
+    def command_done(self, result: dict):
+        self.commands += 1
+        if result['latency'] is not None:
+            self.rtt.observe(result['latency'])
+        if not result['success']:
+            self.command_failures += 1
+
+    def as_dict(self, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        outbound = self.outbound.stats() if self.outbound is not None else {}
+        return {
+            'device_id': self.device_id,
+            'ip': self.peer[0] if self.peer else None,
+            'port': self.peer[1] if self.peer else None,
+            'connected_at': isoformat(self.connected_at),
+            'uptime_sec': round(now - self.connected_at, 1),
+            'frames_in': self.frames_in,
+            'bytes_in': self.bytes_in,
+            'frames_out': outbound.get('sent_frames', 0),
+            'bytes_out': outbound.get('sent_bytes', 0),
+            'parse_errors': self.parse_errors,
+            'discarded_bytes': self.discarded_bytes,
+            'last_heartbeat': isoformat(self.last_heartbeat),
+            'heartbeat_age_sec': round(now - self.last_heartbeat, 1) if self.last_heartbeat else None,
+            'queue_frames': outbound.get('queued_frames', 0),
+            'queue_bytes': outbound.get('queued_bytes', 0),
+            'dropped_frames': outbound.get('dropped_frames', 0),
+            'commands': self.commands,
+            'command_failures': self.command_failures,
+            'command_timeouts': self.command_timeouts,
+            'rtt_p50_ms': milliseconds(self.rtt.percentile(50)),
+            'rtt_p90_ms': milliseconds(self.rtt.percentile(90)),
+            'rtt_p99_ms': milliseconds(self.rtt.percentile(99)),
+            'rtt_max_ms': milliseconds(self.rtt.max if self.rtt.count else None),
+            'rtt_avg_ms': milliseconds(self.rtt.total / self.rtt.count if self.rtt.count else None),
+        }
+
+
+# Поля, по которым можно сортировать список соединений
+SESSION_ORDERING = (
+    'device_id', 'ip', 'connected_at', 'uptime_sec', 'frames_in', 'bytes_in', 'frames_out', 'bytes_out',
+    'parse_errors', 'discarded_bytes', 'heartbeat_age_sec', 'queue_frames', 'queue_bytes', 'dropped_frames',
+    'commands', 'command_failures', 'command_timeouts', 'rtt_p50_ms', 'rtt_p90_ms', 'rtt_p99_ms', 'rtt_max_ms',
+    'rtt_avg_ms',
+)
+
+
+def filter_sessions(items: list, query: dict) -> list:
+    """Отбор словарей соединений по фильтрам запроса"""
+    device_id = query.get('device_id')
+    ip = query.get('ip')
+    registered = query.get('registered')
+    min_rtt = query.get('min_rtt_ms')
+    if device_id:
+        items = [item for item in items if item['device_id'] and item['device_id'].startswith(device_id)]
+    if ip:
+        items = [item for item in items if item['ip'] == ip]
+    if registered is not None:
+        items = [item for item in items if (item['device_id'] is not None) == registered]
+    if min_rtt is not None:
+        items = [item for item in items if item['rtt_p99_ms'] is not None and item['rtt_p99_ms'] >= min_rtt]
+    return items
+
+
+def order_sessions(items: list, ordering: str = None) -> list:
+    """Сортировка по полю (-поле - по убыванию), без значения - в конце"""
+    ordering = ordering or 'connected_at'
+    field = ordering.lstrip('-')
+    present = [item for item in items if item[field] is not None]
+    missing = [item for item in items if item[field] is None]
+    present.sort(key=lambda item: item[field], reverse=ordering.startswith('-'))
+    return present + missing
+
+
+def query_sessions(items: list, query: dict) -> dict:
+    """Отбор, сортировка и страница: {'count': всего после фильтров, 'results': страница}"""
+    items = order_sessions(filter_sessions(items, query), query.get('ordering'))
+    offset = query.get('offset', 0)
+    return {'count': len(items), 'results': items[offset:offset + query.get('limit', len(items))]}
@@ -0,0 +1,73 @@
+import asyncio
+import threading
+import time
+
+
+class SingleFlight:
+    """Объединение одновременных одинаковых запросов
+
+    Пока запрос по ключу выполняется, остальные вызовы с тем же ключом
+    ждут его результат вместо отправки своего. Успешный результат
+    (result['success']) дополнительно отдаётся без выполнения в течение
+    ttl секунд, если ключ не сброшен через invalidate().
+
+    Future привязаны к циклу событий, а под WSGI и в runserver каждый
+    поток выполняет асинхронные представления в своём цикле
+    (async_to_sync), поэтому выполняющиеся запросы объединяются в пределах
+    цикла, а общие словари защищены блокировкой.
+    """
+
+    def __init__(self, ttl: float = 0):
+        self.ttl = ttl
+        self.inflight = {}  # (цикл событий, ключ) -> future выполняющегося запроса
+        self.results = {}  # ключ -> (time.monotonic() получения, результат)
+        self.stale = set()  # выполняющиеся запросы, сброшенные invalidate(), - не кэшируются
+        self.executed = 0
+        self.shared = 0
+        self.cached = 0
+        self._lock = threading.Lock()
+
+    async def do(self, key, func) -> dict:
+        """Результат func() по ключу, общий для одновременных вызовов"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            cached = self.results.get(key)
+            if cached and time.monotonic() - cached[0] <= self.ttl:
+                self.cached += 1
+                return dict(cached[1])
+
+            future = self.inflight.get((loop, key))
+            if future is None:
+                future = self.inflight[(loop, key)] = asyncio.ensure_future(func())
+                future.add_done_callback(lambda done: self._complete(loop, key, done))
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        # Отмена одного ожидающего не должна прерывать запрос для остальных
+        return dict(await asyncio.shield(future))
+
+    def _complete(self, loop, key, future: asyncio.Future):
+        with self._lock:
+            if self.inflight.get((loop, key)) is future:
+                del self.inflight[(loop, key)]
+            if future in self.stale:
+                self.stale.discard(future)
+                return
+            if self.ttl > 0 and not future.cancelled() and future.exception() is None and future.result()['success']:
+                self.results[key] = (time.monotonic(), future.result())
+
+    def invalidate(self, key):
+        """Сброс сохранённого результата, например после изменения статуса"""
+        with self._lock:
+            self.results.pop(key, None)
+            self.stale.update(future for (_, flight_key), future in self.inflight.items() if flight_key == key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'inflight': len(self.inflight),
+                'executed': self.executed,
+                'shared': self.shared,
+                'cached': self.cached,
+            }
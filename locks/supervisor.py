@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+import signal
+import sys
+from django.conf import settings
+from .events import EventHub
+from .sessions import order_sessions
+from .command_bus import (
+    CommandBusServer, CommandBusClient, error_result, ok_result,
+    OP_COMMAND, OP_INVALIDATE_BOARD, OP_CLAIM_BOARD, OP_RELEASE_BOARD, OP_STATS, OP_CONNECTIONS, OP_DIAGNOSTICS,
+    OP_BOARD_STATES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def worker_socket_path(index: int) -> str:
+    return f"{settings.LOCK_COMMAND_SOCKET}.{index}"
+
+
+class WorkerSupervisor:
+    """Супервизор рабочих процессов TCP сервера
+
+    Запускает N процессов start_tcp_server на одном порту (SO_REUSEPORT),
+    перезапускает упавшие и ведёт карту владения платами. Веб-процессы
+    подключаются к шине команд супервизора, а он пересылает команду
+    процессу, которому принадлежит соединение с платой, и объединяет
+    события рабочих процессов в один поток.
+    """
+
+    RESTART_DELAY = 1.0
+    MAX_RESTART_DELAY = 30.0
+
+    def __init__(self, workers: int, host: str, port: int):
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.owners = {}  # device_id -> индекс рабочего процесса
+        self.last_owners = {}  # device_id -> индекс процесса, последним державшего плату (его запись реестра свежее)
+        self.processes = {}  # индекс -> asyncio.subprocess.Process
+        self.worker_buses = {index: CommandBusClient(worker_socket_path(index)) for index in range(workers)}
+        self.command_bus = None
+        self.events = EventHub()  # общий поток событий всех рабочих процессов
+        self.stopping = False
+
+    async def spawn(self, index: int):
+        # sys.argv[0] - manage.py, через который запущен супервизор
+        return await asyncio.create_subprocess_exec(
+            sys.executable, sys.argv[0], 'start_tcp_server',
+            '--host', self.host,
+            '--port', str(self.port),
+            '--worker-index', str(index),
+        )
+
+    async def supervise(self, index: int):
+        delay = self.RESTART_DELAY
+        while not self.stopping:
+            process = self.processes[index] = await self.spawn(index)
+            logger.info(f"Рабочий процесс {index} запущен (pid {process.pid})")
+            started = asyncio.get_running_loop().time()
+            code = await process.wait()
+
+            self.release_worker(index)
+            if self.stopping:
+                break
+
+            # Сбрасываем задержку, если процесс проработал достаточно долго
+            if asyncio.get_running_loop().time() - started > self.MAX_RESTART_DELAY:
+                delay = self.RESTART_DELAY
+            logger.error(f"Рабочий процесс {index} завершился с кодом {code}, перезапуск через {delay:.0f} сек")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_RESTART_DELAY)
+
+    def release_worker(self, index: int):
+        """Снятие владения всеми платами упавшего процесса"""
+        for device_id in [device_id for device_id, owner in self.owners.items() if owner == index]:
+            del self.owners[device_id]
+        self.worker_buses[index].close()
+
+    async def relay_events(self, index: int):
+        """Пересылка событий рабочего процесса в общий поток супервизора"""
+        last_seq, last_epoch = None, None
+        while not self.stopping:
+            try:
+                # После перезапуска процесса эпоха другая: он пришлёт reset и всю свою историю
+                async for event in self.worker_buses[index].subscribe(since=last_seq, epoch=last_epoch):
+                    if 'seq' not in event:
+                        continue  # служебные reset и dropped относятся только к этому соединению
+                    last_seq, last_epoch = event['seq'], event['epoch']
+                    self.events.dispatch(event)
+            except OSError:
+                pass
+            await asyncio.sleep(self.RESTART_DELAY)
+
+    async def handle_bus_request(self, op: int, device_id: str, cmd: int, data: bytes, timeout: float) -> dict:
+        if op == OP_CLAIM_BOARD:
+            self.owners[device_id] = self.last_owners[device_id] = data[0]
+            return ok_result()
+
+        if op == OP_RELEASE_BOARD:
+            if self.owners.get(device_id) == data[0]:
+                del self.owners[device_id]
+            return ok_result()
+
+        if op == OP_COMMAND:
+            owner = self.owners.get(device_id)
+            if owner is None:
+                return error_result('Плата не подключена')
+            return await self.worker_buses[owner].request(op, device_id, cmd, data, timeout)
+
+        if op == OP_INVALIDATE_BOARD:
+            results = await asyncio.gather(*[
+                bus.request(op, device_id, cmd, data, timeout) for bus in self.worker_buses.values()
+            ])
+            failed = [result['error'] for result in results if not result['success']]
+            if failed:
+                return error_result('; '.join(failed))
+            return results[0]
+
+        if op == OP_STATS:
+            return await self.counters()
+
+        if op == OP_CONNECTIONS:
+            return await self.connections(json.loads(data))
+
+        if op == OP_DIAGNOSTICS:
+            return await self.diagnostics()
+
+        return error_result(f'Неизвестная операция шины 0x{op:02X}')
+
+    async def counters(self) -> dict:
+        """Счётчики плат и замков для /api/statistics/ по реестрам рабочих процессов
+
+        Реестр каждого процесса загружен при его запуске и дальше меняется
+        только для подключённых к нему плат, поэтому замки платы берутся из
+        процесса, последним державшего её соединение, а платы, не
+        подключавшиеся с запуска супервизора, - из первого ответившего.
+        Онлайн - платы с соединением в каком-либо процессе.
+        """
+        results = await asyncio.gather(*[bus.request(OP_BOARD_STATES, '') for bus in self.worker_buses.values()])
+        states = {index: json.loads(result['data']) for index, result in zip(self.worker_buses, results)
+                  if result['success']}
+        if not states:
+            return error_result('; '.join(result['error'] for result in results))
+
+        boards = {}
+        for index, worker_states in states.items():
+            for device_id, state in worker_states.items():
+                if device_id not in boards or self.last_owners.get(device_id) == index:
+                    boards[device_id] = state
+        online = sum(1 for device_id in self.owners if device_id in boards)
+        total_locks = sum(state[0] for state in boards.values())
+        open_locks = sum(state[1] for state in boards.values())
+        counters = {
+            'boards': {'total': len(boards), 'online': online, 'offline': len(boards) - online},
+            'locks': {'total': total_locks, 'open': open_locks, 'closed': total_locks - open_locks},
+        }
+        return ok_result(data=json.dumps(counters).encode())
+
+    async def connections(self, query: dict) -> dict:
+        """Страница соединений всех рабочих процессов
+
+        Каждый процесс отбирает и сортирует свои соединения и отдаёт первые
+        offset + limit, из их объединения вырезается запрошенная страница.
+        """
+        offset = query.get('offset', 0)
+        worker_query = {**query, 'offset': 0}
+        if 'limit' in query:
+            worker_query['limit'] = offset + query['limit']
+        results = await asyncio.gather(*[
+            bus.request(OP_CONNECTIONS, '', data=json.dumps(worker_query).encode())
+            for bus in self.worker_buses.values()
+        ])
+        pages = [json.loads(result['data']) for result in results if result['success']]
+        if not pages:
+            return error_result('; '.join(result['error'] for result in results))
+
+        items = order_sessions([item for page in pages for item in page['results']], query.get('ordering'))
+        end = offset + query['limit'] if 'limit' in query else None
+        connections = {'count': sum(page['count'] for page in pages), 'results': items[offset:end]}
+        return ok_result(data=json.dumps(connections).encode())
+
+    async def diagnostics(self) -> dict:
+        """Метрики рабочих процессов по индексам, null - процесс не ответил"""
+        results = await asyncio.gather(*[bus.request(OP_DIAGNOSTICS, '') for bus in self.worker_buses.values()])
+        workers = {index: json.loads(result['data']) if result['success'] else None
+                   for index, result in zip(self.worker_buses, results)}
+        diagnostics = {'workers': workers, 'owned_boards': len(self.owners)}
+        return ok_result(data=json.dumps(diagnostics).encode())
+
+    async def run(self):
+        self.command_bus = CommandBusServer(self)
+        await self.command_bus.start()
+        logger.info(f"Супервизор запускает {self.workers} рабочих процессов на {self.host}:{self.port}")
+
+        tasks = [asyncio.create_task(self.supervise(index)) for index in range(self.workers)]
+        relays = [asyncio.create_task(self.relay_events(index)) for index in range(self.workers)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            self.stopping = True
+            for process in self.processes.values():
+                if process.returncode is None:
+                    process.send_signal(signal.SIGINT)
+            await asyncio.gather(*[process.wait() for process in self.processes.values()], return_exceptions=True)
+            for task in tasks + relays:
+                task.cancel()
+            await self.command_bus.close()
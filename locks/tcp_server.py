@@ -1,11 +1,244 @@
 import asyncio
+import itertools
+import json
 import logging
+import time
+from collections import deque
+from django.conf import settings
+from django.db.models import Case, When, Value, DateTimeField
 from django.utils import timezone
 from .models import LockBoard, Lock
-from .protocol import VoungProtocol
+from .protocol import VoungProtocol, Frame, FrameDecoder
+from .writers import StatusWriteQueue
+from .db import DBExecutor, DBOverloaded
+from .registration import RegistrationQueue
+from .outbound import OutboundQueue, OutboundQueueFull
+from .watchdog import HeartbeatWatchdog
+from .events import EventHub
+from .singleflight import SingleFlight
+from .sessions import ClientSession, query_sessions
+from .command_bus import (
+    CommandBusServer, command_bus, error_result, ok_result,
+    OP_COMMAND, OP_INVALIDATE_BOARD, OP_CLAIM_BOARD, OP_RELEASE_BOARD, OP_STATS, OP_CONNECTIONS, OP_DIAGNOSTICS,
+    OP_BOARD_STATES,
+)
+
+# Команды, адресованные одному каналу (номер канала - первый байт данных)
+CHANNEL_COMMANDS = frozenset((
+    VoungProtocol.CMD_OPEN_SINGLE, VoungProtocol.CMD_READ_STATUS,
+    VoungProtocol.CMD_KEEP_OPEN, VoungProtocol.CMD_CLOSE_CHANNEL,
+))
 
 logger = logging.getLogger(__name__)
 
+
+class BoardRecord:
+    """Компактная запись платы в реестре TCP сервера"""
+
+    __slots__ = ('pk', 'device_id', 'board_address', 'total_channels', 'is_online', 'lock_ids', 'statuses',
+                 'registration')
+
+    def __init__(self, pk, device_id, board_address, total_channels, is_online=False, registration=None):
+        self.pk = pk
+        self.device_id = device_id
+        self.board_address = board_address
+        self.total_channels = total_channels
+        self.is_online = is_online
+        self.registration = registration  # (device_type, ccid, ip_address) из БД
+        self.lock_ids = [None] * total_channels  # канал - 1 -> pk замка
+        self.statuses = bytearray(b'\x01' * total_channels)  # канал - 1 -> статус замка
+
+    def set_lock(self, channel: int, lock_id: int, status: int):
+        if 1 <= channel <= self.total_channels:
+            self.lock_ids[channel - 1] = lock_id
+            self.statuses[channel - 1] = status
+
+    def lock_id(self, channel: int):
+        if 1 <= channel <= self.total_channels:
+            return self.lock_ids[channel - 1]
+        return None
+
+    def lock_count(self) -> int:
+        return self.total_channels - self.lock_ids.count(None)
+
+    def open_count(self) -> int:
+        return sum(1 for lock_id, status in zip(self.lock_ids, self.statuses) if lock_id is not None and status == 0)
+
+    def open_mask(self) -> int:
+        return LockBoard.pack_open_channels(self.statuses)
+
+
+class BoardRegistry:
+    """Реестр плат процесса с индексами по device_id, адресу платы и соединению
+
+    Попутно ведёт счётчики онлайн плат и открытых замков, которые
+    обновляются при каждом изменении записи.
+    """
+
+    def __init__(self):
+        self.by_pk = {}  # pk -> BoardRecord
+        self.by_device = {}  # device_id -> BoardRecord
+        self.by_address = {}  # board_address -> {device_id: BoardRecord}
+        self.by_connection = {}  # writer -> BoardRecord
+        self.online_boards = 0
+        self.total_locks = 0
+        self.open_locks = 0
+
+    def __len__(self):
+        return len(self.by_device)
+
+    def __contains__(self, device_id):
+        return device_id in self.by_device
+
+    def get(self, device_id: str):
+        return self.by_device.get(device_id)
+
+    def get_by_address(self, board_address: int):
+        """Запись по адресу платы, если адрес однозначен"""
+        records = self.by_address.get(board_address)
+        if records and len(records) == 1:
+            return next(iter(records.values()))
+        return None
+
+    def get_by_connection(self, writer):
+        return self.by_connection.get(writer)
+
+    def load(self):
+        """Загрузка всех плат и замков из БД (синхронно)"""
+        self.by_pk.clear()
+        self.by_device.clear()
+        self.by_address.clear()
+        for board in LockBoard.objects.only('pk', 'device_id', 'board_address', 'total_channels', 'is_online',
+                                            'device_type', 'ccid', 'ip_address'):
+            self._index(BoardRecord(
+                board.pk, board.device_id, board.board_address, board.total_channels, board.is_online,
+                (board.device_type, board.ccid, board.ip_address)
+            ))
+        for board_id, lock_id, channel, status in Lock.objects.values_list('board_id', 'pk', 'channel', 'status'):
+            record = self.by_pk.get(board_id)
+            if record:
+                record.set_lock(channel, lock_id, status)
+        self.recount()
+        logger.info(f"Реестр плат загружен: {len(self)} плат")
+
+    def load_board(self, pk: int):
+        """Перечитывание одной платы из БД после её изменения (синхронно)"""
+        board = LockBoard.objects.filter(pk=pk).first()
+        if board is None:
+            self.remove(pk)
+            return None
+        record = self.update(board)
+        self.set_locks(record, Lock.objects.filter(board_id=pk).only('pk', 'channel', 'status'))
+        return record
+
+    def recount(self):
+        self.online_boards = sum(1 for record in self.by_pk.values() if record.is_online)
+        self.total_locks = sum(record.lock_count() for record in self.by_pk.values())
+        self.open_locks = sum(record.open_count() for record in self.by_pk.values())
+
+    def _account(self, record: BoardRecord, sign: int):
+        self.online_boards += sign * record.is_online
+        self.total_locks += sign * record.lock_count()
+        self.open_locks += sign * record.open_count()
+
+    def _index(self, record: BoardRecord):
+        self.by_pk[record.pk] = record
+        self.by_device[record.device_id] = record
+        self.by_address.setdefault(record.board_address, {})[record.device_id] = record
+
+    def _unindex(self, record: BoardRecord):
+        if self.by_device.get(record.device_id) is record:
+            del self.by_device[record.device_id]
+        records = self.by_address.get(record.board_address)
+        if records and records.get(record.device_id) is record:
+            del records[record.device_id]
+            if not records:
+                del self.by_address[record.board_address]
+
+    def add(self, record: BoardRecord):
+        self._index(record)
+        self._account(record, 1)
+
+    def remove(self, pk: int):
+        record = self.by_pk.pop(pk, None)
+        if record is None:
+            return None
+        self._unindex(record)
+        self._account(record, -1)
+        for writer in [writer for writer, rec in self.by_connection.items() if rec is record]:
+            del self.by_connection[writer]
+        return record
+
+    def update(self, board: LockBoard) -> BoardRecord:
+        """Добавление или обновление записи по экземпляру модели"""
+        record = self.by_pk.get(board.pk)
+        if record is None:
+            record = BoardRecord(
+                board.pk, board.device_id, board.board_address, board.total_channels, board.is_online,
+                (board.device_type, board.ccid, board.ip_address)
+            )
+            self.add(record)
+            return record
+
+        self._account(record, -1)
+        if record.device_id != board.device_id or record.board_address != board.board_address:
+            self._unindex(record)
+            record.device_id = board.device_id
+            record.board_address = board.board_address
+            self._index(record)
+        if record.total_channels != board.total_channels:
+            grow = board.total_channels - record.total_channels
+            if grow > 0:
+                record.lock_ids.extend([None] * grow)
+                record.statuses.extend(b'\x01' * grow)
+            else:
+                del record.lock_ids[board.total_channels:]
+                del record.statuses[board.total_channels:]
+            record.total_channels = board.total_channels
+        record.is_online = board.is_online
+        record.registration = (board.device_type, board.ccid, board.ip_address)
+        self._account(record, 1)
+        return record
+
+    def set_locks(self, record: BoardRecord, locks):
+        self._account(record, -1)
+        for lock in locks:
+            record.set_lock(lock.channel, lock.pk, lock.status)
+        self._account(record, 1)
+
+    def set_online(self, record: BoardRecord, is_online: bool):
+        if record.is_online != is_online:
+            record.is_online = is_online
+            self.online_boards += 1 if is_online else -1
+
+    def set_status(self, record: BoardRecord, channel: int, status: int):
+        index = channel - 1
+        if record.lock_ids[index] is not None and (record.statuses[index] == 0) != (status == 0):
+            self.open_locks += 1 if status == 0 else -1
+        record.statuses[index] = status
+
+    def counters(self) -> dict:
+        total_boards = len(self.by_pk)
+        return {
+            'boards': {
+                'total': total_boards,
+                'online': self.online_boards,
+                'offline': total_boards - self.online_boards
+            },
+            'locks': {
+                'total': self.total_locks,
+                'open': self.open_locks,
+                'closed': self.total_locks - self.open_locks
+            }
+        }
+
+    def attach(self, writer, record: BoardRecord):
+        self.by_connection[writer] = record
+
+    def detach(self, writer):
+        return self.by_connection.pop(writer, None)
+
+
 class LockControlServer:
     """TCP сервер для управления замками"""
 
@@ -13,52 +246,133 @@ class LockControlServer:
         self.host = host
         self.port = port
         self.clients = {}  # device_id -> (writer, board_instance)
+        self.registry = BoardRegistry()
+        self.outbound = {}  # writer -> OutboundQueue
+        self.sessions = {}  # writer -> ClientSession, все открытые соединения
+        self.watchdog = HeartbeatWatchdog(self.expire_connections)
+        self.pending = {}  # (device_id, cmd, канал) -> deque (номер, future) ожидающих ответа (pending_key)
+        self.pending_sequence = itertools.count()  # порядок ожидающих между каналами
+        self.command_timeout = settings.LOCK_COMMAND_TIMEOUT
+        self.command_retries = settings.LOCK_COMMAND_RETRIES
+        self.presence = {}  # device_id -> время heartbeat, ещё не записанное в БД
+        self.presence_writing = None  # (пачка heartbeat, future окончания записи) во время flush_presence
+        self.heartbeat_flush_interval = settings.LOCK_HEARTBEAT_FLUSH_INTERVAL
+        self.db = DBExecutor()  # все обращения к БД из цикла событий сервера
+        self.status_queue = StatusWriteQueue(self.db)
+        self.registrations = RegistrationQueue(self.db)
+        self.events = EventHub()  # события для подписчиков /api/events/
+        self.status_reads = SingleFlight(settings.LOCK_STATUS_READ_TTL)  # общий READ_ALL_STATUS на плату
+        self.is_running = False  # сервер запущен в текущем процессе
+        self.command_bus = None
+        self.command_socket = None  # по умолчанию settings.LOCK_COMMAND_SOCKET
+        self.worker_index = None  # номер рабочего процесса при запуске с --workers
+        self.reuse_port = False
+        self.background_tasks = set()
 
     async def handle_client(self, reader, writer):
         client_addr = writer.get_extra_info('peername')
         logger.info(f"Новое подключение от {client_addr}")
 
+        decoder = FrameDecoder()
+        outbound = self.outbound[writer] = OutboundQueue(writer).start()
+        session = self.sessions[writer] = ClientSession(client_addr, outbound)
+        self.watchdog.add(writer)
+
         try:
             while True:
                 data = await reader.read(1024)
                 if not data:
                     break
 
-                frame = VoungProtocol.parse_frame(data)
-                if not frame:
-                    logger.warning(f"Неверный фрейм от {client_addr}: {data.hex()}")
-                    continue
+                discarded = decoder.discarded_bytes
+                frames = decoder.feed(data)
+                session.bytes_in += len(data)
+                if decoder.discarded_bytes != discarded:
+                    session.parse_errors += 1
+                    session.discarded_bytes += decoder.discarded_bytes - discarded
+                    logger.warning(
+                        f"Отброшено {decoder.discarded_bytes - discarded} байт мусора от {client_addr}: {data.hex()}"
+                    )
+
+                if frames:
+                    # Любой корректный фрейм подтверждает, что соединение живо
+                    self.watchdog.touch(writer)
+                    session.frames_in += len(frames)
 
-                # Передаём writer в process_command
-                response = await self.process_command(frame, client_addr, writer)
-                if response:
-                    writer.write(response)
-                    await writer.drain()
+                for frame in frames:
+                    heartbeat = frame.cmd == VoungProtocol.CMD_HEARTBEAT
+                    if heartbeat:
+                        session.last_heartbeat = time.time()
+                    # Передаём writer в process_command
+                    response = await self.process_command(frame, client_addr, writer)
+                    if response:
+                        outbound.put(response, droppable=heartbeat)
 
         except asyncio.CancelledError:
             pass
         except Exception as e:
             logger.error(f"Ошибка при обработке клиента {client_addr}: {e}")
         finally:
+            # Соединение отвязывается до первого await: пока оно закрывается,
+            # execute_command уже не найдёт плату в clients и её очереди отправки
+            outbound.close()
+            del self.outbound[writer]
+            self.watchdog.remove(writer)
+            board = self.detach_connection(writer)
+            del self.sessions[writer]
             writer.close()
-            await writer.wait_closed()
-            for device_id, (w, board) in list(self.clients.items()):
-                if w == writer:
-                    del self.clients[device_id]
-                    await self.set_board_offline(board)
-                    break
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            if board:
+                await self.set_board_offline(board)
+
+    def detach_connection(self, writer):
+        """Отвязка соединения от платы, возвращает плату, если соединение было её текущим
 
-    async def process_command(self, frame: dict, client_addr, writer) -> bytes:
-        cmd = frame['cmd']
-        board_addr = frame['board_addr']
-        data = frame['data']
+        Плата соединения берётся из его сессии, а не из реестра: запись
+        реестра удаляется вместе с платой, пока соединение ещё открыто.
+        """
+        record = self.registry.detach(writer)
+        session = self.sessions.get(writer)
+        device_id = session.device_id if session else None
+        if not device_id or device_id not in self.clients or self.clients[device_id][0] is not writer:
+            return None
+
+        _, board = self.clients.pop(device_id)
+        if record:
+            self.registry.set_online(record, False)
+        self.status_reads.invalidate(device_id)
+        self.events.publish('offline', board_id=board.pk, device_id=device_id)
+        self.fail_pending(device_id)
+        self.announce_ownership(OP_RELEASE_BOARD, device_id)
+        return board
+
+    async def expire_connections(self, writers: list):
+        """Закрытие соединений без heartbeat дольше HEARTBEAT_TIMEOUT одной записью в БД"""
+        boards = [board for board in map(self.detach_connection, writers) if board]
+        for writer in writers:
+            writer.close()
+        if boards:
+            await self.set_boards_offline(boards)
+        logger.warning(f"Закрыто {len(writers)} соединений без heartbeat, плат отключено: {len(boards)}")
+
+    async def process_command(self, frame: Frame, client_addr, writer) -> bytes:
+        cmd = frame.cmd
+        board_addr = frame.board_addr
+        data = frame.data
 
         if cmd == VoungProtocol.CMD_HEARTBEAT:
             return await self.handle_heartbeat(board_addr, data)
         elif cmd == VoungProtocol.CMD_REGISTER:
             return await self.handle_register(board_addr, data, client_addr, writer)
         elif cmd == VoungProtocol.CMD_STATUS_CHANGE:
-            await self.handle_status_change(board_addr, data)
+            await self.handle_status_change(board_addr, data, writer)
+            return None
+        elif cmd in VoungProtocol.RESPONSE_COMMANDS:
+            record = self.registry.get_by_connection(writer)
+            self.handle_command_response(record.device_id if record else None, frame)
             return None
         else:
             logger.warning(f"Неизвестная команда: 0x{cmd:02X}")
@@ -66,109 +380,578 @@ class LockControlServer:
 
     async def handle_heartbeat(self, board_addr: int, data: bytes) -> bytes:
         if len(data) >= 8:
-            device_id = data[:8].decode('ascii', errors='ignore')
-            try:
-                board = await LockBoard.objects.filter(device_id=device_id).afirst()
-                if board:
-                    board.last_heartbeat = timezone.now()
-                    board.is_online = True
-                    await board.asave()
-            except Exception as e:
-                logger.error(f"Ошибка при обновлении heartbeat: {e}")
+            device_id = str(data[:8], 'ascii', errors='ignore')
+            if device_id in self.registry:
+                # Записывается в БД периодически в flush_presence
+                self.presence[device_id] = timezone.now()
         return VoungProtocol.create_response(board_addr, VoungProtocol.CMD_HEARTBEAT, 0x00)
 
     async def handle_register(self, board_addr: int, data: bytes, client_addr, writer) -> bytes:
         if len(data) < 10:
             return VoungProtocol.create_response(board_addr, VoungProtocol.CMD_REGISTER, 0xFF)
 
-        device_id = data[:8].decode('ascii', errors='ignore')
+        device_id = str(data[:8], 'ascii', errors='ignore')
         device_type = data[8:10].hex()
-        ccid = data[10:30].decode('ascii', errors='ignore') if len(data) >= 30 else ''
+        ccid = str(data[10:30], 'ascii', errors='ignore') if len(data) >= 30 else ''
 
-        try:
-            board, created = await LockBoard.objects.aupdate_or_create(
-                device_id=device_id,
-                defaults={
-                    'device_type': device_type,
-                    'ccid': ccid,
-                    'board_address': board_addr,
-                    'is_online': True,
-                    'last_heartbeat': timezone.now(),
-                    'ip_address': client_addr[0] if client_addr else None
-                }
-            )
+        fields = {
+            'device_type': device_type,
+            'ccid': ccid,
+            'board_address': board_addr,
+            'is_online': True,
+            'last_heartbeat': timezone.now(),
+            'ip_address': client_addr[0] if client_addr else None
+        }
+        record = self.registry.get(device_id)
 
-            if created:
-                await self.create_locks_for_board(board)
+        try:
+            if record is not None and self.worker_index is not None:
+                # Плата могла работать через другой рабочий процесс - его изменения
+                # статусов есть только в БД, запись реестра этого процесса устарела
+                record = await self.db.run_sync(DBExecutor.COMMAND, self.registry.load_board, record.pk)
+            known = record is not None
+            if known:
+                # Известная плата подтверждается по реестру: онлайн и heartbeat
+                # запишет flush_presence, изменившиеся поля - пачка регистраций
+                board = LockBoard(pk=record.pk, device_id=device_id, total_channels=record.total_channels, **fields)
+                if record.registration != (device_type, ccid, fields['ip_address']) or record.board_address != board_addr:
+                    self.registrations.update(record.pk, fields)
+                self.presence[device_id] = fields['last_heartbeat']
+                record = self.registry.update(board)
+            elif not self.registrations.admit():
+                logger.warning(f"Регистрация новой платы {device_id} отложена: превышена частота допуска")
+                return VoungProtocol.create_response(board_addr, VoungProtocol.CMD_REGISTER, 0xFF)
+            else:
+                board, locks = await self.registrations.register(device_id, fields)
+                record = self.registry.update(board)
+                self.registry.set_locks(record, locks)
+            self.registrations.mark_registered(device_id, known)
 
             # Сохраняем соединение с клиентом
             self.clients[device_id] = (writer, board)
+            self.registry.attach(writer, record)
+            if writer in self.sessions:
+                self.sessions[writer].device_id = device_id
+            self.announce_ownership(OP_CLAIM_BOARD, device_id)
+            self.events.publish('online', board_id=record.pk, device_id=device_id)
 
             logger.info(f"Устройство {device_id} зарегистрировано")
             return VoungProtocol.create_response(board_addr, VoungProtocol.CMD_REGISTER, 0x00)
 
+        except DBOverloaded as e:
+            # Плата повторит регистрацию, когда очередь БД разгрузится
+            logger.warning(f"Регистрация устройства {device_id} отклонена: {e}")
+            return VoungProtocol.create_response(board_addr, VoungProtocol.CMD_REGISTER, 0xFF)
         except Exception as e:
             logger.error(f"Ошибка регистрации устройства {device_id}: {e}")
             return VoungProtocol.create_response(board_addr, VoungProtocol.CMD_REGISTER, 0xFF)
 
-    async def handle_status_change(self, board_addr: int, data: bytes):
+    async def handle_status_change(self, board_addr: int, data: bytes, writer=None):
         if len(data) < 2:
             return
 
         channel = data[0]
         status = data[1]
 
-        try:
-            board = await LockBoard.objects.filter(board_address=board_addr).afirst()
-            if board:
-                lock = await Lock.objects.filter(board=board, channel=channel).afirst()
-                if lock:
-                    lock.status = status
-                    lock.last_status_change = timezone.now()
-                    await lock.asave()
-                    logger.info(f"Статус замка {board.device_id}-{channel} изменен на {status}")
-        except Exception as e:
-            logger.error(f"Ошибка при обновлении статуса замка: {e}")
-
-    async def create_locks_for_board(self, board: LockBoard):
-        locks_to_create = []
-        for channel in range(1, board.total_channels + 1):
-            locks_to_create.append(Lock(
-                board=board,
-                channel=channel,
-                name=f"Lock {channel}",
-                status=1  # Закрыт по умолчанию
-            ))
-        await Lock.objects.abulk_create(locks_to_create)
+        record = self.registry.get_by_connection(writer) or self.registry.get_by_address(board_addr)
+        lock_id = record.lock_id(channel) if record else None
+        if lock_id is None:
+            logger.warning(f"Изменение статуса неизвестного замка {board_addr}-{channel}")
+            return
+
+        # Записывается в БД пачкой в StatusWriteQueue
+        changed_at = timezone.now()
+        self.status_queue.put(lock_id, status, changed_at)
+        self.registry.set_status(record, channel, status)
+        self.queue_board_state(record, changed_at)
+        self.status_reads.invalidate(record.device_id)
+        self.events.publish(
+            'status', board_id=record.pk, device_id=record.device_id, channel=channel, lock_id=lock_id, status=status
+        )
+        logger.info(f"Статус замка {record.device_id}-{channel} изменен на {status}")
+
+    def queue_board_state(self, record: BoardRecord, changed_at):
+        if record.total_channels <= LockBoard.MAX_MASK_CHANNELS:
+            self.status_queue.put_board(record.pk, record.open_mask(), changed_at)
+
+    def apply_channel_states(self, record: BoardRecord, statuses: bytes) -> int:
+        """Сверка состояния всех каналов с ответом платы
+
+        В очередь записи попадают только замки, статус которых отличается
+        от известного, и одна маска каналов платы. Возвращает число
+        изменившихся замков.
+        """
+        changed_at = timezone.now()
+        changed = 0
+        for channel, status in enumerate(statuses, 1):
+            if record.statuses[channel - 1] == status:
+                continue
+            self.registry.set_status(record, channel, status)
+            lock_id = record.lock_id(channel)
+            if lock_id is None:
+                continue
+            changed += 1
+            self.status_queue.put(lock_id, status, changed_at)
+            self.events.publish(
+                'status', board_id=record.pk, device_id=record.device_id, channel=channel, lock_id=lock_id, status=status
+            )
+        self.queue_board_state(record, changed_at)
+        return changed
+
+    async def presence_written(self, device_ids: list) -> dict:
+        """Ожидание уже начатой записи heartbeat этих плат
+
+        Пачка heartbeat ставит платы онлайн, а полоса PRESENCE ниже STATUS,
+        поэтому поставленная позже запись отключения могла бы выполниться
+        раньше и быть затёрта. Возвращает heartbeat плат из пачки.
+        """
+        heartbeats = {}
+        while self.presence_writing is not None:
+            batch, done = self.presence_writing
+            found = {device_id: batch[device_id] for device_id in device_ids if device_id in batch}
+            if not found:
+                break
+            heartbeats.update(found)
+            await asyncio.shield(done)
+        return heartbeats
 
     async def set_board_offline(self, board: LockBoard):
         board.is_online = False
-        await board.asave()
+        heartbeats = await self.presence_written([board.device_id])
+        if board.device_id in self.clients:
+            # Плата переподключилась во время ожидания: её онлайн и heartbeat запишет flush_presence
+            logger.info(f"Плата {board.device_id} переподключилась, отключение не записывается")
+            return
+        last_heartbeat = self.presence.pop(board.device_id, None) or heartbeats.get(board.device_id)
+        if last_heartbeat:
+            board.last_heartbeat = last_heartbeat
+        await self.db.run_sync(
+            DBExecutor.STATUS,
+            LockBoard.objects.filter(pk=board.pk).update, is_online=False, last_heartbeat=board.last_heartbeat
+        )
         logger.info(f"Плата {board.device_id} отключена")
 
-    async def send_command_to_board(self, device_id: str, cmd: int, data: bytes = b'') -> bool:
+    async def set_boards_offline(self, boards: list):
+        heartbeats = await self.presence_written([board.device_id for board in boards])
+        # Переподключившиеся во время ожидания платы уже онлайн
+        boards = [board for board in boards if board.device_id not in self.clients]
+        if not boards:
+            return
+        for board in boards:
+            board.is_online = False
+            board.last_heartbeat = (self.presence.pop(board.device_id, None) or heartbeats.get(board.device_id)
+                                    or board.last_heartbeat)
+        await self.db.run_sync(
+            DBExecutor.STATUS, LockBoard.objects.bulk_update, boards, ['is_online', 'last_heartbeat'], batch_size=500
+        )
+        logger.info(f"Платы {', '.join(board.device_id for board in boards)} отключены")
+
+    @staticmethod
+    def write_presence(presence: dict, chunk_size: int = 500):
+        """Запись накопленных heartbeat одним UPDATE ... CASE на пачку плат"""
+        items = list(presence.items())
+        for i in range(0, len(items), chunk_size):
+            chunk = items[i:i + chunk_size]
+            LockBoard.objects.filter(device_id__in=[device_id for device_id, _ in chunk]).update(
+                last_heartbeat=Case(
+                    *[When(device_id=device_id, then=Value(heartbeat)) for device_id, heartbeat in chunk],
+                    output_field=DateTimeField()
+                ),
+                is_online=True
+            )
+
+    async def flush_presence(self):
+        if not self.presence:
+            return
+
+        batch, self.presence = self.presence, {}
+        done = asyncio.get_running_loop().create_future()
+        self.presence_writing = (batch, done)
+        try:
+            await self.db.run_sync(DBExecutor.PRESENCE, self.write_presence, batch)
+        except DBOverloaded:
+            # Отложено до следующего цикла: heartbeat не важнее регистраций
+            for device_id, heartbeat in batch.items():
+                self.presence.setdefault(device_id, heartbeat)
+        except Exception as e:
+            logger.error(f"Ошибка при записи heartbeat {len(batch)} плат: {e}")
+            # Возвращаем в таблицу, не затирая более свежие heartbeat
+            for device_id, heartbeat in batch.items():
+                self.presence.setdefault(device_id, heartbeat)
+        finally:
+            # Отложенные выше heartbeat отключившихся плат заберёт запись отключения
+            self.presence_writing = None
+            done.set_result(None)
+
+    async def presence_flush_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_flush_interval)
+            await self.flush_presence()
+
+    @staticmethod
+    def pending_key(device_id: str, cmd: int, channel=None) -> tuple:
+        """Ключ ожидания ответа: команды одному каналу ждут ответа с тем же каналом"""
+        return device_id, cmd, channel if cmd in CHANNEL_COMMANDS else None
+
+    def handle_command_response(self, device_id, frame: Frame):
+        """Передача ответа платы самому раннему ожидающему запросу
+
+        Ответ на команду канала несёт номер канала после байта статуса и
+        достаётся только запросу к этому каналу. Ответ без номера канала
+        (NACK) отдаётся самому раннему запросу этой команды к любому каналу.
+        """
+        channel = frame.data[1] if frame.cmd in CHANNEL_COMMANDS and len(frame.data) > 1 else None
+        waiters = self.pending.get(self.pending_key(device_id, frame.cmd, channel))
+        if not waiters and channel is None and frame.cmd in CHANNEL_COMMANDS:
+            waiters = min((queued for key, queued in self.pending.items()
+                           if key[:2] == (device_id, frame.cmd) and queued),
+                          key=lambda queued: queued[0][0], default=None)
+        while waiters:
+            _, future = waiters.popleft()
+            if not future.done():
+                future.set_result(frame)
+                return
+        logger.warning(f"Ответ 0x{frame.cmd:02X} от {device_id} без ожидающего запроса")
+
+    def fail_pending(self, device_id: str):
+        """Завершение всех ожидающих запросов к отключившейся плате"""
+        for key in [key for key in self.pending if key[0] == device_id]:
+            for _, future in self.pending.pop(key):
+                if not future.done():
+                    future.set_exception(ConnectionResetError('Соединение с платой потеряно'))
+
+    async def execute_command(self, device_id: str, cmd: int, data: bytes = b'',
+                              timeout: float = None, retries: int = None) -> dict:
+        """Отправка команды плате и ожидание её ответа
+
+        Возвращает словарь с полями success, status, data, latency (сек),
+        attempts и error. При таймауте команда отправляется повторно не
+        более retries раз.
+
+        Каждая попытка ждёт ответа своей записью в очереди ожидания, и при
+        таймауте запись снимается. Опоздавший ответ на прошлую попытку
+        достаётся следующей попытке этого же запроса (или запросу той же
+        команды к тому же каналу), а не чужому запросу.
+        """
+        timeout = self.command_timeout if timeout is None else timeout
+        retries = self.command_retries if retries is None else retries
+        result = {'success': False, 'status': None, 'data': b'', 'latency': None, 'attempts': 0, 'error': ''}
+
         if device_id not in self.clients:
-            return False
+            result['error'] = 'Плата не подключена'
+            return result
+
+        loop = asyncio.get_running_loop()
+        key = self.pending_key(device_id, cmd, data[0] if data else None)
+        future = None
+        started = loop.time()
+        session = None
 
-        writer, board = self.clients[device_id]
         try:
-            frame = VoungProtocol.create_frame(board.board_address, cmd, data)
-            writer.write(frame)
-            await writer.drain()
-            return True
+            for attempt in range(retries + 1):
+                if device_id not in self.clients:
+                    result['error'] = 'Плата не подключена'
+                    return result
+
+                writer, board = self.clients[device_id]
+                session = self.sessions.get(writer)
+                self.outbound[writer].put(VoungProtocol.create_frame(board.board_address, cmd, data))
+                future = loop.create_future()
+                self.pending.setdefault(key, deque()).append((next(self.pending_sequence), future))
+                result['attempts'] = attempt + 1
+
+                try:
+                    response = await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    self.drop_waiter(key, future)
+                    if session:
+                        session.command_timeouts += 1
+                    logger.warning(f"Нет ответа на 0x{cmd:02X} от {device_id} (попытка {attempt + 1})")
+                    continue
+
+                response_data = response.data
+                result['latency'] = loop.time() - started
+                result['status'] = response_data[0] if response_data else None
+                # Копия: результат живёт дольше принятого блока и уходит в JSON/шину
+                result['data'] = bytes(response_data[1:])
+                result['success'] = result['status'] in (None, VoungProtocol.STATUS_OK)
+                if not result['success']:
+                    result['error'] = f"Плата вернула статус 0x{result['status']:02X}"
+                return result
+
+            result['error'] = 'Плата не ответила'
+            return result
+
+        except (ConnectionResetError, OutboundQueueFull) as e:
+            result['error'] = str(e)
+            return result
         except Exception as e:
             logger.error(f"Ошибка при отправке команды на {device_id}: {e}")
-            return False
+            result['error'] = str(e)
+            return result
+        finally:
+            if future is not None:
+                if not future.done():
+                    future.cancel()
+                self.drop_waiter(key, future)
+            if session:
+                session.command_done(result)
+            self.publish_command_result(device_id, cmd, data, result)
+
+    def drop_waiter(self, key: tuple, future):
+        waiters = self.pending.get(key)
+        if waiters is None:
+            return
+        for entry in waiters:
+            if entry[1] is future:
+                waiters.remove(entry)
+                break
+        if not waiters:
+            del self.pending[key]
+
+    def publish_command_result(self, device_id: str, cmd: int, data: bytes, result: dict):
+        record = self.registry.get(device_id)
+        self.events.publish(
+            'command',
+            board_id=record.pk if record else None,
+            device_id=device_id,
+            channel=data[0] if cmd in CHANNEL_COMMANDS and data else None,
+            cmd=cmd,
+            success=result['success'],
+            status=result['status'],
+            latency_ms=round(result['latency'] * 1000, 2) if result['latency'] is not None else None,
+            attempts=result['attempts'],
+            error=result['error'],
+        )
+
+    async def submit_command(self, device_id: str, cmd: int, data: bytes = b'', timeout: float = None) -> dict:
+        """Выполнение команды с объединением одновременных чтений статуса
+
+        Одновременные CMD_READ_ALL_STATUS к одной плате отправляются одним
+        фреймом, а результат не старше LOCK_STATUS_READ_TTL отдаётся без
+        обращения к плате. Остальные команды сбрасывают этот результат.
+        """
+        if cmd == VoungProtocol.CMD_READ_ALL_STATUS:
+            return await self.status_reads.do(device_id, lambda: self.read_all_status(device_id, timeout))
+        if cmd == VoungProtocol.CMD_READ_STATUS and data:
+            return await self.read_status(device_id, data, timeout)
+        result = await self.execute_command(device_id, cmd, data, timeout)
+        self.status_reads.invalidate(device_id)
+        return result
+
+    async def read_status(self, device_id: str, data: bytes, timeout: float = None) -> dict:
+        """CMD_READ_STATUS с обновлением статуса канала по ответу платы"""
+        result = await self.execute_command(device_id, VoungProtocol.CMD_READ_STATUS, data, timeout)
+        record = self.registry.get(device_id)
+        if not result['success'] or record is None:
+            return result
+
+        channel = data[0]
+        status = VoungProtocol.parse_lock_status(result['data'], channel)
+        if status is None or not 1 <= channel <= record.total_channels:
+            logger.warning(f"Неожиданный ответ на чтение статуса {device_id}-{channel}: {result['data'].hex()}")
+            return result
+
+        if record.statuses[channel - 1] != status:
+            statuses = bytearray(record.statuses)
+            statuses[channel - 1] = status
+            self.apply_channel_states(record, statuses)
+            self.status_reads.invalidate(device_id)
+            logger.info(f"Статус замка {device_id}-{channel} обновлён по ответу платы: {status}")
+        return result
+
+    async def read_all_status(self, device_id: str, timeout: float = None) -> dict:
+        """CMD_READ_ALL_STATUS с обновлением состояния каналов по ответу платы"""
+        result = await self.execute_command(device_id, VoungProtocol.CMD_READ_ALL_STATUS, b'', timeout)
+        record = self.registry.get(device_id)
+        if not result['success'] or record is None:
+            return result
+
+        statuses = VoungProtocol.parse_channel_states(result['data'], record.total_channels)
+        if statuses is None:
+            logger.warning(f"Ответ на чтение всех статусов от {device_id} неожиданной длины: {result['data'].hex()}")
+            return result
+
+        changed = self.apply_channel_states(record, statuses)
+        if changed:
+            logger.info(f"Статусы {changed} замков {device_id} обновлены по ответу платы")
+        return result
+
+    async def send_command_to_board(self, device_id: str, cmd: int, data: bytes = b'') -> bool:
+        result = await self.dispatch_command(device_id, cmd, data)
+        return result['success']
+
+    async def dispatch_command(self, device_id: str, cmd: int, data: bytes = b'', timeout: float = None) -> dict:
+        """Выполнение команды в процессе, которому принадлежит соединение с платой
+
+        Если TCP сервер запущен в другом процессе (start_tcp_server), команда
+        передаётся ему через шину команд.
+        """
+        if self.is_running:
+            return await self.submit_command(device_id, cmd, data, timeout)
+        return await command_bus.send_command(device_id, cmd, data, timeout)
+
+    def announce_ownership(self, op: int, device_id: str):
+        """Сообщение супервизору о подключении или отключении платы"""
+        if self.worker_index is None:
+            return
+        task = asyncio.create_task(self._announce_ownership(op, device_id))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def _announce_ownership(self, op: int, device_id: str):
+        result = await command_bus.request(op, device_id, data=bytes([self.worker_index]))
+        if not result['success']:
+            logger.error(f"Супервизор не принял владение платой {device_id}: {result['error']}")
+
+    async def invalidate_board(self, pk: int):
+        """Обновление записи реестра после изменения платы через API"""
+        if not self.is_running:
+            result = await command_bus.request(OP_INVALIDATE_BOARD, '', data=pk.to_bytes(8, 'big'))
+            if not result['success']:
+                logger.warning(f"Не удалось обновить реестр для платы {pk}: {result['error']}")
+            return
+        previous = self.registry.by_pk.get(pk)
+        record = await self.db.run_sync(DBExecutor.COMMAND, self.registry.load_board, pk)
+        logger.info(f"Запись реестра платы {pk} {'обновлена' if record else 'удалена'}")
+        if record is None and previous and previous.device_id in self.clients:
+            # Плата удалена при открытом соединении: закрываем его, чтобы команды
+            # не уходили удалённой плате, а обработчик соединения убрал её состояние
+            self.clients[previous.device_id][0].close()
+
+    def counters(self) -> dict:
+        """Платы и замки для /api/statistics/ - та же схема, что и при подсчёте по БД"""
+        return self.registry.counters()
+
+    def board_states(self) -> dict:
+        """device_id -> [замков, открытых] по реестру, супервизор собирает из них OP_STATS"""
+        return {record.device_id: [record.lock_count(), record.open_count()] for record in self.registry.by_pk.values()}
+
+    def diagnostics(self) -> dict:
+        """Внутренние метрики TCP сервера для отладочного API"""
+        return {
+            'db': self.db.stats(),
+            'registration': self.registrations.stats(),
+            'status_queue': self.status_queue.stats(),
+            'status_reads': self.status_reads.stats(),
+            'outbound': self.outbound_totals(),
+            'connections': len(self.sessions),
+            'watchdog_expired': self.watchdog.expired_total,
+        }
+
+    def outbound_totals(self) -> dict:
+        """Сводка очередей отправки всех соединений, по соединениям - debug/clients/"""
+        totals = {'queued_frames': 0, 'queued_bytes': 0, 'dropped_frames': 0, 'rejected_frames': 0,
+                  'max_queue_time_ms': 0.0}
+        for queue in self.outbound.values():
+            stats = queue.stats()
+            for name in ('queued_frames', 'queued_bytes', 'dropped_frames', 'rejected_frames'):
+                totals[name] += stats[name]
+            totals['max_queue_time_ms'] = max(totals['max_queue_time_ms'], stats['max_queue_time_ms'])
+        return totals
+
+    async def fetch_counters(self):
+        """Счётчики плат и замков из памяти процесса TCP сервера или None"""
+        if self.is_running:
+            return self.counters()
+        result = await command_bus.request(OP_STATS, '')
+        if not result['success']:
+            return None
+        return json.loads(result['data'])
+
+    async def fetch_diagnostics(self):
+        """Внутренние метрики из памяти процесса TCP сервера или None"""
+        if self.is_running:
+            return self.diagnostics()
+        result = await command_bus.request(OP_DIAGNOSTICS, '')
+        if not result['success']:
+            return None
+        return json.loads(result['data'])
+
+    def connections(self, query: dict) -> dict:
+        """Страница открытых соединений по фильтрам и сортировке (sessions.query_sessions)"""
+        now = time.time()
+        return query_sessions([session.as_dict(now) for session in self.sessions.values()], query)
+
+    async def fetch_connections(self, query: dict):
+        """Открытые соединения из памяти процесса TCP сервера или None"""
+        if self.is_running:
+            return self.connections(query)
+        result = await command_bus.request(OP_CONNECTIONS, '', data=json.dumps(query).encode())
+        if not result['success']:
+            return None
+        return json.loads(result['data'])
+
+    async def subscribe_events(self, boards=None, channels=None, since: int = None, epoch: str = None):
+        """Поток событий из памяти процесса TCP сервера или через шину команд"""
+        if self.is_running:
+            subscription = self.events.subscribe(boards, channels, since, epoch)
+            try:
+                async for event in subscription:
+                    yield event
+            finally:
+                subscription.close()
+            return
+        async for event in command_bus.subscribe(boards, channels, since, epoch):
+            yield event
+
+    async def handle_bus_request(self, op: int, device_id: str, cmd: int, data: bytes, timeout: float) -> dict:
+        if op == OP_COMMAND:
+            return await self.submit_command(device_id, cmd, data, timeout)
+        if op == OP_INVALIDATE_BOARD:
+            await self.invalidate_board(int.from_bytes(data, 'big'))
+            return ok_result()
+        if op == OP_STATS:
+            return ok_result(data=json.dumps(self.counters()).encode())
+        if op == OP_BOARD_STATES:
+            return ok_result(data=json.dumps(self.board_states()).encode())
+        if op == OP_DIAGNOSTICS:
+            return ok_result(data=json.dumps(self.diagnostics()).encode())
+        if op == OP_CONNECTIONS:
+            return ok_result(data=json.dumps(self.connections(json.loads(data))).encode())
+        return error_result(f'Неизвестная операция шины 0x{op:02X}')
 
     async def start_server(self):
+        # Реестр загружается до приёма соединений: переподключающиеся после
+        # перезапуска платы подтверждаются по нему без записи в БД
+        await self.db.run_sync(DBExecutor.COMMAND, self.registry.load)
+        self.registrations.start(await self.db.run_sync(
+            DBExecutor.COMMAND, RegistrationQueue.recent_boards, settings.LOCK_HEARTBEAT_TIMEOUT
+        ))
+
         server = await asyncio.start_server(
             self.handle_client,
             self.host,
-            self.port
+            self.port,
+            reuse_port=self.reuse_port or None
         )
         logger.info(f"TCP сервер запущен на {self.host}:{self.port}")
 
-        async with server:
-            await server.serve_forever()
+        self.command_bus = CommandBusServer(self, self.command_socket)
+        try:
+            await self.command_bus.start()
+        except OSError:
+            server.close()
+            raise
+        self.is_running = True
+        presence_task = asyncio.create_task(self.presence_flush_loop())
+        status_task = asyncio.create_task(self.status_queue.run())
+        registration_task = asyncio.create_task(self.registrations.run())
+        watchdog_task = asyncio.create_task(self.watchdog.run())
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.is_running = False
+            presence_task.cancel()
+            status_task.cancel()
+            registration_task.cancel()
+            watchdog_task.cancel()
+            await self.registrations.flush()
+            await self.flush_presence()
+            await self.status_queue.flush()
+            await self.command_bus.close()
+            self.db.close()
 
 lock_server = LockControlServer()
@@ -1,3 +1,1713 @@
 # sudo nano /etc/systemd/system/lock_alman_final.service
 # sudo nano /etc/systemd/system/lock_alman_tcp.service
 
+import asyncio
+import atexit
+import gzip
+import io
+import json
+import os
+import socket
+import struct
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+
+from locks.audit import AuditWriter
+from locks.command_bus import (
+    OP_BOARD_STATES, OP_CLAIM_BOARD, OP_COMMAND, OP_RELEASE_BOARD, OP_STATS, REQUEST_HEADER, RESPONSE_HEADER, BusConnection, CommandBusClient, CommandBusServer,
+    encode_request, encode_response, error_result, ok_result,
+)
+from locks.counters import count_operations, operation_totals
+from locks.db import DBExecutor, DBOverloaded
+from locks.events import EventHub, event_id, parse_event_id
+from locks.models import DailyOperationSummary, Lock, LockBoard, LockOperation, OperationCounter
+from locks.outbound import OutboundQueue, OutboundQueueFull
+from locks.pagination import KeysetPagination
+from locks.protocol import FrameDecoder, VoungProtocol
+from locks.registration import RegistrationQueue, TokenBucket
+from locks.serializers import LockBoardSerializer, LockSerializer
+from locks.sessions import ClientSession, RttHistogram, query_sessions
+from locks.singleflight import SingleFlight
+from locks.supervisor import WorkerSupervisor
+from locks.tcp_server import BoardRecord, BoardRegistry, LockControlServer, lock_server
+from locks.watchdog import HeartbeatWatchdog
+from locks.writers import StatusWriteQueue
+
+
+def frame(board_addr=1, cmd=0x82, data=b'') -> bytes:
+    return VoungProtocol.create_frame(board_addr, cmd, data)
+
+
+class FakeWriter:
+    """Писатель потока, запоминающий отправленное"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+
+    def writelines(self, data):
+        self.chunks.extend(bytes(chunk) for chunk in data)
+
+    async def drain(self):
+        pass
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+    def get_extra_info(self, name):
+        return None
+
+
+class VoungProtocolTests(SimpleTestCase):
+    def test_create_and_parse_frame(self):
+        parsed = VoungProtocol.parse_frame(frame(0x05, 0x82, b'\x01\x02'))
+        self.assertEqual(parsed.board_addr, 0x05)
+        self.assertEqual(parsed.cmd, 0x82)
+        self.assertEqual(bytes(parsed.data), b'\x01\x02')
+
+    def test_frame_layout(self):
+        raw = frame(0x01, 0x80, b'\x03')
+        self.assertEqual(raw[:4], VoungProtocol.START_CHARS)
+        self.assertEqual(raw[4], len(raw))
+        self.assertEqual(raw[-1], VoungProtocol.compute_xor(raw[:-1]))
+
+    def test_parse_frame_rejects_bad_checksum(self):
+        raw = bytearray(frame(0x01, 0x80, b'\x03'))
+        raw[-1] ^= 0xFF
+        self.assertIsNone(VoungProtocol.parse_frame(bytes(raw)))
+
+    def test_parse_frame_rejects_wrong_length(self):
+        self.assertIsNone(VoungProtocol.parse_frame(frame(0x01, 0x80, b'\x03')[:-2]))
+
+    def test_compute_xor_matches_bytewise_xor(self):
+        for size in (0, 1, 7, 8, 63, 64, 65, 255):
+            data = bytes((index * 37 + 11) & 0xFF for index in range(size))
+            expected = 0
+            for byte in data:
+                expected ^= byte
+            self.assertEqual(VoungProtocol.compute_xor(data), expected, size)
+
+    def test_parse_channel_states_byte_per_channel(self):
+        self.assertEqual(VoungProtocol.parse_channel_states(b'\x00\x01\x05', 3), b'\x00\x01\x01')
+
+    def test_parse_channel_states_bit_packed(self):
+        # Канал 1 - младший бит первого байта
+        self.assertEqual(
+            VoungProtocol.parse_channel_states(b'\x05\x01', 12),
+            bytes([1, 0, 1, 0, 0, 0, 0, 0, 1, 0, 0, 0]),
+        )
+
+    def test_parse_channel_states_unexpected_length(self):
+        self.assertIsNone(VoungProtocol.parse_channel_states(b'\x00\x01\x00', 12))
+
+
+class FrameDecoderTests(SimpleTestCase):
+    def test_frame_split_across_reads(self):
+        decoder = FrameDecoder()
+        raw = frame(0x02, 0x82, b'\x01\x00')
+        frames = []
+        for index in range(len(raw)):
+            frames.extend(decoder.feed(raw[index:index + 1]))
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0].board_addr, 0x02)
+        self.assertEqual(bytes(frames[0].data), b'\x01\x00')
+        self.assertEqual(decoder.buffered, 0)
+
+    def test_several_frames_in_one_read(self):
+        decoder = FrameDecoder()
+        frames = decoder.feed(frame(1, 0x80) + frame(2, 0x81, b'\x07') + frame(3, 0x82))
+        self.assertEqual([item.board_addr for item in frames], [1, 2, 3])
+        self.assertEqual(bytes(frames[1].data), b'\x07')
+
+    def test_frames_stay_valid_after_next_read(self):
+        decoder = FrameDecoder()
+        first = decoder.feed(frame(1, 0x80, b'\xAA'))[0]
+        decoder.feed(frame(2, 0x80, b'\xBB'))
+        self.assertEqual(bytes(first.data), b'\xAA')
+
+    def test_garbage_before_frame_is_discarded(self):
+        decoder = FrameDecoder()
+        frames = decoder.feed(b'\x00\x13garbage' + frame(4, 0x80))
+        self.assertEqual([item.board_addr for item in frames], [4])
+        self.assertEqual(decoder.discarded_bytes, 9)
+
+    def test_partial_marker_is_kept(self):
+        decoder = FrameDecoder()
+        raw = frame(5, 0x80)
+        self.assertEqual(decoder.feed(b'junk' + raw[:2]), [])
+        frames = decoder.feed(raw[2:])
+        self.assertEqual([item.board_addr for item in frames], [5])
+
+    def test_false_marker_with_short_length(self):
+        decoder = FrameDecoder()
+        frames = decoder.feed(b'WKLY\x02' + frame(6, 0x80))
+        self.assertEqual([item.board_addr for item in frames], [6])
+        self.assertEqual(decoder.invalid_frames, 1)
+
+    def test_false_marker_with_bad_checksum(self):
+        decoder = FrameDecoder()
+        broken = bytearray(frame(7, 0x80))
+        broken[-1] ^= 0xFF
+        frames = decoder.feed(bytes(broken) + frame(8, 0x80))
+        self.assertEqual([item.board_addr for item in frames], [8])
+        self.assertEqual(decoder.invalid_frames, 1)
+
+    def test_false_marker_waits_for_length(self):
+        # Длина указывает дальше конца буфера - ждём остальные байты
+        decoder = FrameDecoder()
+        raw = frame(9, 0x80, b'\x01\x02\x03')
+        self.assertEqual(decoder.feed(raw[:6]), [])
+        self.assertEqual(decoder.invalid_frames, 0)
+        self.assertEqual(len(decoder.feed(raw[6:])), 1)
+
+    def test_buffer_overflow_is_discarded(self):
+        decoder = FrameDecoder(max_buffer_size=32)
+        decoder.feed(b'WKLY\xF0' + b'\x00' * 40)
+        self.assertLessEqual(decoder.buffered, 32)
+        frames = decoder.feed(frame(10, 0x80))
+        self.assertEqual([item.board_addr for item in frames], [10])
+
+    def test_reset(self):
+        decoder = FrameDecoder()
+        decoder.feed(frame(1, 0x80)[:5])
+        decoder.reset()
+        self.assertEqual(decoder.buffered, 0)
+
+
+class CommandBusCodecTests(SimpleTestCase):
+    def test_encode_request(self):
+        raw = encode_request(7, OP_COMMAND, 'ABC123', 0x82, b'\x01\x02', timeout=1.5)
+        header = REQUEST_HEADER.unpack(raw[:REQUEST_HEADER.size])
+        self.assertEqual(header, (7, OP_COMMAND, b'ABC123\x00\x00', 0x82, 1500, 2))
+        self.assertEqual(raw[REQUEST_HEADER.size:], b'\x01\x02')
+
+    def test_encode_request_clamps_timeout(self):
+        raw = encode_request(1, OP_COMMAND, 'X', timeout=120)
+        self.assertEqual(REQUEST_HEADER.unpack(raw[:REQUEST_HEADER.size])[4], 0xFFFF)
+
+    def test_encode_response(self):
+        raw = encode_response(3, {
+            'success': True, 'status': 0, 'data': b'\x05', 'latency': 0.25, 'attempts': 2, 'error': '',
+        })
+        header = RESPONSE_HEADER.unpack(raw[:RESPONSE_HEADER.size])
+        self.assertEqual(header, (3, 1, 1, 0, 2, 0.25, 1, 0))
+        self.assertEqual(raw[RESPONSE_HEADER.size:], b'\x05')
+
+    def decode(self, *responses) -> list:
+        async def run():
+            reader = asyncio.StreamReader()
+            connection = BusConnection(reader, FakeWriter())
+            futures = [connection.send(request_id, b'') for request_id, _ in responses]
+            for request_id, result in reversed(responses):
+                reader.feed_data(encode_response(request_id, result))
+            results = await asyncio.gather(*futures)
+            connection.close()
+            return results
+        return asyncio.run(run())
+
+    def test_round_trip_out_of_order(self):
+        ok = {'success': True, 'status': 1, 'data': b'\x01' * 70000, 'latency': 0.5, 'attempts': 1, 'error': ''}
+        failed = error_result('Плата не подключена')
+        first, second = self.decode((1, ok), (2, failed))
+        self.assertTrue(first['success'])
+        self.assertEqual(first['status'], 1)
+        self.assertEqual(len(first['data']), 70000)
+        self.assertEqual(first['latency'], 0.5)
+        self.assertFalse(second['success'])
+        self.assertIsNone(second['status'])
+        self.assertIsNone(second['latency'])
+        self.assertEqual(second['error'], 'Плата не подключена')
+
+    def test_closed_stream_fails_pending(self):
+        async def run():
+            reader = asyncio.StreamReader()
+            connection = BusConnection(reader, FakeWriter())
+            future = connection.send(1, b'')
+            reader.feed_data(struct.pack('!I', 1))
+            reader.feed_eof()
+            with self.assertRaises(ConnectionResetError):
+                await future
+            self.assertTrue(connection.closed)
+        asyncio.run(run())
+
+
+class EchoHandler:
+    async def handle_bus_request(self, op, device_id, cmd, data, timeout):
+        return ok_result(data=data)
+
+
+class CommandBusClientTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'bus.sock')
+
+    def serve(self, scenario):
+        async def run():
+            server = CommandBusServer(EchoHandler(), self.path)
+            await server.start()
+            try:
+                return await scenario(server)
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_pool_per_event_loop(self):
+        client = CommandBusClient(self.path)
+        results = []
+
+        def web_thread():
+            for _ in range(3):
+                results.append(asyncio.run(client.request(OP_STATS, '', data=b'x'))['data'])
+
+        async def scenario(server):
+            threads = [threading.Thread(target=web_thread) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            await asyncio.get_running_loop().run_in_executor(None, lambda: [thread.join() for thread in threads])
+            # Соединения закончившихся циклов закрыты, а не брошены открытыми
+            await asyncio.sleep(0.05)
+            return len(server.connections)
+
+        self.assertLessEqual(self.serve(scenario), 1)
+        self.assertEqual(results, [b'x'] * 9)
+
+    def test_reuses_connection_within_loop(self):
+        client = CommandBusClient(self.path)
+
+        async def scenario(server):
+            for _ in range(3):
+                await client.request(OP_STATS, '')
+            count = len(client.get_pool(asyncio.get_running_loop()).connections)
+            client.close()
+            return count
+
+        self.assertEqual(self.serve(scenario), 1)
+
+
+    def test_server_refuses_socket_in_use(self):
+        async def scenario(server):
+            with self.assertRaises(OSError):
+                await CommandBusServer(EchoHandler(), self.path).start()
+            # Сокет работающего сервера остался на месте
+            return (await CommandBusClient(self.path).request(OP_STATS, '', data=b'y'))['data']
+
+        self.assertEqual(self.serve(scenario), b'y')
+
+    def test_server_replaces_stale_socket(self):
+        stale = socket.socket(socket.AF_UNIX)
+        stale.bind(self.path)
+        stale.close()  # файл сокета остался, но его никто не слушает
+
+        async def scenario(server):
+            return (await CommandBusClient(self.path).request(OP_STATS, '', data=b'z'))['data']
+
+        self.assertEqual(self.serve(scenario), b'z')
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {'success': True, 'value': len(calls)}
+
+        async def run():
+            return await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+
+        results = asyncio.run(run())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result['value'] for result in results], [1] * 5)
+        self.assertEqual(flight.stats(), {'inflight': 0, 'executed': 1, 'shared': 4, 'cached': 0})
+
+    def test_results_are_independent_copies(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            return {'success': True}
+
+        async def run():
+            return await asyncio.gather(flight.do('key', fetch), flight.do('key', fetch))
+
+        first, second = asyncio.run(run())
+        first['extra'] = 1
+        self.assertNotIn('extra', second)
+
+    def test_without_ttl_next_call_executes_again(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            return {'success': True}
+
+        async def run():
+            await flight.do('key', fetch)
+            await flight.do('key', fetch)
+
+        asyncio.run(run())
+        self.assertEqual(flight.executed, 2)
+
+    def test_ttl_caches_successful_result(self):
+        flight = SingleFlight(ttl=60)
+        results = iter([{'success': False}, {'success': True}, {'success': True}])
+
+        async def fetch():
+            return next(results)
+
+        async def run():
+            for _ in range(3):
+                await flight.do('key', fetch)
+
+        asyncio.run(run())
+        # Ошибка не кэшируется, успешный результат отдаётся повторно
+        self.assertEqual(flight.executed, 2)
+        self.assertEqual(flight.cached, 1)
+
+    def test_invalidate_during_flight_skips_cache(self):
+        flight = SingleFlight(ttl=60)
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            return {'success': True}
+
+        async def run():
+            task = asyncio.ensure_future(flight.do('key', fetch))
+            await asyncio.sleep(0)
+            flight.invalidate('key')
+            await task
+            await flight.do('key', fetch)
+
+        asyncio.run(run())
+        self.assertEqual(flight.executed, 2)
+
+    def test_exception_reaches_all_callers(self):
+        flight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise ConnectionResetError('нет связи')
+
+        async def run():
+            return await asyncio.gather(flight.do('key', fetch), flight.do('key', fetch), return_exceptions=True)
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ConnectionResetError) for result in results))
+        self.assertEqual(flight.executed, 1)
+
+
+    def test_flight_of_other_thread_does_not_interfere(self):
+        # Как под WSGI: другой поток выполняет запрос в своём цикле событий
+        flight = SingleFlight()
+        calls = []
+
+        async def quick():
+            calls.append('quick')
+            return {'success': True}
+
+        async def run():
+            release = asyncio.Event()
+
+            async def slow():
+                calls.append('slow')
+                await release.wait()
+                return {'success': True}
+
+            first = asyncio.ensure_future(flight.do('key', slow))
+            await asyncio.sleep(0)
+            other = threading.Thread(target=lambda: asyncio.run(flight.do('key', quick)))
+            other.start()
+            await asyncio.get_running_loop().run_in_executor(None, other.join)
+            second = asyncio.ensure_future(flight.do('key', slow))
+            await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(first, second)
+
+        asyncio.run(run())
+        self.assertEqual(sorted(calls), ['quick', 'slow'])
+        self.assertEqual(flight.stats(), {'inflight': 0, 'executed': 2, 'shared': 1, 'cached': 0})
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_refill(self):
+        with mock.patch('locks.registration.time.monotonic', return_value=100.0) as clock:
+            bucket = TokenBucket(rate=2, burst=3)
+            self.assertEqual([bucket.take() for _ in range(4)], [True, True, True, False])
+            clock.return_value = 100.5
+            self.assertEqual([bucket.take(), bucket.take()], [True, False])
+
+    def test_refill_is_capped_by_burst(self):
+        with mock.patch('locks.registration.time.monotonic', return_value=0.0) as clock:
+            bucket = TokenBucket(rate=10, burst=2)
+            clock.return_value = 1000.0
+            self.assertEqual([bucket.take() for _ in range(3)], [True, True, False])
+
+
+
+class BoardRegistryTests(SimpleTestCase):
+    def registry(self) -> BoardRegistry:
+        registry = BoardRegistry()
+        for pk, device_id, address, online in ((1, 'REGA0001', 1, True), (2, 'REGA0002', 2, False),
+                                               (3, 'REGA0003', 2, True)):
+            record = BoardRecord(pk, device_id, address, 4, online)
+            for channel in range(1, 5):
+                record.set_lock(channel, pk * 10 + channel, 0 if channel == 1 else 1)
+            registry.add(record)
+        return registry
+
+    def test_lookup(self):
+        registry = self.registry()
+        self.assertEqual(len(registry), 3)
+        self.assertIn('REGA0002', registry)
+        self.assertEqual(registry.get('REGA0002').pk, 2)
+        self.assertEqual(registry.get_by_address(1).device_id, 'REGA0001')
+        # Адрес 2 у двух плат - по нему плату не определить
+        self.assertIsNone(registry.get_by_address(2))
+        self.assertIsNone(registry.get_by_address(9))
+        self.assertEqual(registry.counters(), {
+            'boards': {'total': 3, 'online': 2, 'offline': 1},
+            'locks': {'total': 12, 'open': 3, 'closed': 9},
+        })
+
+    def test_update_reindexes_and_recounts(self):
+        registry = self.registry()
+        record = registry.get('REGA0002')
+        board = LockBoard(pk=2, device_id='REGA0002', board_address=5, total_channels=2, is_online=True,
+                          device_type='0025', ccid='', ip_address='10.0.0.2')
+        self.assertIs(registry.update(board), record)
+        self.assertEqual(registry.get_by_address(5), record)
+        self.assertEqual(registry.get_by_address(2).device_id, 'REGA0003')
+        self.assertEqual(record.lock_ids, [21, 22])
+        self.assertEqual(record.registration, ('0025', '', '10.0.0.2'))
+        self.assertEqual(registry.counters()['boards']['online'], 3)
+        self.assertEqual(registry.counters()['locks'], {'total': 10, 'open': 3, 'closed': 7})
+
+        registry.update(LockBoard(pk=4, device_id='REGA0004', board_address=7, total_channels=3))
+        self.assertEqual(registry.get_by_address(7).pk, 4)
+        self.assertEqual(registry.counters()['boards']['total'], 4)
+
+    def test_status_and_online_counters(self):
+        registry = self.registry()
+        record = registry.get('REGA0001')
+        registry.set_status(record, 2, 0)
+        registry.set_status(record, 2, 0)
+        registry.set_online(record, False)
+        self.assertEqual(record.open_mask(), 0b11)
+        self.assertEqual(registry.counters()['locks']['open'], 4)
+        self.assertEqual(registry.counters()['boards']['online'], 1)
+        registry.recount()
+        self.assertEqual(registry.counters()['locks']['open'], 4)
+
+    def test_connection_claim_and_remove(self):
+        registry = self.registry()
+        writer = FakeWriter()
+        registry.attach(writer, registry.get('REGA0003'))
+        self.assertEqual(registry.get_by_connection(writer).pk, 3)
+
+        removed = registry.remove(3)
+        self.assertEqual(removed.device_id, 'REGA0003')
+        self.assertIsNone(registry.get_by_connection(writer))
+        self.assertNotIn('REGA0003', registry)
+        self.assertEqual(registry.get_by_address(2).pk, 2)
+        self.assertIsNone(registry.remove(3))
+        self.assertEqual(registry.counters()['locks']['total'], 8)
+
+class ServerTestMixin:
+    """TCP сервер с настоящим DBExecutor и соединениями на FakeWriter"""
+
+    def setUp(self):
+        self.server = LockControlServer()
+        self.addCleanup(self.server.db.close)
+
+    def connect(self, ip='10.0.0.1') -> FakeWriter:
+        writer = FakeWriter()
+        self.server.sessions[writer] = ClientSession((ip, 5000))
+        return writer
+
+    async def register(self, device_id: str, writer, ip='10.0.0.1', board_addr=1) -> int:
+        """Статус ответа платы на регистрацию"""
+        data = device_id.encode() + b'\x00\x25' + b'89996'.ljust(20, b'0')
+        reply = await self.server.handle_register(board_addr, data, (ip, 5000), writer)
+        return VoungProtocol.parse_frame(reply).data[0]
+
+    async def disconnect(self, writer):
+        board = self.server.detach_connection(writer)
+        del self.server.sessions[writer]
+        if board:
+            await self.server.set_board_offline(board)
+
+
+class RegistrationTests(ServerTestMixin, TransactionTestCase):
+    def test_changed_registration_does_not_undo_disconnect(self):
+        board = LockBoard.objects.create(device_id='REG00001', board_address=1, ip_address='10.0.0.1')
+        self.server.registry.load()
+
+        async def run():
+            writer = self.connect('10.0.0.2')
+            self.assertEqual(await self.register('REG00001', writer, ip='10.0.0.2'), 0)
+            self.assertIn(board.pk, self.server.registrations.updates)
+            # Отключение до записи пачки регистраций
+            await self.disconnect(writer)
+            await self.server.registrations.flush()
+
+        asyncio.run(run())
+        board.refresh_from_db()
+        self.assertFalse(board.is_online)
+        self.assertIsNotNone(board.last_heartbeat)
+        self.assertEqual(board.ip_address, '10.0.0.2')
+
+
+    def test_reconnect_while_going_offline(self):
+        board = LockBoard.objects.create(device_id='REG00002', board_address=1, ip_address='10.0.0.1')
+        self.server.registry.load()
+
+        async def run():
+            first = self.connect()
+            await self.register('REG00002', first)
+            # Heartbeat платы в пачке, которая сейчас пишется в БД
+            done = asyncio.get_running_loop().create_future()
+            self.server.presence_writing, self.server.presence = (self.server.presence, done), {}
+            offline = asyncio.ensure_future(self.disconnect(first))
+            await asyncio.sleep(0)
+
+            self.assertEqual(await self.register('REG00002', self.connect()), 0)
+            self.server.presence_writing = None
+            done.set_result(None)
+            await offline
+            self.assertIn('REG00002', self.server.presence)
+            await self.server.flush_presence()
+
+        asyncio.run(run())
+        board.refresh_from_db()
+        self.assertTrue(board.is_online)
+
+
+    def test_new_boards_written_in_one_batch(self):
+        self.server.registry.load()
+        LockBoard.objects.create(device_id='REG00010', board_address=3)  # создана в обход реестра
+
+        async def run():
+            flusher = asyncio.ensure_future(self.server.registrations.run())
+            statuses = await asyncio.gather(*(
+                self.register(device_id, self.connect(), board_addr=index)
+                for index, device_id in enumerate(('REG00011', 'REG00012', 'REG00010'), 1)
+            ))
+            flusher.cancel()
+            return statuses
+
+        self.assertEqual(asyncio.run(run()), [0, 0, 0])
+        stats = self.server.registrations.stats()
+        self.assertEqual((stats['flushes'], stats['max_batch'], stats['written']), (1, 3, 3))
+        self.assertEqual(LockBoard.objects.filter(device_id__startswith='REG0001').count(), 3)
+        self.assertEqual(Lock.objects.filter(board__device_id='REG00011').count(), 25)
+        self.assertEqual(Lock.objects.filter(board__device_id='REG00010').count(), 0)
+        record = self.server.registry.get('REG00011')
+        self.assertEqual(record.lock_count(), 25)
+        self.assertEqual(self.server.registry.get('REG00010').board_address, 3)
+        self.assertTrue(LockBoard.objects.get(device_id='REG00010').is_online)
+
+    def test_batch_is_one_transaction(self):
+        registrations = {device_id: {'board_address': 1, 'is_online': True} for device_id in ('REG00021', 'REG00022')}
+        with mock.patch.object(Lock.objects, 'bulk_create', side_effect=RuntimeError('database is locked')):
+            with self.assertRaises(RuntimeError):
+                RegistrationQueue.write(registrations, {})
+        self.assertFalse(LockBoard.objects.filter(device_id__in=registrations).exists())
+
+    def test_admission_limit_defers_new_boards(self):
+        self.server.registrations.bucket = TokenBucket(rate=0.001, burst=1)
+
+        async def run():
+            flusher = asyncio.ensure_future(self.server.registrations.run())
+            first = await self.register('REG00031', self.connect())
+            second = await self.register('REG00032', self.connect())
+            flusher.cancel()
+            return first, second
+
+        self.assertEqual(asyncio.run(run()), (0, 0xFF))
+        self.assertEqual(self.server.registrations.rejected, 1)
+        self.assertNotIn('REG00032', self.server.clients)
+        self.assertFalse(LockBoard.objects.filter(device_id='REG00032').exists())
+
+class ClosingWriter(FakeWriter):
+    """Писатель, закрытие которого завершается только по released"""
+
+    def __init__(self):
+        super().__init__()
+        self.released = asyncio.Event()
+
+    def get_extra_info(self, name):
+        return ('10.0.0.1', 5000) if name == 'peername' else None
+
+    async def wait_closed(self):
+        await self.released.wait()
+
+
+class ClientConnectionTests(ServerTestMixin, TransactionTestCase):
+    def test_command_while_connection_closes(self):
+        LockBoard.objects.create(device_id='CON00001', board_address=1)
+        self.server.registry.load()
+
+        async def run():
+            reader = asyncio.StreamReader()
+            writer = ClosingWriter()
+            reader.feed_data(frame(1, VoungProtocol.CMD_REGISTER, b'CON00001\x00\x25'))
+            reader.feed_eof()
+            handler = asyncio.ensure_future(self.server.handle_client(reader, writer))
+            while not writer.closed:
+                await asyncio.sleep(0)
+            # Соединение закрывается, но ещё не закрыто
+            result = await self.server.execute_command('CON00001', VoungProtocol.CMD_OPEN_SINGLE, b'\x01')
+            writer.released.set()
+            await handler
+            return result
+
+        result = asyncio.run(run())
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error'], 'Плата не подключена')
+        self.assertEqual(self.server.sessions, {})
+
+
+class DBExecutorTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = DBExecutor(workers=1, queue_limit=10, shed_depth=2)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.done = []
+
+    def block(self):
+        self.started.set()
+        self.release.wait(5)
+
+    def job(self, name):
+        self.done.append(name)
+        return name
+
+    async def blocked(self):
+        """Занятый поток пула: следующие запросы ждут в очереди"""
+        blocker = asyncio.ensure_future(self.executor.run_sync(DBExecutor.COMMAND, self.block))
+        await asyncio.get_running_loop().run_in_executor(None, self.started.wait, 5)
+        return blocker
+
+    def test_command_lane_runs_first(self):
+        async def run():
+            blocker = await self.blocked()
+            jobs = [asyncio.ensure_future(self.executor.run_sync(priority, self.job, name)) for priority, name in (
+                (DBExecutor.PRESENCE, 'presence'), (DBExecutor.STATUS, 'status-1'),
+                (DBExecutor.COMMAND, 'command'), (DBExecutor.STATUS, 'status-2'),
+            )]
+            await asyncio.sleep(0)
+            self.release.set()
+            results = await asyncio.gather(*jobs)
+            await blocker
+            return results
+
+        self.addCleanup(self.executor.close)
+        self.assertEqual(asyncio.run(run()), ['presence', 'status-1', 'command', 'status-2'])
+        self.assertEqual(self.done, ['command', 'status-1', 'status-2', 'presence'])
+        self.assertEqual(self.executor.stats()['lanes']['status']['completed'], 2)
+
+    def test_presence_is_shed_behind_commands(self):
+        async def run():
+            blocker = await self.blocked()
+            commands = [asyncio.ensure_future(self.executor.run_sync(DBExecutor.COMMAND, self.job, index))
+                        for index in range(2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(DBOverloaded):
+                await self.executor.run_sync(DBExecutor.PRESENCE, self.job, 'presence')
+            self.release.set()
+            await asyncio.gather(blocker, *commands)
+
+        self.addCleanup(self.executor.close)
+        asyncio.run(run())
+        self.assertEqual(self.executor.lanes[DBExecutor.PRESENCE].rejected, 1)
+
+    def test_close_drains_accepted_jobs(self):
+        async def run():
+            blocker = await self.blocked()
+            jobs = [asyncio.ensure_future(self.executor.run_sync(DBExecutor.STATUS, self.job, index))
+                    for index in range(3)]
+            await asyncio.sleep(0)
+            threads = list(self.executor._threads)
+            self.executor.close()
+            self.release.set()
+            results = await asyncio.gather(blocker, *jobs)
+            for thread in threads:
+                thread.join(5)
+                self.assertFalse(thread.is_alive())
+            return results[1:]
+
+        self.assertEqual(asyncio.run(run()), [0, 1, 2])
+
+
+class RecordingDB:
+    """DBExecutor без БД: запоминает аргументы запросов, первые fail_times падают"""
+
+    def __init__(self, fail_times: int = 0):
+        self.calls = []
+        self.fail_times = fail_times
+        self.during_call = None  # вызывается во время "записи"
+
+    async def run_sync(self, priority, func, *args, **kwargs):
+        self.calls.append(args)
+        if self.during_call:
+            self.during_call()
+        if len(self.calls) <= self.fail_times:
+            raise RuntimeError('database is locked')
+
+
+class StatusWriteQueueTests(SimpleTestCase):
+    def test_batch_keeps_latest_status(self):
+        db = RecordingDB()
+        queue = StatusWriteQueue(db, flush_interval=60, batch_size=100)
+        queue.put(1, 0, 't1')
+        queue.put(2, 0, 't1')
+        queue.put(1, 1, 't2')
+        queue.put(1, 0, 't3')
+        queue.put_board(7, 0b01, 't1')
+        queue.put_board(7, 0b11, 't3')
+        asyncio.run(queue.flush())
+        self.assertEqual(db.calls, [({1: (0, 't3'), 2: (0, 't1')}, {7: (0b11, 't3')})])
+        self.assertEqual((queue.received, queue.coalesced, queue.written), (4, 2, 2))
+        self.assertEqual(queue.depth, 0)
+
+    def test_failed_write_is_requeued(self):
+        db = RecordingDB(fail_times=1)
+        queue = StatusWriteQueue(db, flush_interval=60, batch_size=100)
+        queue.put(1, 0, 't1')
+        queue.put(2, 0, 't1')
+        queue.put_board(7, 0b11, 't1')
+        # Замок 1 меняется, пока неудачная пачка пишется
+        db.during_call = lambda: queue.put(1, 1, 't2')
+
+        asyncio.run(queue.flush())
+        self.assertEqual(queue.failed_flushes, 1)
+        self.assertEqual(queue.pending, {1: (1, 't2'), 2: (0, 't1')})
+        self.assertEqual(queue.pending_boards, {7: (0b11, 't1')})
+
+        db.during_call = None
+        asyncio.run(queue.flush())
+        self.assertEqual(db.calls[-1], ({1: (1, 't2'), 2: (0, 't1')}, {7: (0b11, 't1')}))
+        self.assertEqual(queue.depth, 0)
+        self.assertEqual(queue.written, 2)
+
+class OutboundQueueTests(SimpleTestCase):
+    def run_queue(self, policy: str, scenario):
+        async def run():
+            writer = FakeWriter()
+            queue = OutboundQueue(writer, max_bytes=10000, max_frames=3, policy=policy).start()
+            try:
+                return scenario(queue), queue, writer
+            finally:
+                await asyncio.sleep(0)
+                queue.close()
+                await asyncio.sleep(0)
+        return asyncio.run(run())
+
+    def test_put_requires_running_task(self):
+        queue = OutboundQueue(FakeWriter(), max_bytes=100, max_frames=10, policy=OutboundQueue.POLICY_REJECT)
+        with self.assertRaises(ConnectionResetError):
+            queue.put(b'x')
+
+    def test_frames_are_sent_in_one_write(self):
+        def scenario(queue):
+            queue.put(b'a')
+            queue.put(b'b')
+
+        _, queue, writer = self.run_queue(OutboundQueue.POLICY_REJECT, scenario)
+        self.assertEqual(writer.chunks, [b'a', b'b'])
+        self.assertEqual(queue.writes, 1)
+        self.assertEqual(queue.sent_frames, 2)
+        self.assertEqual(queue.sent_bytes, 2)
+
+    def test_reject_policy(self):
+        def scenario(queue):
+            for payload in (b'1', b'2', b'3'):
+                queue.put(payload, droppable=True)
+            queue.put(b'4', droppable=True)  # вытеснять нечего - ACK молча отбрасывается
+            with self.assertRaises(OutboundQueueFull):
+                queue.put(b'cmd')
+
+        _, queue, writer = self.run_queue(OutboundQueue.POLICY_REJECT, scenario)
+        self.assertEqual(writer.chunks, [b'1', b'2', b'3'])
+        self.assertEqual(queue.dropped_frames, 1)
+        self.assertEqual(queue.rejected_frames, 1)
+
+    def test_drop_oldest_ack_policy(self):
+        def scenario(queue):
+            queue.put(b'ack1', droppable=True)
+            queue.put(b'cmd1')
+            queue.put(b'ack2', droppable=True)
+            queue.put(b'cmd2')  # вытесняет ack1
+            queue.put(b'cmd3')  # вытесняет ack2
+            with self.assertRaises(OutboundQueueFull):
+                queue.put(b'cmd4')  # ACK не осталось
+
+        _, queue, writer = self.run_queue(OutboundQueue.POLICY_DROP_OLDEST_ACK, scenario)
+        self.assertEqual(writer.chunks, [b'cmd1', b'cmd2', b'cmd3'])
+        self.assertEqual(queue.dropped_frames, 2)
+        self.assertEqual(queue.rejected_frames, 1)
+
+    def test_byte_limit(self):
+        async def run():
+            queue = OutboundQueue(FakeWriter(), max_bytes=4, max_frames=100,
+                                  policy=OutboundQueue.POLICY_REJECT).start()
+            queue.put(b'abc')
+            with self.assertRaises(OutboundQueueFull):
+                queue.put(b'de')
+            queue.close()
+            await asyncio.sleep(0)
+        asyncio.run(run())
+
+
+
+class HeartbeatWatchdogTests(SimpleTestCase):
+    """Колесо из 11 слотов по 1 сек: ключ истекает не раньше дедлайна и не позже следующего тика"""
+
+    def setUp(self):
+        patcher = mock.patch('locks.watchdog.time.monotonic', return_value=1000.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.watchdog = HeartbeatWatchdog(self.ignore, timeout=10, tick=1)
+
+    async def ignore(self, keys):
+        pass
+
+    def advance(self, moment: float) -> list:
+        self.clock.return_value = 1000.0 + moment
+        return self.watchdog.advance()
+
+    def touch(self, moment: float, key):
+        self.clock.return_value = 1000.0 + moment
+        self.watchdog.touch(key)
+
+    def test_expires_after_timeout(self):
+        self.watchdog.add('a')
+        self.clock.return_value = 1003.0
+        self.watchdog.add('b')
+        self.assertEqual(self.advance(9.9), [])
+        self.assertEqual(self.advance(11), ['a'])
+        self.assertEqual(self.advance(12.9), [])
+        self.assertEqual(self.advance(14), ['b'])
+        self.assertEqual(len(self.watchdog), 0)
+        self.assertEqual(self.watchdog.expired_total, 2)
+
+    def test_touch_moves_deadline(self):
+        self.watchdog.add('a')
+        self.touch(6, 'a')
+        self.assertEqual(self.advance(11), [])
+        self.assertEqual(self.advance(15.9), [])
+        self.assertEqual(self.advance(17), ['a'])
+
+    def test_remove_cancels_deadline(self):
+        self.watchdog.add('a')
+        self.watchdog.remove('a')
+        self.watchdog.touch('a')  # после remove ключ не возвращается
+        self.assertEqual(self.advance(30), [])
+        self.assertEqual(len(self.watchdog), 0)
+
+    def test_deadlines_beyond_one_turn(self):
+        self.watchdog.add('a')
+        # Активность дольше нескольких оборотов колеса
+        for moment in range(5, 50, 5):
+            self.touch(moment, 'a')
+            self.assertEqual(self.advance(moment + 0.5), [])
+        self.assertEqual(self.advance(54.9), [])
+        self.assertEqual(self.advance(56), ['a'])
+
+    def test_stalled_loop_longer_than_turn(self):
+        self.watchdog.add('a')
+        self.clock.return_value = 1030.0
+        self.watchdog.add('b')  # колесо не продвигалось 30 сек
+        self.assertEqual(self.advance(31), ['a'])
+        self.assertEqual(self.advance(39.9), [])
+        self.assertEqual(self.advance(41), ['b'])
+
+
+class WatchdogConnectionTests(SimpleTestCase):
+    def test_idle_connection_is_closed(self):
+        server = LockControlServer()
+        server.watchdog = HeartbeatWatchdog(server.expire_connections, timeout=0.05, tick=0.01)
+        idle, active = FakeWriter(), FakeWriter()
+
+        async def run():
+            task = asyncio.ensure_future(server.watchdog.run())
+            server.watchdog.add(idle)
+            server.watchdog.add(active)
+            for _ in range(15):
+                await asyncio.sleep(0.01)
+                server.watchdog.touch(active)
+            task.cancel()
+
+        asyncio.run(run())
+        self.assertTrue(idle.closed)
+        self.assertFalse(active.closed)
+        self.assertEqual(server.watchdog.expired_total, 1)
+
+
+
+class EventHubTests(SimpleTestCase):
+    def hub_with_events(self, count: int, history_size: int = 100) -> EventHub:
+        hub = EventHub(history_size)
+        for channel in range(1, count + 1):
+            hub.publish('status', board_id=1, channel=channel, status=0)
+        return hub
+
+    @staticmethod
+    def seqs(subscription) -> list:
+        return [event.get('seq', event['type']) for event in subscription.queue]
+
+    def test_event_ids(self):
+        hub = self.hub_with_events(2)
+        self.assertEqual([event_id(event) for event in hub.history], [f'{hub.epoch}:1', f'{hub.epoch}:2'])
+        self.assertEqual(parse_event_id(f'{hub.epoch}:2'), (hub.epoch, 2))
+        self.assertEqual(parse_event_id('7'), (None, 7))
+        with self.assertRaises(ValueError):
+            parse_event_id(f'{hub.epoch}:x')
+
+    def test_resume_within_history(self):
+        hub = self.hub_with_events(5)
+        self.assertEqual(self.seqs(hub.subscribe(since=3, epoch=hub.epoch)), [4, 5])
+        self.assertEqual(self.seqs(hub.subscribe(since=5, epoch=hub.epoch)), [])
+
+    def test_resume_beyond_history_resets(self):
+        hub = self.hub_with_events(6, history_size=3)
+        self.assertEqual(self.seqs(hub.subscribe(since=1, epoch=hub.epoch)), ['reset', 4, 5, 6])
+
+    def test_other_epoch_resets(self):
+        hub = self.hub_with_events(3)
+        # seq совпадает, но это seq прошлого запуска сервера
+        self.assertEqual(self.seqs(hub.subscribe(since=3, epoch='0badc0de')), ['reset', 1, 2, 3])
+        self.assertEqual(self.seqs(hub.subscribe(since=2, epoch=None)), ['reset', 1, 2, 3])
+
+    def test_filters(self):
+        hub = self.hub_with_events(3)
+        hub.publish('online', board_id=2)
+        self.assertEqual(self.seqs(hub.subscribe(boards=[1], channels=[2], since=0, epoch=hub.epoch)), [2])
+
+    def test_slow_subscriber_is_dropped(self):
+        with self.settings(LOCK_EVENT_SUBSCRIBER_BUFFER=2):
+            hub = EventHub()
+            subscription = hub.subscribe()
+        for channel in range(1, 5):
+            hub.publish('status', board_id=1, channel=channel, status=0)
+
+        async def drain():
+            return [event.get('seq', event['type']) async for event in subscription]
+
+        self.assertEqual(asyncio.run(drain()), [1, 2, 'dropped'])
+        self.assertNotIn(subscription, hub.subscribers)
+        self.assertEqual(hub.dropped_total, 1)
+
+
+class LockEventStreamViewTests(SimpleTestCase):
+    def setUp(self):
+        self.hub = EventHub()
+        for channel in (1, 2, 3):
+            self.hub.publish('status', board_id=1, channel=channel, status=0)
+        for patcher in (mock.patch.object(lock_server, 'is_running', True),
+                        mock.patch.object(lock_server, 'events', self.hub)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def stream(self, **headers) -> list:
+        """События потока (тип, id) до его завершения по LOCK_EVENT_STREAM_TIMEOUT"""
+        with self.settings(LOCK_EVENT_STREAM_TIMEOUT=0.05, LOCK_EVENT_KEEPALIVE=0.02):
+            response = await self.async_client.get(reverse('lock-events'), headers=headers)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        events = []
+        for block in body.split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+            if 'event' in fields:
+                events.append((fields['event'], fields.get('id')))
+        return events
+
+    async def test_resume_from_last_event_id(self):
+        events = await self.stream(**{'Last-Event-ID': f'{self.hub.epoch}:1'})
+        self.assertEqual(events, [('status', f'{self.hub.epoch}:2'), ('status', f'{self.hub.epoch}:3')])
+
+    async def test_other_epoch_resets(self):
+        events = await self.stream(**{'Last-Event-ID': '0badc0de:3'})
+        self.assertEqual(events[0], ('reset', None))
+        self.assertEqual([item[1] for item in events[1:]], [f'{self.hub.epoch}:{seq}' for seq in (1, 2, 3)])
+
+    async def test_invalid_last_event_id(self):
+        response = await self.async_client.get(reverse('lock-events'), headers={'Last-Event-ID': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+class SessionTests(SimpleTestCase):
+    def test_rtt_percentiles(self):
+        histogram = RttHistogram()
+        self.assertIsNone(histogram.percentile(50))
+        for seconds in [0.004] * 90 + [0.04] * 9 + [0.7]:
+            histogram.observe(seconds)
+        self.assertEqual(histogram.percentile(50), 0.005)
+        self.assertEqual(histogram.percentile(99), 0.05)
+        self.assertEqual(histogram.percentile(100), 0.7)
+
+    def test_percentile_not_above_max(self):
+        histogram = RttHistogram()
+        histogram.observe(0.0042)
+        self.assertEqual(histogram.percentile(50), 0.0042)
+
+    def test_timestamps_follow_api_time_zone(self):
+        session = ClientSession(('10.0.0.1', 5000))
+        session.connected_at = 1700000000.5  # 2023-11-14 22:13:20.5 UTC
+        session.last_heartbeat = None
+        with self.settings(TIME_ZONE='Asia/Bishkek', USE_TZ=False):
+            self.assertEqual(session.as_dict(now=1700000010)['connected_at'], '2023-11-15T04:13:20.500')
+        with self.settings(TIME_ZONE='Asia/Bishkek', USE_TZ=True):
+            self.assertEqual(session.as_dict(now=1700000010)['connected_at'], '2023-11-15T04:13:20.500+06:00')
+        self.assertIsNone(session.as_dict()['last_heartbeat'])
+
+    def test_query_sessions(self):
+        items = []
+        for index, device_id in enumerate(['B2', None, 'A1', 'A3']):
+            session = ClientSession(('10.0.0.%d' % index, 5000))
+            session.device_id = device_id
+            session.connected_at = 1000.0 + index
+            if device_id:
+                session.command_done({'success': True, 'latency': 0.01 * (index + 1)})
+            items.append(session.as_dict(now=2000.0))
+
+        page = query_sessions(items, {'ordering': '-device_id'})
+        self.assertEqual([item['device_id'] for item in page['results']], ['B2', 'A3', 'A1', None])
+
+        page = query_sessions(items, {'device_id': 'A', 'ordering': 'rtt_p99_ms'})
+        self.assertEqual([item['device_id'] for item in page['results']], ['A1', 'A3'])
+
+        page = query_sessions(items, {'registered': False})
+        self.assertEqual(page['count'], 1)
+
+        page = query_sessions(items, {'offset': 1, 'limit': 2})
+        self.assertEqual(page['count'], 4)
+        self.assertEqual([item['ip'] for item in page['results']], ['10.0.0.1', '10.0.0.2'])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        board = LockBoard.objects.create(device_id='PAGE0001')
+        moment = datetime(2024, 1, 1, 12, 0)
+        # Несколько записей с одинаковым временем - граница страницы делится по id
+        LockOperation.objects.bulk_create(
+            LockOperation(board=board, operation_type='open_single', created_at=moment.replace(second=index // 3))
+            for index in range(10)
+        )
+        cls.expected = list(LockOperation.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def page(self, url):
+        paginator = KeysetPagination()
+        request = Request(APIRequestFactory().get(url))
+        items = paginator.paginate_queryset(LockOperation.objects.all(), request)
+        return [item.id for item in items], paginator.next_link, paginator.previous_link
+
+    def test_walk_forward_and_back(self):
+        seen = []
+        url = '/api/operations/?page_size=4'
+        pages = []
+        while url:
+            ids, url, previous = self.page(url)
+            pages.append((ids, previous))
+            seen.extend(ids)
+        self.assertEqual(seen, self.expected)
+        self.assertIsNone(pages[0][1])
+
+        # Назад с последней страницы - предыдущая страница целиком
+        ids, _, _ = self.page(pages[-1][1])
+        self.assertEqual(ids, pages[-2][0])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(NotFound):
+            self.page('/api/operations/?cursor=bm90LWEtY3Vyc29y')
+
+    def test_page_size_bounds(self):
+        ids, _, _ = self.page('/api/operations/?page_size=0')
+        self.assertEqual(len(ids), 1)
+        ids, _, _ = self.page('/api/operations/?page_size=abc')
+        self.assertEqual(len(ids), 10)
+
+
+
+class LockBoardListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.boards = [LockBoard.objects.create(device_id=f'LIST{index:04d}', total_channels=2) for index in range(3)]
+        for board in cls.boards:
+            Lock.objects.bulk_create(Lock(board=board, channel=channel, status=channel % 2) for channel in (1, 2))
+
+    def get(self, **params):
+        response = self.client.get(reverse('board-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_default_nests_locks(self):
+        boards = self.get()
+        self.assertEqual([board['device_id'] for board in boards], ['LIST0000', 'LIST0001', 'LIST0002'])
+        # Прежняя форма ответа LockBoardSerializer: все поля платы и её замки
+        self.assertEqual(set(boards[0]), set(LockBoardSerializer().fields))
+        self.assertEqual(set(boards[0]['locks'][0]), set(LockSerializer().fields))
+        self.assertEqual([(lock['channel'], lock['status_display']) for lock in boards[0]['locks']],
+                         [(1, 'Закрыт'), (2, 'Открыт')])
+
+    def test_slim_list(self):
+        boards = self.get(expand='')
+        self.assertNotIn('locks', boards[0])
+        self.assertEqual(self.get(fields='device_id,is_online', expand=''),
+                         [{'device_id': board.device_id, 'is_online': False} for board in self.boards])
+
+    def test_fields_with_locks(self):
+        boards = self.get(fields='device_id', expand='locks', page_size=2)
+        self.assertEqual(boards['count'], 3)
+        self.assertEqual(set(boards['results'][0]), {'device_id', 'locks'})
+        self.assertEqual(len(boards['results'][1]['locks']), 2)
+
+    def test_unknown_values(self):
+        for params in ({'fields': 'device_id,secret'}, {'expand': 'operations'}):
+            response = self.client.get(reverse('board-list'), params)
+            self.assertEqual(response.status_code, 400)
+
+
+class LockOperationListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        board = LockBoard.objects.create(device_id='OPS00001')
+        for day, hour in ((1, 9), (1, 18), (2, 9), (3, 9)):
+            LockOperation.objects.create(board=board, operation_type='open_single',
+                                         created_at=datetime(2024, 5, day, hour))
+
+    def created(self, **params) -> list:
+        response = self.client.get(reverse('operation-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return [item['created_at'][:13] for item in response.json()['results']]
+
+    def test_since_until_dates(self):
+        self.assertEqual(self.created(since='2024-05-02'), ['2024-05-03T09', '2024-05-02T09'])
+        # until не включается
+        self.assertEqual(self.created(until='2024-05-02'), ['2024-05-01T18', '2024-05-01T09'])
+        self.assertEqual(self.created(since='2024-05-02', until='2024-05-03'), ['2024-05-02T09'])
+
+    def test_since_until_datetimes(self):
+        self.assertEqual(self.created(since='2024-05-01T12:00', until='2024-05-02T09:00'), ['2024-05-01T18'])
+        # Время с поясом приводится к локальному (USE_TZ=False)
+        with self.settings(TIME_ZONE='UTC'):
+            self.assertEqual(self.created(since='2024-05-02T12:00+03:00'), ['2024-05-03T09', '2024-05-02T09'])
+
+    def test_invalid_moment(self):
+        for name in ('since', 'until'):
+            response = self.client.get(reverse('operation-list'), {name: '02.05.2024'})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {name: 'Неверный формат даты'})
+
+class AuditWriterTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool_dir = directory.name
+        self.writer = AuditWriter(self.spool_dir, batch_size=1000, flush_interval=3600)
+        self.addCleanup(atexit.unregister, self.writer.close)
+
+    def operation(self):
+        return LockOperation(board_id=1, operation_type='open_single', channels=[1], success=True,
+                             created_at=timezone.now())
+
+    def test_close_removes_empty_segment(self):
+        self.writer.log([])
+        self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+        self.writer.close()
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_close_keeps_unwritten_operations(self):
+        with mock.patch.object(AuditWriter, 'write', side_effect=RuntimeError('БД недоступна')):
+            self.writer.log([self.operation()])
+            self.writer.close()
+        files = os.listdir(self.spool_dir)
+        self.assertEqual(len(files), 2)  # несохранённый сегмент и новый текущий
+        with open(os.path.join(self.spool_dir, sorted(files)[0]), encoding='utf-8') as spool:
+            self.assertEqual(len(spool.readlines()), 1)
+
+    def test_rotation_syncs_segment(self):
+        self.writer.log([self.operation()])
+        descriptor = self.writer.spool.fileno()
+        with mock.patch.object(AuditWriter, 'write'), mock.patch('locks.audit.os.fsync') as fsync:
+            self.writer.flush()
+        fsync.assert_called_once_with(descriptor)
+
+    def test_close_syncs_unwritten_operations(self):
+        with mock.patch.object(AuditWriter, 'write', side_effect=RuntimeError('БД недоступна')), \
+                mock.patch('locks.audit.os.fsync') as fsync:
+            self.writer.log([self.operation()])
+            self.writer.close()
+        # Сегмент с операцией - при ротации, текущий - при завершении
+        self.assertEqual(fsync.call_count, 2)
+
+    def test_log_after_close_reopens_segment(self):
+        with mock.patch.object(AuditWriter, 'write'):
+            self.writer.log([self.operation()])
+            self.writer.close()
+            self.assertEqual(os.listdir(self.spool_dir), [])
+            self.writer.log([self.operation()])
+            self.assertEqual(len(os.listdir(self.spool_dir)), 1)
+            self.writer.close()
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+
+class OperationCounterTests(TestCase):
+    def add_operations(self, board, success, failed):
+        LockOperation.objects.bulk_create(
+            [LockOperation(board=board, operation_type='open_single', success=True) for _ in range(success)]
+            + [LockOperation(board=board, operation_type='open_single', success=False) for _ in range(failed)]
+        )
+        count_operations(success, failed)
+
+    def test_board_delete_discounts_operations(self):
+        kept = LockBoard.objects.create(device_id='KEEP0001')
+        deleted = LockBoard.objects.create(device_id='DROP0001')
+        self.add_operations(kept, 2, 1)
+        self.add_operations(deleted, 3, 2)
+        # Перенесённые в архив операции учтены в счётчиках через сводки
+        DailyOperationSummary.objects.create(board=deleted, date=datetime(2024, 1, 1).date(),
+                                             operation_type='open_single', total=4, success=1)
+        count_operations(1, 3)
+
+        deleted.delete()
+        self.assertEqual(operation_totals(), {'total': 3, 'success': 2, 'failed': 1})
+
+    def test_queryset_delete_discounts_operations(self):
+        for index in range(3):
+            self.add_operations(LockBoard.objects.create(device_id=f'QS{index:06d}'), 1, 1)
+        LockBoard.objects.filter(device_id__startswith='QS').exclude(device_id='QS000000').delete()
+        self.assertEqual(operation_totals(), {'total': 2, 'success': 1, 'failed': 1})
+
+    def test_counter_created_concurrently(self):
+        # Другая операция создаёт счётчик между нашим UPDATE и созданием недостающих
+        OperationCounter.objects.all().delete()
+        create = OperationCounter.objects.get_or_create
+
+        def racing_get_or_create(name, defaults):
+            OperationCounter.objects.bulk_create([OperationCounter(name=name, value=10)], ignore_conflicts=True)
+            return create(name=name, defaults=defaults)
+
+        with mock.patch.object(OperationCounter.objects, 'get_or_create', side_effect=racing_get_or_create):
+            count_operations(2, 1)
+        self.assertEqual(operation_totals(), {'total': 23, 'success': 12, 'failed': 11})
+
+
+class PruneOperationsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.archive_dir = os.path.join(directory.name, 'archive')
+        self.first = LockBoard.objects.create(device_id='PRUNE001')
+        self.second = LockBoard.objects.create(device_id='PRUNE002')
+        self.old_day = timezone.now().date() - timedelta(days=40)
+
+    def add(self, board, day, success: bool, count: int = 1):
+        LockOperation.objects.bulk_create(
+            LockOperation(board=board, operation_type='open_single', channels=[1], success=success,
+                          created_at=datetime.combine(day, time(12, index)))
+            for index in range(count)
+        )
+        count_operations(count if success else 0, 0 if success else count)
+
+    def prune(self, *args) -> str:
+        out = io.StringIO()
+        call_command('prune_operations', '--days=30', '--pause=0', '--chunk-size=2',
+                     f'--archive-dir={self.archive_dir}', *args, stdout=out)
+        return out.getvalue()
+
+    def archived(self) -> list:
+        rows = []
+        for name in sorted(os.listdir(self.archive_dir)):
+            with gzip.open(os.path.join(self.archive_dir, name), 'rt', encoding='utf-8') as archive:
+                rows.extend(json.loads(line) for line in archive)
+        return rows
+
+    def summaries(self) -> dict:
+        return {(board_id, date, total, success) for board_id, date, total, success in
+                DailyOperationSummary.objects.values_list('board_id', 'date', 'total', 'success')}
+
+    def test_archive_and_summaries(self):
+        previous_day = self.old_day - timedelta(days=1)
+        self.add(self.first, self.old_day, True, 3)
+        self.add(self.first, self.old_day, False)
+        self.add(self.second, previous_day, True)
+        self.add(self.first, timezone.now().date(), True, 2)  # свежие операции остаются
+        old_ids = set(LockOperation.objects.filter(created_at__date__lt=timezone.now().date())
+                      .values_list('id', flat=True))
+        totals = operation_totals()
+
+        self.assertIn('Перенесено в архив 5 операций', self.prune())
+        self.assertEqual(LockOperation.objects.count(), 2)
+        rows = self.archived()
+        self.assertEqual({row['id'] for row in rows}, old_ids)
+        self.assertEqual(os.listdir(self.archive_dir)[0][:11], 'operations-')
+        self.assertEqual(rows[0]['channels'], [1])
+        self.assertEqual(self.summaries(), {
+            (self.first.pk, self.old_day, 4, 3),
+            (self.second.pk, previous_day, 1, 1),
+        })
+        # Перенесённые в архив операции остаются в счётчиках
+        self.assertEqual(operation_totals(), totals)
+
+        # Повторный запуск дописывает архив и увеличивает существующую сводку
+        self.add(self.first, self.old_day, False, 2)
+        self.prune()
+        self.assertEqual(len(self.archived()), 7)
+        self.assertIn((self.first.pk, self.old_day, 6, 3), self.summaries())
+        self.assertEqual(operation_totals(), {'total': 9, 'success': 6, 'failed': 3})
+
+    def test_dry_run(self):
+        self.add(self.first, self.old_day, True, 3)
+        self.assertIn(': 3', self.prune('--dry-run'))
+        self.assertEqual(LockOperation.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.archive_dir))
+        self.assertFalse(DailyOperationSummary.objects.exists())
+
+class FakeWorkerBus:
+    def __init__(self, states=None):
+        self.states = states
+
+    async def request(self, op, device_id, cmd=0, data=b'', timeout=None):
+        if op != OP_BOARD_STATES or self.states is None:
+            return error_result('TCP сервер недоступен')
+        return ok_result(data=json.dumps(self.states).encode())
+
+
+class WorkerSupervisorStatsTests(SimpleTestCase):
+    def stats(self, supervisor) -> dict:
+        result = asyncio.run(supervisor.handle_bus_request(OP_STATS, '', 0, b'', None))
+        self.assertTrue(result['success'], result['error'])
+        return json.loads(result['data'])
+
+    def test_board_state_from_last_owner(self):
+        supervisor = WorkerSupervisor(2, '127.0.0.1', 0)
+        # Оба процесса знают обе платы, B1 подключена к процессу 1, A1 отключилась от него
+        supervisor.worker_buses = {
+            0: FakeWorkerBus({'A1': [4, 0], 'B1': [4, 0], 'C1': [2, 1]}),
+            1: FakeWorkerBus({'A1': [4, 3], 'B1': [4, 2], 'C1': [2, 0]}),
+        }
+
+        async def claims():
+            await supervisor.handle_bus_request(OP_CLAIM_BOARD, 'A1', 0, bytes([1]), None)
+            await supervisor.handle_bus_request(OP_CLAIM_BOARD, 'B1', 0, bytes([1]), None)
+            await supervisor.handle_bus_request(OP_RELEASE_BOARD, 'A1', 0, bytes([1]), None)
+
+        asyncio.run(claims())
+        self.assertEqual(self.stats(supervisor), {
+            'boards': {'total': 3, 'online': 1, 'offline': 2},
+            'locks': {'total': 10, 'open': 6, 'closed': 4},
+        })
+
+    def test_worker_without_answer(self):
+        supervisor = WorkerSupervisor(2, '127.0.0.1', 0)
+        supervisor.worker_buses = {0: FakeWorkerBus(), 1: FakeWorkerBus({'A1': [2, 2]})}
+        self.assertEqual(self.stats(supervisor)['locks'], {'total': 2, 'open': 2, 'closed': 0})
+
+        supervisor.worker_buses = {0: FakeWorkerBus(), 1: FakeWorkerBus()}
+        result = asyncio.run(supervisor.handle_bus_request(OP_STATS, '', 0, b'', None))
+        self.assertFalse(result['success'])
+
+
+class BoardCommandViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.board = LockBoard.objects.create(device_id='VIEW0001', total_channels=4)
+
+    def post(self, name, body, board_id=None, **headers):
+        return self.client.post(reverse(name, args=[board_id or self.board.pk]), body,
+                                content_type='application/json', **headers)
+
+    def test_unknown_board(self):
+        response = self.post('open-single-lock', {'channel': 1}, board_id=self.board.pk + 100)
+        self.assertEqual(response.status_code, 404)
+
+    def test_channel_validation(self):
+        response = self.post('open-single-lock', {'channel': 9})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': 'Неверный номер канала'})
+
+    def test_malformed_json(self):
+        response = self.client.post(reverse('open-single-lock', args=[self.board.pk]), '{channel',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_token_is_rejected(self):
+        response = self.post('open-single-lock', {'channel': 1}, HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(response.status_code, 401)
+
+    def test_board_state(self):
+        response = self.client.get(reverse('board-state', args=[self.board.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['statuses'], [1, 1, 1, 1])
+
+    def test_content_negotiation(self):
+        url = reverse('board-state', args=[self.board.pk])
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        response = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertContains(response, '&quot;statuses&quot;')
+
+    def test_method_not_allowed(self):
+        response = self.client.get(reverse('open-single-lock', args=[self.board.pk]))
+        self.assertEqual(response.status_code, 405)
+
+    def test_read_status_uses_board_reply(self):
+        Lock.objects.create(board=self.board, channel=1, status=1)
+        reply = {'success': True, 'status': 0, 'data': b'\x01\x00', 'latency': 0.01, 'attempts': 1, 'error': ''}
+        with mock.patch('locks.views.lock_server.dispatch_command', mock.AsyncMock(return_value=reply)):
+            response = self.client.get(reverse('read-lock-status', args=[self.board.pk]), {'channel': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['current_status'], 'Открыт')
+
+    def test_commands_in_schema(self):
+        schema = json.loads(self.client.get('/swagger/?format=openapi').content)
+        paths = {schema['basePath'] + path for path in schema['paths']}
+        for name in ('open-single-lock', 'read-all-status', 'bulk-command'):
+            url = reverse(name, args=[] if name == 'bulk-command' else [1]).replace('/1/', '/{board_id}/')
+            self.assertIn(url, paths)
+
+
+class ReadStatusTests(SimpleTestCase):
+    def server_with_board(self, reply: bytes):
+        server = LockControlServer()
+        record = BoardRecord(1, 'RS000001', 1, 4, is_online=True)
+        for channel in range(1, 5):
+            record.set_lock(channel, 100 + channel, 1)
+        server.registry.add(record)
+
+        async def execute_command(device_id, cmd, data=b'', timeout=None, retries=None):
+            return {'success': True, 'status': 0, 'data': reply, 'latency': 0.01, 'attempts': 1, 'error': ''}
+
+        server.execute_command = execute_command
+        return server, record
+
+    def test_reply_updates_channel_and_mask(self):
+        server, record = self.server_with_board(b'\x02\x00')
+        result = asyncio.run(server.submit_command('RS000001', VoungProtocol.CMD_READ_STATUS, b'\x02'))
+        self.assertTrue(result['success'])
+        self.assertEqual(list(record.statuses), [1, 0, 1, 1])
+        self.assertEqual(server.status_queue.pending[102][0], 0)
+        self.assertEqual(server.status_queue.pending_boards[1][0], record.open_mask())
+        self.assertEqual(server.registry.open_locks, 1)
+        self.assertEqual(server.events.history[-1]['type'], 'status')
+
+    def test_unchanged_or_foreign_reply_writes_nothing(self):
+        for reply in (b'\x02\x01', b'\x03\x00', b''):
+            server, record = self.server_with_board(reply)
+            asyncio.run(server.submit_command('RS000001', VoungProtocol.CMD_READ_STATUS, b'\x02'))
+            self.assertEqual(list(record.statuses), [1, 1, 1, 1])
+            self.assertEqual(server.status_queue.pending, {})
+
+    def test_parse_lock_status(self):
+        self.assertEqual(VoungProtocol.parse_lock_status(b'\x02\x00', 2), 0)
+        self.assertEqual(VoungProtocol.parse_lock_status(b'\x02\x05', 2), 1)
+        self.assertIsNone(VoungProtocol.parse_lock_status(b'\x03\x00', 2))
+        self.assertIsNone(VoungProtocol.parse_lock_status(b'\x02', 2))
+
+
+class ExecuteCommandTests(SimpleTestCase):
+    device_id = 'CMD00001'
+    OPEN = VoungProtocol.CMD_OPEN_SINGLE
+
+    def run_server(self, scenario):
+        async def run():
+            server = LockControlServer()
+            writer = FakeWriter()
+            server.outbound[writer] = OutboundQueue(writer).start()
+            server.clients[self.device_id] = (writer, LockBoard(pk=1, device_id=self.device_id, board_address=1))
+            try:
+                return await scenario(server, writer)
+            finally:
+                server.outbound[writer].close()
+                self.assertEqual(server.pending, {})
+        return asyncio.run(run())
+
+    def command(self, server, channel: int, timeout=1.0, retries=0):
+        return asyncio.ensure_future(
+            server.execute_command(self.device_id, self.OPEN, bytes([channel]), timeout=timeout, retries=retries)
+        )
+
+    def reply(self, server, *data):
+        server.handle_command_response(self.device_id, VoungProtocol.parse_frame(frame(1, self.OPEN, bytes(data))))
+
+    @staticmethod
+    async def sent(writer, count: int):
+        """Ожидание отправки count фреймов"""
+        while len(writer.chunks) < count:
+            await asyncio.sleep(0.001)
+
+    def test_retry_after_timeout(self):
+        async def scenario(server, writer):
+            command = self.command(server, 2, timeout=0.05, retries=1)
+            await self.sent(writer, 2)
+            self.reply(server, 0x00, 0x02)
+            return await command
+
+        result = self.run_server(scenario)
+        self.assertTrue(result['success'])
+        self.assertEqual(result['attempts'], 2)
+        self.assertEqual(result['data'], b'\x02')
+
+    def test_late_reply_after_timeout(self):
+        async def scenario(server, writer):
+            first = await self.command(server, 1, timeout=0.02)
+            self.reply(server, 0x00, 0x01)  # опоздавший ответ - ждать его уже некому
+            second = self.command(server, 1)
+            await self.sent(writer, 2)
+            self.reply(server, 0x01, 0x01)
+            return first, await second
+
+        first, second = self.run_server(scenario)
+        self.assertFalse(first['success'])
+        self.assertEqual(first['error'], 'Плата не ответила')
+        self.assertEqual(first['attempts'], 1)
+        self.assertEqual(second['status'], 0x01)
+        self.assertFalse(second['success'])
+
+    def test_out_of_order_replies_on_two_channels(self):
+        async def scenario(server, writer):
+            first, second = self.command(server, 1), self.command(server, 2)
+            await self.sent(writer, 2)
+            self.reply(server, 0x00, 0x02)
+            self.reply(server, 0x01, 0x01)
+            return await asyncio.gather(first, second)
+
+        first, second = self.run_server(scenario)
+        self.assertEqual((first['status'], first['data']), (0x01, b'\x01'))
+        self.assertEqual((second['status'], second['data']), (0x00, b'\x02'))
+
+    def test_nack_goes_to_oldest_request(self):
+        async def scenario(server, writer):
+            first, second, third = self.command(server, 1), self.command(server, 2), self.command(server, 1)
+            await self.sent(writer, 3)
+            self.reply(server, 0x00, 0x01)
+            await first
+            # Очередь канала 1 стоит в pending раньше, но самый ранний запрос - к каналу 2
+            self.reply(server, 0xFF)
+            nacked = await second
+            self.reply(server, 0x00, 0x01)
+            return nacked, await third
+
+        nacked, third = self.run_server(scenario)
+        self.assertFalse(nacked['success'])
+        self.assertEqual(nacked['status'], 0xFF)
+        self.assertEqual(nacked['error'], 'Плата вернула статус 0xFF')
+        self.assertTrue(third['success'])
+
+
+class BulkCommandViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.boards = [LockBoard.objects.create(device_id=f'BULK{index:04d}', total_channels=4) for index in range(6)]
+        cls.offline = LockBoard.objects.create(device_id='BULKOFF1', total_channels=4)
+
+    def setUp(self):
+        self.inflight = 0
+        self.max_inflight = 0
+        self.sent = []
+        dispatch = mock.patch('locks.views.lock_server.dispatch_command', self.dispatch_command)
+        dispatch.start()
+        self.addCleanup(dispatch.stop)
+        audit = mock.patch('locks.views.audit_log')
+        self.audit_log = audit.start()
+        self.addCleanup(audit.stop)
+
+    async def dispatch_command(self, device_id, cmd, data=b'', timeout=None):
+        self.sent.append((device_id, cmd, data))
+        self.inflight += 1
+        self.max_inflight = max(self.max_inflight, self.inflight)
+        await asyncio.sleep(0.01)
+        self.inflight -= 1
+        if device_id == self.offline.device_id:
+            return error_result('Плата не подключена')
+        return {'success': True, 'status': 0, 'data': b'', 'latency': 0.01, 'attempts': 1, 'error': ''}
+
+    async def post(self, body: dict):
+        return await self.async_client.post(reverse('bulk-command'), body, content_type='application/json')
+
+    async def lines(self, body: dict) -> list:
+        response = await self.post(body)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    async def test_one_line_per_board(self):
+        items = [{'board_id': board.pk, 'channels': [1]} for board in self.boards]
+        items += [
+            {'board_id': self.boards[0].pk, 'channels': [3]},  # объединяется с первым элементом
+            {'board_id': self.offline.pk, 'command': 'open_all'},
+            {'board_id': self.offline.pk + 1000, 'channels': [1]},
+            {'board_id': self.boards[1].pk, 'channels': [9]},
+            {'board_id': self.boards[1].pk, 'command': 'reboot', 'channels': [1]},
+            'not-an-item',
+        ]
+        lines = await self.lines({'items': items, 'concurrency': 2})
+
+        summary = lines.pop()['summary']
+        self.assertEqual(summary, {'commands': 7, 'success': 6, 'failed': 1, 'invalid': 4})
+        errors = {line['index']: line['error'] for line in lines if 'operation_type' not in line}
+        self.assertEqual(errors, {
+            8: 'Плата не найдена', 9: 'Неверный номер канала: 9', 10: 'Неизвестная команда: reboot',
+            11: 'Элемент должен быть объектом',
+        })
+
+        results = {line['board_id']: line for line in lines if 'operation_type' in line}
+        self.assertEqual(len(results), 7)
+        self.assertEqual(results[self.boards[0].pk]['index'], [0, 6])
+        self.assertEqual(results[self.boards[0].pk]['operation_type'], 'open_multiple')
+        self.assertEqual(results[self.boards[0].pk]['channels'], [1, 3])
+        self.assertEqual(results[self.boards[1].pk]['operation_type'], 'open_single')
+        self.assertFalse(results[self.offline.pk]['success'])
+        self.assertEqual(results[self.offline.pk]['error'], 'Плата не подключена')
+        self.assertEqual(results[self.offline.pk]['operation_type'], 'open_all')
+
+    async def test_concurrency_limit(self):
+        items = [{'board_id': board.pk, 'channels': [1]} for board in self.boards]
+        await self.lines({'items': items, 'concurrency': 2})
+        self.assertEqual(len(self.sent), 6)
+        self.assertEqual(self.max_inflight, 2)
+
+    async def test_one_audit_record_per_board(self):
+        items = [{'board_id': board.pk, 'channels': [1, 2]} for board in self.boards]
+        items.append({'board_id': self.offline.pk, 'command': 'close_channel', 'channels': [2]})
+        await self.lines({'items': items})
+        self.audit_log.log.assert_called_once()
+        operations = self.audit_log.log.call_args[0][0]
+        self.assertEqual(sorted(operation.board_id for operation in operations),
+                         sorted(board.pk for board in self.boards + [self.offline]))
+        self.assertEqual({operation.operation_type for operation in operations}, {'open_multiple', 'close_channel'})
+        self.assertEqual(sum(operation.success for operation in operations), 6)
+
+    async def test_validation_errors(self):
+        for body, error in (
+            ({}, 'Укажите список команд'),
+            ({'items': {'board_id': 1}}, 'Укажите список команд'),
+            ({'items': [{'board_id': 1}], 'concurrency': 0}, 'Неверное значение concurrency'),
+            ({'items': [{'board_id': 1}], 'concurrency': '5'}, 'Неверное значение concurrency'),
+        ):
+            response = await self.post(body)
+            self.assertEqual(response.status_code, 400, body)
+            self.assertEqual(response.json(), {'error': error})
+        with self.settings(LOCK_BULK_MAX_ITEMS=2):
+            response = await self.post({'items': [{'board_id': 1}] * 3})
+        self.assertEqual(response.status_code, 400)
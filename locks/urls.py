@@ -1,6 +1,6 @@
 from django.urls import path, include
 from . import views
-from .views import DebugClientConnectionsView
+from .views import DebugClientConnectionsView, DebugDiagnosticsView
 
 urlpatterns = [
     # Board URLs
@@ -16,8 +16,11 @@ urlpatterns = [
     path('api/boards/<int:board_id>/open-multiple/', views.OpenMultipleLocksView.as_view(), name='open-multiple-locks'),
     path('api/boards/<int:board_id>/read-status/', views.ReadLockStatusView.as_view(), name='read-lock-status'),
     path('api/boards/<int:board_id>/read-all-status/', views.ReadAllStatusView.as_view(), name='read-all-status'),
+    path('api/boards/<int:board_id>/state/', views.BoardStateView.as_view(), name='board-state'),
     path('api/boards/<int:board_id>/keep-open/', views.KeepChannelOpenView.as_view(), name='keep-channel-open'),
     path('api/boards/<int:board_id>/close-channel/', views.CloseChannelView.as_view(), name='close-channel'),
+    path('api/boards/bulk-command/', views.BulkCommandView.as_view(), name='bulk-command'),
+    path('api/events/', views.LockEventStreamView.as_view(), name='lock-events'),
 
     # Lock URLs
     path('api/locks/', views.LockListView.as_view(), name='lock-list'),
@@ -26,8 +29,10 @@ urlpatterns = [
 
     # Operation URLs
     path('api/operations/', views.LockOperationListView.as_view(), name='operation-list'),
+    path('api/operations/daily/', views.OperationDailySummaryView.as_view(), name='operation-daily'),
     path('api/operations/<int:pk>/', views.LockOperationDetailView.as_view(), name='operation-detail'),
     path('debug/clients/', DebugClientConnectionsView.as_view()),
+    path('debug/diagnostics/', DebugDiagnosticsView.as_view()),
 
     # Statistics URLs
     path('api/statistics/', views.BoardStatisticsView.as_view(), name='board-statistics'),
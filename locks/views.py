@@ -1,14 +1,31 @@
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
-from django.db.models import Q
-from .models import LockBoard, Lock, LockOperation
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views import View
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from .models import LockBoard, Lock, LockOperation, DailyOperationSummary
 from .serializers import LockBoardSerializer, LockSerializer, LockOperationSerializer
 from .tcp_server import lock_server
+from .command_bus import error_result
+from .counters import operation_totals
+from .audit import audit_log
 from .protocol import VoungProtocol
+from .singleflight import SingleFlight
+from .events import event_id, parse_event_id
+from .pagination import KeysetPagination, OptionalPageNumberPagination
+from .sessions import SESSION_ORDERING
+from asgiref.sync import async_to_sync, sync_to_async
+from datetime import datetime, time
 import struct
+import json
 import asyncio
 import logging
 
@@ -18,11 +35,33 @@ logging.basicConfig(level=logging.INFO)
 # Логгерди түзүү
 logger = logging.getLogger(__name__)
 
+LOCK_STATUS_DISPLAY = dict(Lock.LOCK_STATUS_CHOICES)
+
+
+def latency_ms(result: dict):
+    return round(result['latency'] * 1000, 1) if result['latency'] is not None else None
+
+
 # Lock Board Views
 class LockBoardListView(generics.ListAPIView):
-    """Список плат управления замками"""
+    """Список плат управления замками
+
+    ?fields=device_id,is_online - только указанные поля платы,
+    ?expand=locks - вместе с замками (один дополнительный запрос на страницу);
+    без параметра expand замки тоже включаются, как в прежнем ответе, а
+    пустой ?expand= отдаёт облегчённый список без замков,
+    ?page=&page_size= - постраничный вывод.
+
+    Список строится из values() без ModelSerializer: на тысячах плат и
+    десятках тысяч замков сериализатор на объект - основная стоимость запроса.
+    """
     queryset = LockBoard.objects.all()
     serializer_class = LockBoardSerializer
+    pagination_class = OptionalPageNumberPagination
+
+    BOARD_FIELDS = tuple(field.name for field in LockBoard._meta.concrete_fields)
+    LOCK_FIELDS = ('id', 'board', 'channel', 'name', 'status', 'last_status_change')
+    EXPANDABLE = ('locks',)
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -39,7 +78,46 @@ class LockBoardListView(generics.ListAPIView):
                 Q(device_id__icontains=search) |
                 Q(ccid__icontains=search)
             )
-        return queryset
+        return queryset.order_by('id')
+
+    def get_list_param(self, name: str, allowed: tuple) -> list:
+        value = self.request.query_params.get(name)
+        if not value:
+            return []
+        items = [item.strip() for item in value.split(',') if item.strip()]
+        unknown = [item for item in items if item not in allowed]
+        if unknown:
+            raise ValidationError({name: f"Неизвестные значения: {', '.join(unknown)}"})
+        return items
+
+    def list(self, request, *args, **kwargs):
+        fields = self.get_list_param('fields', self.BOARD_FIELDS) or list(self.BOARD_FIELDS)
+        if 'expand' in request.query_params:
+            expand = self.get_list_param('expand', self.EXPANDABLE)
+        else:
+            expand = list(self.EXPANDABLE)
+
+        # id нужен для привязки замков и стабильного порядка страниц
+        boards_queryset = self.filter_queryset(self.get_queryset())
+        queryset = boards_queryset.values(*dict.fromkeys(['id', *fields]))
+        page = self.paginate_queryset(queryset)
+        boards = list(page if page is not None else queryset)
+
+        if 'locks' in expand:
+            by_board = {board['id']: board.setdefault('locks', []) for board in boards}
+            # Полный список - подзапросом, а не тысячами параметров IN
+            board_ids = list(by_board) if page is not None else boards_queryset.values('id')
+            locks = Lock.objects.filter(board_id__in=board_ids).order_by('board_id', 'channel').values(*self.LOCK_FIELDS)
+            for lock in locks:
+                lock['status_display'] = LOCK_STATUS_DISPLAY.get(lock['status'], lock['status'])
+                by_board[lock['board']].append(lock)
+        if 'id' not in fields:
+            for board in boards:
+                del board['id']
+
+        if page is not None:
+            return self.get_paginated_response(boards)
+        return Response(boards)
 
 
 class LockBoardDetailView(generics.RetrieveAPIView):
@@ -48,198 +126,285 @@ class LockBoardDetailView(generics.RetrieveAPIView):
     serializer_class = LockBoardSerializer
 
 
+def invalidate_board(pk: int):
+    """Уведомление TCP сервера об изменении платы"""
+    try:
+        async_to_sync(lock_server.invalidate_board)(pk)
+    except Exception as e:
+        logger.error(f"Ошибка обновления реестра для платы {pk}: {e}")
+
+
 class LockBoardCreateView(generics.CreateAPIView):
     """Создание платы управления замками"""
     queryset = LockBoard.objects.all()
     serializer_class = LockBoardSerializer
 
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        invalidate_board(serializer.instance.pk)
+
 
 class LockBoardUpdateView(generics.UpdateAPIView):
     """Обновление платы управления замками"""
     queryset = LockBoard.objects.all()
     serializer_class = LockBoardSerializer
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        invalidate_board(serializer.instance.pk)
+
 
 class LockBoardDeleteView(generics.DestroyAPIView):
     """Удаление платы управления замками"""
     queryset = LockBoard.objects.all()
     serializer_class = LockBoardSerializer
 
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        super().perform_destroy(instance)
+        invalidate_board(pk)
+
 
 # Lock Operation Views
-class OpenSingleLockView(APIView):
-    """Открытие одного замка"""
+class BoardCommandView(APIView):
+    """Базовое асинхронное представление команд плате
+
+    Команда ожидается напрямую в цикле событий ASGI, без блокировки
+    рабочего потока на время ответа платы. APIView не поддерживает
+    асинхронные обработчики, поэтому dispatch свой: аутентификация (JWT),
+    права и ограничения частоты DRF выполняются в потоке через
+    sync_to_async, затем ожидается обработчик. Представления остаются в
+    схеме drf_yasg, отклоняют неверные токены и отвечают Response с выбором
+    формата рендерером DRF, как остальные API.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
 
-    def post(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
-        channel = request.data.get('channel')
-        order_number = request.data.get('order_number', '')
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    @staticmethod
+    def error_response(error: str, status_code: int = status.HTTP_400_BAD_REQUEST) -> Response:
+        return Response({'error': error}, status=status_code)
+
+    @staticmethod
+    def unavailable_response(result: dict) -> Response:
+        return Response({'error': 'Плата недоступна', 'detail': result['error']},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+    @staticmethod
+    def parse_body(request) -> dict:
+        body = request.data
+        return body if isinstance(body, dict) else {}
+
+    @staticmethod
+    async def get_board(board_id: int):
+        return await LockBoard.objects.filter(pk=board_id).afirst()
+
+    @staticmethod
+    def not_found_response() -> Response:
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    @staticmethod
+    async def execute(board: LockBoard, cmd: int, data: bytes = b'') -> dict:
+        try:
+            return await lock_server.dispatch_command(board.device_id, cmd, data)
+        except Exception as e:
+            logger.error(f"Ошибка отправки команды 0x{cmd:02X} на {board.device_id}: {e}")
+            return error_result(str(e))
 
-        if not channel or not isinstance(channel, int):
-            return Response({'error': 'Укажите номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+    @staticmethod
+    def log_operations(operations: list):
+        """Постановка операций в журнал, запись в БД и счётчики - в AuditWriter"""
+        audit_log.log(operations)
 
+    def validate_channel(self, board: LockBoard, channel):
+        """Возвращает ответ с ошибкой или None, если канал корректен"""
+        if not channel or not isinstance(channel, int):
+            return self.error_response('Укажите номер канала')
         if channel < 1 or channel > board.total_channels:
-            return Response({'error': 'Неверный номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+            return self.error_response('Неверный номер канала')
+        return None
+
+
+class OpenSingleLockView(BoardCommandView):
+    """Открытие одного замка"""
+
+    async def post(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
+
+        body = self.parse_body(request)
+        channel = body.get('channel')
+        order_number = body.get('order_number', '')
+
+        error = self.validate_channel(board, channel)
+        if error:
+            return error
 
         # Формируем данные команды
         data = struct.pack('B', channel)
         if order_number:
             data += order_number.encode('ascii')[:24]
 
-        # Отправляем команду (синхронно через asyncio)
-        try:
-            loop = asyncio.get_event_loop()
-            success = loop.run_until_complete(
-                lock_server.send_command_to_board(
-                    board.device_id,
-                    VoungProtocol.CMD_OPEN_SINGLE,
-                    data
-                )
-            )
-        except Exception as e:
-            success = False
+        result = await self.execute(board, VoungProtocol.CMD_OPEN_SINGLE, data)
+        success = result['success']
 
         # Записываем операцию
-        LockOperation.objects.create(
+        self.log_operations([LockOperation(
             board=board,
             operation_type='open_single',
             channels=[channel],
             order_number=order_number,
-            success=success
-        )
+            success=success,
+            error_message=result['error']
+        )])
 
         if success:
             return Response({
-                'message': f'Команда открытия замка {channel} отправлена',
+                'message': f'Замок {channel} открыт',
                 'board_id': board.id,
+                'latency_ms': latency_ms(result),
                 'channel': channel,
                 'order_number': order_number
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-
+            return self.unavailable_response(result)
 
-from asgiref.sync import async_to_sync
 
-class OpenAllLocksView(APIView):
+class OpenAllLocksView(BoardCommandView):
     """Открытие всех замков"""
 
-    def post(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
+    async def post(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
 
-        try:
-            success = async_to_sync(lock_server.send_command_to_board)(
-                board.device_id,
-                VoungProtocol.CMD_OPEN_ALL
-            )
-        except Exception as e:
-            logger.error(f"Ошибка отправки команды открытия всех замков: {e}")
-            success = False
+        result = await self.execute(board, VoungProtocol.CMD_OPEN_ALL)
+        success = result['success']
 
-        LockOperation.objects.create(
+        self.log_operations([LockOperation(
             board=board,
             operation_type='open_all',
             channels=list(range(1, board.total_channels + 1)),
-            success=success
-        )
+            success=success,
+            error_message=result['error']
+        )])
 
         if success:
             return Response({
-                'message': 'Команда открытия всех замков отправлена',
+                'message': 'Все замки открыты',
                 'board_id': board.id,
+                'latency_ms': latency_ms(result),
                 'total_channels': board.total_channels
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return self.unavailable_response(result)
 
 
-class OpenMultipleLocksView(APIView):
+class OpenMultipleLocksView(BoardCommandView):
     """Открытие нескольких замков"""
 
-    def post(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
-        channels = request.data.get('channels', [])
+    async def post(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
+
+        channels = self.parse_body(request).get('channels', [])
 
         if not channels or not isinstance(channels, list):
-            return Response({'error': 'Укажите список каналов'}, status=status.HTTP_400_BAD_REQUEST)
+            return self.error_response('Укажите список каналов')
 
         # Проверяем корректность каналов
         for channel in channels:
             if not isinstance(channel, int) or channel < 1 or channel > board.total_channels:
-                return Response({'error': f'Неверный номер канала: {channel}'}, status=status.HTTP_400_BAD_REQUEST)
+                return self.error_response(f'Неверный номер канала: {channel}')
 
         # Формируем данные команды
         data = struct.pack('B', len(channels))
         for channel in channels:
             data += struct.pack('B', channel)
 
-        try:
-            loop = asyncio.get_event_loop()
-            success = loop.run_until_complete(
-                lock_server.send_command_to_board(
-                    board.device_id,
-                    VoungProtocol.CMD_OPEN_MULTIPLE,
-                    data
-                )
-            )
-        except Exception as e:
-            success = False
+        result = await self.execute(board, VoungProtocol.CMD_OPEN_MULTIPLE, data)
+        success = result['success']
 
-        LockOperation.objects.create(
+        self.log_operations([LockOperation(
             board=board,
             operation_type='open_multiple',
             channels=channels,
-            success=success
-        )
+            success=success,
+            error_message=result['error']
+        )])
 
         if success:
             return Response({
-                'message': f'Команда открытия замков {channels} отправлена',
+                'message': f'Замки {channels} открыты',
                 'board_id': board.id,
+                'latency_ms': latency_ms(result),
                 'channels': channels
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return self.unavailable_response(result)
+
 
+class ReadLockStatusView(BoardCommandView):
+    """Чтение статуса замка
 
-class ReadLockStatusView(APIView):
-    """Чтение статуса замка"""
+    Статус берётся из ответа платы (TCP сервер по нему же обновляет замок
+    и маску каналов), из БД - только время изменения или весь статус,
+    если ответ не содержит статуса канала.
+    """
 
-    def get(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
-        channel = request.query_params.get('channel')
+    async def get(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
+
+        channel = request.GET.get('channel')
 
         if not channel:
-            return Response({'error': 'Укажите номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+            return self.error_response('Укажите номер канала')
 
         try:
             channel = int(channel)
         except ValueError:
-            return Response({'error': 'Неверный номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+            return self.error_response('Неверный номер канала')
 
         if channel < 1 or channel > board.total_channels:
-            return Response({'error': 'Неверный номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+            return self.error_response('Неверный номер канала')
 
         data = struct.pack('B', channel)
-
-        try:
-            loop = asyncio.get_event_loop()
-            success = loop.run_until_complete(
-                lock_server.send_command_to_board(
-                    board.device_id,
-                    VoungProtocol.CMD_READ_STATUS,
-                    data
-                )
-            )
-        except Exception as e:
-            success = False
-
-        # Получаем текущий статус из базы данных
-        try:
-            lock = Lock.objects.get(board=board, channel=channel)
+        result = await self.execute(board, VoungProtocol.CMD_READ_STATUS, data)
+        success = result['success']
+        status = VoungProtocol.parse_lock_status(result['data'], channel) if success else None
+
+        lock = await Lock.objects.filter(board=board, channel=channel).afirst()
+        if lock and status is not None:
+            current_status = LOCK_STATUS_DISPLAY.get(status, status)
+            # Статус в БД ещё не обновлён - изменение замечено этим чтением
+            last_change = lock.last_status_change if lock.status == status else timezone.now()
+        elif lock:
             current_status = lock.get_status_display()
             last_change = lock.last_status_change
-        except Lock.DoesNotExist:
+        else:
             current_status = 'Неизвестно'
             last_change = None
 
@@ -247,138 +412,389 @@ class ReadLockStatusView(APIView):
             return Response({
                 'message': f'Запрос статуса замка {channel} отправлен',
                 'board_id': board.id,
+                'latency_ms': latency_ms(result),
                 'channel': channel,
                 'current_status': current_status,
                 'last_status_change': last_change
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return self.unavailable_response(result)
 
 
-class ReadAllStatusView(APIView):
-    """Чтение статуса всех замков"""
+class ReadAllStatusView(BoardCommandView):
+    """Чтение статуса всех замков
 
-    def get(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
+    Одновременные запросы к одной плате в процессе используют один запрос
+    к плате и одно чтение БД. Готовый результат здесь не кэшируется: веб-процесс
+    не видит изменений статуса, сбрасывающих кэш, - повторное использование
+    на LOCK_STATUS_READ_TTL выполняет TCP сервер.
+    """
 
-        try:
-            loop = asyncio.get_event_loop()
-            success = loop.run_until_complete(
-                lock_server.send_command_to_board(
-                    board.device_id,
-                    VoungProtocol.CMD_READ_ALL_STATUS
-                )
-            )
-        except Exception as e:
-            success = False
+    status_reads = SingleFlight()
+
+    async def read_all_status(self, board: LockBoard) -> dict:
+        result = await self.execute(board, VoungProtocol.CMD_READ_ALL_STATUS)
+        # Статусы берём из ответа платы, из БД - только названия и время изменения
+        statuses = None
+        if result['success']:
+            statuses = VoungProtocol.parse_channel_states(result['data'], board.total_channels)
 
-        # Получаем текущие статусы из базы данных
-        locks = Lock.objects.filter(board=board).order_by('channel')
         locks_data = []
-        for lock in locks:
+        locks = Lock.objects.filter(board=board).order_by('channel').values_list(
+            'channel', 'name', 'status', 'last_status_change'
+        )
+        async for channel, name, status, last_change in locks:
+            if statuses is not None and 1 <= channel <= len(statuses):
+                status = statuses[channel - 1]
             locks_data.append({
-                'channel': lock.channel,
-                'name': lock.name,
-                'status': lock.get_status_display(),
-                'last_change': lock.last_status_change
+                'channel': channel,
+                'name': name,
+                'status': LOCK_STATUS_DISPLAY.get(status, status),
+                'last_change': last_change
             })
+        return {**result, 'locks': locks_data}
 
-        if success:
+    async def get(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
+
+        result = await self.status_reads.do(board.pk, lambda: self.read_all_status(board))
+
+        if result['success']:
             return Response({
                 'message': 'Запрос статуса всех замков отправлен',
                 'board_id': board.id,
-                'locks': locks_data
+                'latency_ms': latency_ms(result),
+                'locks': result['locks']
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return self.unavailable_response(result)
+
+
+class BoardStateView(BoardCommandView):
+    """Состояние всех каналов платы из битовой маски, без команды плате
+
+    Маска обновляется по изменениям статуса и ответам на чтение всех
+    статусов с задержкой записи LOCK_STATUS_FLUSH_INTERVAL.
+    """
 
+    async def get(self, request, board_id):
+        board = await LockBoard.objects.filter(pk=board_id).only(
+            'id', 'total_channels', 'is_online', 'open_channels', 'channel_state_at'
+        ).afirst()
+        if board is None:
+            return self.not_found_response()
 
-class KeepChannelOpenView(APIView):
+        if board.has_channel_mask:
+            statuses = board.channel_statuses()
+        else:
+            statuses = [1] * board.total_channels
+            async for channel, status in Lock.objects.filter(board=board).values_list('channel', 'status'):
+                if 1 <= channel <= board.total_channels:
+                    statuses[channel - 1] = status
+
+        return Response({
+            'board_id': board.id,
+            'is_online': board.is_online,
+            'open_channels': board.open_channels,
+            'open': [channel for channel, status in enumerate(statuses, 1) if status == 0],
+            'statuses': statuses,
+            'state_at': board.channel_state_at,
+        })
+
+
+class KeepChannelOpenView(BoardCommandView):
     """Постоянное открытие канала"""
 
-    def post(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
-        channel = request.data.get('channel')
+    async def post(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
 
-        if not channel or not isinstance(channel, int):
-            return Response({'error': 'Укажите номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+        channel = self.parse_body(request).get('channel')
 
-        if channel < 1 or channel > board.total_channels:
-            return Response({'error': 'Неверный номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+        error = self.validate_channel(board, channel)
+        if error:
+            return error
 
         data = struct.pack('B', channel)
+        result = await self.execute(board, VoungProtocol.CMD_KEEP_OPEN, data)
+        success = result['success']
 
-        try:
-            loop = asyncio.get_event_loop()
-            success = loop.run_until_complete(
-                lock_server.send_command_to_board(
-                    board.device_id,
-                    VoungProtocol.CMD_KEEP_OPEN,
-                    data
-                )
-            )
-        except Exception as e:
-            success = False
-
-        LockOperation.objects.create(
+        self.log_operations([LockOperation(
             board=board,
             operation_type='keep_open',
             channels=[channel],
-            success=success
-        )
+            success=success,
+            error_message=result['error']
+        )])
 
         if success:
             return Response({
                 'message': f'Канал {channel} переведен в режим постоянного открытия',
                 'board_id': board.id,
+                'latency_ms': latency_ms(result),
                 'channel': channel
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return self.unavailable_response(result)
 
 
-class CloseChannelView(APIView):
+class CloseChannelView(BoardCommandView):
     """Закрытие канала"""
 
-    def post(self, request, board_id):
-        board = get_object_or_404(LockBoard, pk=board_id)
-        channel = request.data.get('channel')
+    async def post(self, request, board_id):
+        board = await self.get_board(board_id)
+        if board is None:
+            return self.not_found_response()
 
-        if not channel or not isinstance(channel, int):
-            return Response({'error': 'Укажите номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+        channel = self.parse_body(request).get('channel')
 
-        if channel < 1 or channel > board.total_channels:
-            return Response({'error': 'Неверный номер канала'}, status=status.HTTP_400_BAD_REQUEST)
+        error = self.validate_channel(board, channel)
+        if error:
+            return error
 
         data = struct.pack('B', channel)
+        result = await self.execute(board, VoungProtocol.CMD_CLOSE_CHANNEL, data)
+        success = result['success']
 
-        try:
-            loop = asyncio.get_event_loop()
-            success = loop.run_until_complete(
-                lock_server.send_command_to_board(
-                    board.device_id,
-                    VoungProtocol.CMD_CLOSE_CHANNEL,
-                    data
-                )
-            )
-        except Exception as e:
-            success = False
-
-        LockOperation.objects.create(
+        self.log_operations([LockOperation(
             board=board,
             operation_type='close_channel',
             channels=[channel],
-            success=success
-        )
+            success=success,
+            error_message=result['error']
+        )])
 
         if success:
             return Response({
                 'message': f'Канал {channel} закрыт',
                 'board_id': board.id,
+                'latency_ms': latency_ms(result),
                 'channel': channel
             })
         else:
-            return Response({'error': 'Плата недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            return self.unavailable_response(result)
+
+
+class BulkCommandView(BoardCommandView):
+    """Пакетная отправка команд множеству плат
+
+    Принимает {"items": [{"board_id", "command", "channels"}], "concurrency"}.
+    Команды open для одной платы объединяются и отправляются одной командой
+    (CMD_OPEN_SINGLE / CMD_OPEN_MULTIPLE / CMD_OPEN_ALL). Результаты
+    возвращаются потоком NDJSON по мере выполнения, журнал операций
+    записывается одним bulk_create.
+    """
+
+    COMMANDS = ('open', 'open_all', 'keep_open', 'close_channel')
+
+    @staticmethod
+    def is_board_id(value) -> bool:
+        # bool - подкласс int, а списки и словари из JSON нельзя хэшировать
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def plan(self, items: list, boards: dict):
+        """Разбор элементов запроса в список отправок и ошибок валидации"""
+        errors = []
+        opens = {}  # board_id -> (board, [индексы элементов], set каналов)
+        sends = []  # (board, operation_type, cmd, data, channels, [индексы элементов])
+
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors.append((index, None, 'Элемент должен быть объектом'))
+                continue
+            if not self.is_board_id(item.get('board_id')):
+                errors.append((index, None, 'board_id должен быть целым числом'))
+                continue
+            board = boards.get(item['board_id'])
+            command = item.get('command', 'open')
+            channels = item.get('channels', [])
+            if board is None:
+                errors.append((index, item.get('board_id'), 'Плата не найдена'))
+                continue
+            if command not in self.COMMANDS:
+                errors.append((index, board.id, f'Неизвестная команда: {command}'))
+                continue
+            if command == 'open_all':
+                channels = list(range(1, board.total_channels + 1))
+            if not isinstance(channels, list) or not channels:
+                errors.append((index, board.id, 'Укажите список каналов'))
+                continue
+            invalid = [ch for ch in channels if not isinstance(ch, int) or ch < 1 or ch > board.total_channels]
+            if invalid:
+                errors.append((index, board.id, f'Неверный номер канала: {invalid[0]}'))
+                continue
+
+            if command in ('open', 'open_all'):
+                entry = opens.setdefault(board.id, (board, [], set()))
+                entry[1].append(index)
+                entry[2].update(channels)
+            else:
+                cmd = VoungProtocol.CMD_KEEP_OPEN if command == 'keep_open' else VoungProtocol.CMD_CLOSE_CHANNEL
+                for channel in dict.fromkeys(channels):
+                    sends.append((board, command, cmd, struct.pack('B', channel), [channel], [index]))
+
+        # Выбираем самую дешёвую команду открытия для каждой платы
+        for board, indexes, channels in opens.values():
+            channels = sorted(channels)
+            if len(channels) == board.total_channels:
+                sends.append((board, 'open_all', VoungProtocol.CMD_OPEN_ALL, b'', channels, indexes))
+            elif len(channels) == 1:
+                sends.append((board, 'open_single', VoungProtocol.CMD_OPEN_SINGLE,
+                              struct.pack('B', channels[0]), channels, indexes))
+            else:
+                sends.append((board, 'open_multiple', VoungProtocol.CMD_OPEN_MULTIPLE,
+                              struct.pack('B', len(channels)) + bytes(channels), channels, indexes))
+
+        return sends, errors
+
+    async def post(self, request):
+        body = self.parse_body(request)
+        items = body.get('items')
+        if not items or not isinstance(items, list):
+            return self.error_response('Укажите список команд')
+        if len(items) > settings.LOCK_BULK_MAX_ITEMS:
+            return self.error_response(f'Не более {settings.LOCK_BULK_MAX_ITEMS} команд в запросе')
+
+        concurrency = body.get('concurrency', settings.LOCK_BULK_CONCURRENCY)
+        if not isinstance(concurrency, int) or concurrency < 1:
+            return self.error_response('Неверное значение concurrency')
+        concurrency = min(concurrency, settings.LOCK_BULK_MAX_CONCURRENCY)
+
+        board_ids = {item.get('board_id') for item in items
+                     if isinstance(item, dict) and self.is_board_id(item.get('board_id'))}
+        boards = {board.id: board async for board in LockBoard.objects.filter(pk__in=board_ids)}
+        sends, errors = self.plan(items, boards)
+
+        return StreamingHttpResponse(self.stream(sends, errors, concurrency), content_type='application/x-ndjson')
+
+    async def stream(self, sends: list, errors: list, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+        operations = []
+        succeeded = 0
+
+        async def send(board, operation_type, cmd, data, channels, indexes):
+            async with semaphore:
+                return board, operation_type, channels, indexes, await self.execute(board, cmd, data)
+
+        for index, board_id, error in errors:
+            yield json.dumps({'index': index, 'board_id': board_id, 'success': False, 'error': error},
+                             ensure_ascii=False) + '\n'
+
+        tasks = [asyncio.ensure_future(send(*item)) for item in sends]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                board, operation_type, channels, indexes, result = await next_result
+                succeeded += result['success']
+                operations.append(LockOperation(
+                    board=board,
+                    operation_type=operation_type,
+                    channels=channels,
+                    success=result['success'],
+                    error_message=result['error']
+                ))
+                yield json.dumps({
+                    'index': indexes[0] if len(indexes) == 1 else indexes,
+                    'board_id': board.id,
+                    'operation_type': operation_type,
+                    'channels': channels,
+                    'success': result['success'],
+                    'latency_ms': latency_ms(result),
+                    'error': result['error'],
+                }, ensure_ascii=False) + '\n'
+        finally:
+            for task in tasks:
+                task.cancel()
+            if operations:
+                self.log_operations(operations)
+
+        yield json.dumps({
+            'summary': {
+                'commands': len(sends),
+                'success': succeeded,
+                'failed': len(sends) - succeeded,
+                'invalid': len(errors),
+            }
+        }, ensure_ascii=False) + '\n'
+
+
+class LockEventStreamView(View):
+    """Поток событий замков (Server-Sent Events) вместо опроса read-all-status
+
+    GET ?boards=1,2&channels=3,4&since=<эпоха:seq>. События status, online,
+    offline и command приходят с id эпоха:seq; после переподключения
+    EventSource передаёт Last-Event-ID и получает пропущенные события.
+    Событие reset означает, что пропущенное уже не восстановить и
+    состояние нужно перечитать, dropped - что клиент не успевал читать
+    поток и должен переподключиться.
+
+    Django 4.2 не сообщает об отключении клиента во время потоковой
+    отдачи, поэтому поток завершается через LOCK_EVENT_STREAM_TIMEOUT, а
+    EventSource продолжает его с того же места.
+    """
+
+    @staticmethod
+    def parse_ids(value: str):
+        if not value:
+            return None
+        return [int(item) for item in value.split(',') if item.strip()]
+
+    async def get(self, request):
+        try:
+            boards = self.parse_ids(request.GET.get('boards'))
+            channels = self.parse_ids(request.GET.get('channels'))
+            since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+            epoch, since = parse_event_id(since) if since else (None, None)
+        except ValueError:
+            return JsonResponse({'error': 'Неверные параметры подписки'}, status=status.HTTP_400_BAD_REQUEST,
+                                json_dumps_params={'ensure_ascii': False})
+
+        response = StreamingHttpResponse(self.stream(boards, channels, since, epoch),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @staticmethod
+    def format_event(event: dict) -> str:
+        lines = f"id: {event_id(event)}\n" if 'seq' in event else ''
+        return lines + f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    async def stream(self, boards, channels, since, epoch):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.LOCK_EVENT_STREAM_TIMEOUT
+        events = lock_server.subscribe_events(boards, channels, since, epoch)
+        next_event = None
+        yield 'retry: 3000\n\n'
+
+        try:
+            while loop.time() < deadline:
+                if next_event is None:
+                    next_event = asyncio.ensure_future(events.__anext__())
+                # Не отменяем ожидание события по таймауту - это закрыло бы генератор
+                done, _ = await asyncio.wait({next_event}, timeout=settings.LOCK_EVENT_KEEPALIVE)
+                if not done:
+                    yield ': ping\n\n'
+                    continue
+
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    break
+                next_event = None
+                yield self.format_event(event)
+                if event['type'] == 'dropped':
+                    break
+        except OSError as e:
+            logger.warning(f"Поток событий прерван: {e}")
+            yield self.format_event({'type': 'error', 'error': 'TCP сервер недоступен'})
+        finally:
+            if next_event is not None:
+                next_event.cancel()
+                await asyncio.gather(next_event, return_exceptions=True)
+            await events.aclose()
 
 
 # Lock Views
@@ -424,15 +840,38 @@ class LockUpdateView(generics.UpdateAPIView):
 
 # Lock Operation Views
 class LockOperationListView(generics.ListAPIView):
-    """Список операций с замками"""
+    """Список операций с замками
+
+    Курсорная пагинация от новых к старым (?cursor=, ?page_size=), фильтры
+    board_id, operation_type, success, order_number и интервал since/until
+    по created_at (ISO дата или дата-время).
+    """
     queryset = LockOperation.objects.select_related('board')
     serializer_class = LockOperationSerializer
+    pagination_class = KeysetPagination
+
+    @staticmethod
+    def parse_moment(value: str, name: str):
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValidationError({name: 'Неверный формат даты'})
+            moment = datetime.combine(day, time.min)
+        if settings.USE_TZ and timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        elif not settings.USE_TZ and timezone.is_aware(moment):
+            moment = timezone.make_naive(moment)
+        return moment
 
     def get_queryset(self):
         queryset = super().get_queryset()
         board_id = self.request.query_params.get('board_id')
         operation_type = self.request.query_params.get('operation_type')
         success = self.request.query_params.get('success')
+        order_number = self.request.query_params.get('order_number')
+        since = self.request.query_params.get('since')
+        until = self.request.query_params.get('until')
 
         if board_id:
             queryset = queryset.filter(board_id=board_id)
@@ -440,8 +879,69 @@ class LockOperationListView(generics.ListAPIView):
             queryset = queryset.filter(operation_type=operation_type)
         if success is not None:
             queryset = queryset.filter(success=success.lower() == 'true')
+        if order_number:
+            queryset = queryset.filter(order_number=order_number)
+        if since:
+            queryset = queryset.filter(created_at__gte=self.parse_moment(since, 'since'))
+        if until:
+            queryset = queryset.filter(created_at__lt=self.parse_moment(until, 'until'))
+
+        return queryset
 
-        return queryset.order_by('-created_at')[:100]  # Последние 100 операций
+
+class OperationDailySummaryView(APIView):
+    """Суточная статистика операций по платам
+
+    GET ?board_id=&since=ГГГГ-ММ-ДД&until=ГГГГ-ММ-ДД (until не включается).
+    Архивированные сутки берутся из DailyOperationSummary, остальные
+    агрегируются по журналу в пределах срока хранения.
+    """
+
+    @staticmethod
+    def parse_day(value: str, name: str):
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: 'Неверный формат даты'})
+        return day
+
+    def get(self, request):
+        board_id = request.query_params.get('board_id')
+        since = request.query_params.get('since')
+        until = request.query_params.get('until')
+
+        summaries = DailyOperationSummary.objects.all()
+        operations = LockOperation.objects.all()
+        if board_id:
+            summaries = summaries.filter(board_id=board_id)
+            operations = operations.filter(board_id=board_id)
+        if since:
+            since = self.parse_day(since, 'since')
+            summaries = summaries.filter(date__gte=since)
+            operations = operations.filter(created_at__gte=LockOperationListView.parse_moment(str(since), 'since'))
+        if until:
+            until = self.parse_day(until, 'until')
+            summaries = summaries.filter(date__lt=until)
+            operations = operations.filter(created_at__lt=LockOperationListView.parse_moment(str(until), 'until'))
+
+        totals = {}
+        for row in summaries.values('board_id', 'date', 'operation_type', 'total', 'success'):
+            totals[(row['board_id'], row['date'], row['operation_type'])] = [row['total'], row['success']]
+        live = operations.annotate(date=TruncDate('created_at')).values('board_id', 'date', 'operation_type').annotate(
+            total=Count('id'),
+            success=Count('id', filter=Q(success=True))
+        ).order_by()
+        for row in live:
+            key = (row['board_id'], row['date'], row['operation_type'])
+            entry = totals.setdefault(key, [0, 0])
+            entry[0] += row['total']
+            entry[1] += row['success']
+
+        keys = sorted(totals, key=lambda key: (key[1], key[0], key[2]))
+        return Response([
+            {'board_id': board, 'date': day, 'operation_type': operation_type,
+             'total': totals[board, day, operation_type][0], 'success': totals[board, day, operation_type][1]}
+            for board, day, operation_type in keys
+        ])
 
 
 class LockOperationDetailView(generics.RetrieveAPIView):
@@ -452,42 +952,138 @@ class LockOperationDetailView(generics.RetrieveAPIView):
 
 # Statistics Views
 class BoardStatisticsView(APIView):
-    """Статистика по платам"""
+    """Статистика по платам
+
+    Платы и замки берутся из счётчиков реестра TCP сервера, а при его
+    недоступности - одним агрегирующим запросом на таблицу. Операции
+    считаются по накопительным счётчикам без сканирования журнала.
+    """
+
+    CACHE_KEY = 'locks:board-statistics'
 
     def get(self, request):
-        total_boards = LockBoard.objects.count()
-        online_boards = LockBoard.objects.filter(is_online=True).count()
-        offline_boards = total_boards - online_boards
+        statistics = cache.get(self.CACHE_KEY)
+        if statistics is None:
+            statistics = self.collect()
+            cache.set(self.CACHE_KEY, statistics, settings.LOCK_STATISTICS_CACHE_TTL)
+        return Response(statistics)
+
+    @staticmethod
+    def collect() -> dict:
+        try:
+            statistics = async_to_sync(lock_server.fetch_counters)()
+        except Exception as e:
+            logger.error(f"Ошибка получения счётчиков TCP сервера: {e}")
+            statistics = None
+
+        if statistics is None:
+            boards = LockBoard.objects.aggregate(
+                total=Count('id'),
+                online=Count('id', filter=Q(is_online=True))
+            )
+            locks = Lock.objects.aggregate(
+                total=Count('id'),
+                open=Count('id', filter=Q(status=0)),
+                closed=Count('id', filter=Q(status=1))
+            )
+            statistics = {
+                'boards': {
+                    'total': boards['total'],
+                    'online': boards['online'],
+                    'offline': boards['total'] - boards['online']
+                },
+                'locks': locks
+            }
+
+        statistics['operations'] = operation_totals()
+        return statistics
 
-        total_locks = Lock.objects.count()
-        open_locks = Lock.objects.filter(status=0).count()
-        closed_locks = Lock.objects.filter(status=1).count()
 
-        recent_operations = LockOperation.objects.count()
-        success_operations = LockOperation.objects.filter(success=True).count()
-        failed_operations = recent_operations - success_operations
+class DebugDiagnosticsView(APIView):
+    """Внутренние метрики: очереди и пул БД TCP сервера, журнал операций и
+    объединение чтений статуса этого веб-процесса
 
+    Схема зависит от режима запуска (при --workers - по рабочим процессам)
+    и не является частью публичного API, в отличие от /api/statistics/.
+    """
+
+    def get(self, request):
+        try:
+            tcp_server = async_to_sync(lock_server.fetch_diagnostics)()
+        except Exception as e:
+            logger.error(f"Ошибка получения метрик TCP сервера: {e}")
+            tcp_server = None
         return Response({
-            'boards': {
-                'total': total_boards,
-                'online': online_boards,
-                'offline': offline_boards
+            'tcp_server': tcp_server,
+            'web': {
+                'audit': audit_log.stats(),
+                'status_reads': ReadAllStatusView.status_reads.stats(),
             },
-            'locks': {
-                'total': total_locks,
-                'open': open_locks,
-                'closed': closed_locks
-            },
-            'operations': {
-                'total': recent_operations,
-                'success': success_operations,
-                'failed': failed_operations
-            }
         })
 
+
 class DebugClientConnectionsView(APIView):
+    """Открытые TCP соединения плат со счётчиками трафика и временем ответа
+
+    Список берётся из памяти процесса TCP сервера (при нескольких рабочих
+    процессах - объединяется супервизором), а не из is_online в БД.
+    Фильтры: device_id (префикс), ip, registered (true/false), min_rtt_ms
+    (p99 не меньше). Сортировка ?ordering=поле или -поле, страницы ?page=
+    и ?page_size=. Например, 50 самых медленных плат:
+    ?ordering=-rtt_p99_ms&page_size=50
+    """
+
+    page_size = 100
+    max_page_size = 1000
+
     def get(self, request):
-        online_boards = LockBoard.objects.filter(is_online=True).values_list('device_id', flat=True)
+        page, page_size = self.get_page(request)
+        query = {**self.get_query(request), 'offset': (page - 1) * page_size, 'limit': page_size}
+        try:
+            connections = async_to_sync(lock_server.fetch_connections)(query)
+        except Exception as e:
+            logger.error(f"Ошибка получения соединений TCP сервера: {e}")
+            connections = None
+        if connections is None:
+            return Response({'error': 'TCP сервер недоступен'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        url = request.build_absolute_uri()
+        has_next = page * page_size < connections['count']
         return Response({
-            "connected_boards": list(online_boards)
+            'count': connections['count'],
+            'next': replace_query_param(url, 'page', page + 1) if has_next else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': connections['results'],
         })
+
+    def get_page(self, request) -> tuple:
+        try:
+            page = int(request.query_params.get('page', 1))
+            page_size = int(request.query_params.get('page_size', self.page_size))
+        except ValueError:
+            raise ValidationError({'page': 'Номер и размер страницы - целые числа'})
+        if page < 1:
+            raise ValidationError({'page': 'Номер страницы начинается с 1'})
+        return page, max(1, min(page_size, self.max_page_size))
+
+    @staticmethod
+    def get_query(request) -> dict:
+        params = request.query_params
+        query = {}
+        if params.get('device_id'):
+            query['device_id'] = params['device_id']
+        if params.get('ip'):
+            query['ip'] = params['ip']
+        if params.get('registered'):
+            query['registered'] = params['registered'].lower() == 'true'
+        if params.get('min_rtt_ms'):
+            try:
+                query['min_rtt_ms'] = float(params['min_rtt_ms'])
+            except ValueError:
+                raise ValidationError({'min_rtt_ms': 'Ожидается число миллисекунд'})
+        ordering = params.get('ordering')
+        if ordering:
+            if ordering.lstrip('-') not in SESSION_ORDERING:
+                raise ValidationError({'ordering': f"Допустимые поля: {', '.join(SESSION_ORDERING)}"})
+            query['ordering'] = ordering
+        return query
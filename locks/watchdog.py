@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import math
+import time
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatWatchdog:
+    """Сторож соединений на колесе таймеров
+
+    touch() только обновляет время последней активности (O(1)). Каждый тик
+    колесо просматривает один слот: истёкшие соединения отдаются в
+    on_expired одной пачкой, остальные переносятся в слот нового дедлайна.
+    """
+
+    def __init__(self, on_expired, timeout: float = None, tick: float = None):
+        self.on_expired = on_expired  # async callable(list ключей)
+        self.timeout = timeout or settings.LOCK_HEARTBEAT_TIMEOUT
+        self.tick = tick or settings.LOCK_WATCHDOG_TICK
+        self.slots = [set() for _ in range(math.ceil(self.timeout / self.tick) + 1)]
+        self.last_seen = {}  # ключ -> time.monotonic() последней активности
+        self.started = time.monotonic()
+        self.current_tick = 0
+        self.expired_total = 0
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def _tick_of(self, moment: float) -> int:
+        return math.ceil((moment - self.started) / self.tick)
+
+    def _schedule(self, key, deadline: float):
+        tick = max(self._tick_of(deadline), self.current_tick + 1)
+        self.slots[tick % len(self.slots)].add(key)
+
+    def add(self, key):
+        now = time.monotonic()
+        self.last_seen[key] = now
+        self._schedule(key, now + self.timeout)
+
+    def touch(self, key):
+        if key in self.last_seen:
+            self.last_seen[key] = time.monotonic()
+
+    def remove(self, key):
+        # Из слота ключ удаляется лениво при его обработке
+        self.last_seen.pop(key, None)
+
+    def advance(self, now: float = None) -> list:
+        """Обработка слотов до текущего момента, возвращает истёкшие ключи"""
+        now = time.monotonic() if now is None else now
+        target = self._tick_of(now)
+        # Если цикл событий стоял дольше оборота колеса, достаточно одного оборота
+        first = max(self.current_tick + 1, target - len(self.slots) + 1)
+        expired = []
+
+        for tick in range(first, target + 1):
+            self.current_tick = tick
+            slot = self.slots[tick % len(self.slots)]
+            keys = list(slot)
+            slot.clear()
+            for key in keys:
+                last_seen = self.last_seen.get(key)
+                if last_seen is None:
+                    continue
+                deadline = last_seen + self.timeout
+                if deadline <= now:
+                    del self.last_seen[key]
+                    expired.append(key)
+                else:
+                    self._schedule(key, deadline)
+
+        self.current_tick = max(self.current_tick, target)
+        self.expired_total += len(expired)
+        return expired
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            expired = self.advance()
+            if expired:
+                try:
+                    await self.on_expired(expired)
+                except Exception as e:
+                    logger.error(f"Ошибка при закрытии {len(expired)} неактивных соединений: {e}")
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from django.conf import settings
+from django.db import transaction
+from .db import DBExecutor
+from .models import Lock, LockBoard
+
+logger = logging.getLogger(__name__)
+
+
+class StatusWriteQueue:
+    """Очередь записи статусов замков в БД
+
+    Изменения одного замка внутри окна объединяются: записывается только
+    последний статус и время. Накопленная пачка пишется одним bulk_update,
+    вместе с ней - битовые маски каналов изменившихся плат.
+    """
+
+    def __init__(self, db: DBExecutor, flush_interval: float = None, batch_size: int = None):
+        self.db = db
+        self.flush_interval = flush_interval or settings.LOCK_STATUS_FLUSH_INTERVAL
+        self.batch_size = batch_size or settings.LOCK_STATUS_BATCH_SIZE
+        self.pending = {}  # lock_id -> (status, changed_at)
+        self.pending_boards = {}  # board_id -> (open_channels, changed_at)
+        self._wakeup = asyncio.Event()
+
+        # Статистика
+        self.received = 0
+        self.coalesced = 0
+        self.written = 0
+        self.boards_written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self.pending)
+
+    def put(self, lock_id: int, status: int, changed_at):
+        self.received += 1
+        if lock_id in self.pending:
+            self.coalesced += 1
+        self.pending[lock_id] = (status, changed_at)
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def put_board(self, board_id: int, open_channels: int, changed_at):
+        self.pending_boards[board_id] = (open_channels, changed_at)
+
+    @staticmethod
+    def write(batch: dict, boards: dict = None):
+        with transaction.atomic():
+            if batch:
+                Lock.objects.bulk_update(
+                    [Lock(pk=lock_id, status=status, last_status_change=changed_at)
+                     for lock_id, (status, changed_at) in batch.items()],
+                    ['status', 'last_status_change'],
+                    batch_size=500
+                )
+            if boards:
+                LockBoard.objects.bulk_update(
+                    [LockBoard(pk=board_id, open_channels=open_channels, channel_state_at=changed_at)
+                     for board_id, (open_channels, changed_at) in boards.items()],
+                    ['open_channels', 'channel_state_at'],
+                    batch_size=500
+                )
+
+    async def flush(self):
+        if not self.pending and not self.pending_boards:
+            return
+
+        batch, self.pending = self.pending, {}
+        boards, self.pending_boards = self.pending_boards, {}
+        started = time.monotonic()
+        try:
+            await self.db.run_sync(DBExecutor.STATUS, self.write, batch, boards)
+        except Exception as e:
+            self.failed_flushes += 1
+            logger.error(f"Ошибка при записи {len(batch)} статусов замков и {len(boards)} плат: {e}")
+            # Возвращаем в очередь, не затирая более свежие изменения
+            for lock_id, value in batch.items():
+                self.pending.setdefault(lock_id, value)
+            for board_id, value in boards.items():
+                self.pending_boards.setdefault(board_id, value)
+            return
+
+        latency = time.monotonic() - started
+        self.flushes += 1
+        self.written += len(batch)
+        self.boards_written += len(boards)
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'received': self.received,
+            'coalesced': self.coalesced,
+            'written': self.written,
+            'boards_written': self.boards_written,
+            'flushes': self.flushes,
+            'failed_flushes': self.failed_flushes,
+            'last_flush_latency_ms': round(self.last_flush_latency * 1000, 2),
+            'max_flush_latency_ms': round(self.max_flush_latency * 1000, 2),
+        }